@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+from collections import deque
+
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+from acquisition.recording import RawRecorder, ReplayReceiver
+from acquisition.sequence import SequenceTracker
+from hardware.counter_packet import concatenate, decode_payloads
+from hardware.tdc_calibration import load_calibration
+from hardware.counter_receiver import SOURCES
+
+# Политики переполнения очереди подписчика
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+DEFAULT_SOURCE = "ethernet"
+
+# "thread" - захват и разбор в потоке GUI процесса, "process" - в отдельном процессе
+# с передачей разобранных пакетов через разделяемую память (см. acquisition.shm).
+# Выбирается переменной окружения SNV_ACQUISITION_MODE или ключом --acquisition-mode (main.py)
+ACQUISITION_MODES = ("thread", "process")
+ACQUISITION_MODE = os.environ.get("SNV_ACQUISITION_MODE", "thread")
+
+# Блоки отдаются подписчикам не чаще раза в интервал или по набору порога пакетов
+BATCH_INTERVAL_MS = 50
+BATCH_MAX_PACKETS = 4096
+# Очередь подписчика по умолчанию, блоков
+SUBSCRIBER_MAX_BATCHES = 64
+# Ёмкость кольца потребителя: вся очередь подписчика, забранная одним блоком
+CONSUMER_RING_CAPACITY = SUBSCRIBER_MAX_BATCHES * BATCH_MAX_PACKETS
+
+_buses = {}
+
+
+class Subscriber(QObject):
+    """Ограниченная очередь разобранных блоков для одного потребителя"""
+    batch_ready = pyqtSignal()
+
+    def __init__(self, name, max_batches=SUBSCRIBER_MAX_BATCHES, drop_policy=DROP_OLDEST):
+        super().__init__()
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Неизвестная политика переполнения: {drop_policy}")
+        self.name = name
+        self.max_batches = max_batches
+        self.drop_policy = drop_policy
+        self.dropped_batches = 0
+        self.dropped_packets = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def put(self, batch) -> bool:
+        """Кладёт блок в очередь (вызывается из потока захвата)"""
+        with self._lock:
+            # До вытеснения: при max_batches=1 очередь опустошается только на время замены блока
+            was_empty = not self._queue
+            if len(self._queue) >= self.max_batches:
+                if self.drop_policy == DROP_NEWEST:
+                    self._count_drop(batch)
+                    return False
+                self._count_drop(self._queue.popleft())
+            self._queue.append(batch)
+
+        # Одно уведомление на серию блоков: потребитель забирает всю очередь сразу
+        if was_empty:
+            self.batch_ready.emit()
+        return True
+
+    def take(self) -> list:
+        """Забирает все накопленные блоки"""
+        with self._lock:
+            batches = list(self._queue)
+            self._queue.clear()
+        return batches
+
+    def take_batch(self):
+        """Забирает всю очередь одним склеенным блоком (None, если очередь пуста)"""
+        batches = self.take()
+        return concatenate(batches) if batches else None
+
+    def _count_drop(self, batch):
+        self.dropped_batches += 1
+        self.dropped_packets += len(batch["package_id"])
+
+    def __len__(self):
+        return len(self._queue)
+
+
+class AcquisitionBus(QThread):
+    """Единственный захват пакетов счётчика, раздающий разобранные блоки подписчикам"""
+
+    def __init__(self, logger, source_name=DEFAULT_SOURCE, batch_interval_ms=BATCH_INTERVAL_MS,
+                 batch_max_packets=BATCH_MAX_PACKETS, receiver=None):
+        super().__init__()
+        self.logger = logger
+        self.source_name = source_name
+        self.receiver = receiver
+        self.recorder = None
+        self._recorder_lock = threading.Lock()
+        self.batch_interval_ms = batch_interval_ms
+        self.batch_max_packets = batch_max_packets
+        self.running = False
+        self.received_packets = 0
+        self.published_batches = 0
+        self.sequence = SequenceTracker()
+        # Таблица TDC загружается при каждом запуске; воспроизведение использует таблицу живого источника
+        self.calibration_device = DEFAULT_SOURCE if source_name == "replay" else source_name
+        self.calibration = None
+        self._pending = []
+        self._pending_packets = 0
+        self._last_flush = 0.0
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        """Подключает потребителя; захват запускается при первом подписчике"""
+        with self._lock:
+            if subscriber not in self._subscribers:
+                self._subscribers.append(subscriber)
+        if not self.isRunning():
+            self.running = True
+            self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Отключает потребителя; захват останавливается после ухода последнего"""
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            idle = not self._subscribers
+        if idle:
+            self.stop()
+
+    def status_text(self) -> str:
+        """Строка состояния непрерывности потока для интерфейса"""
+        return self.sequence.summary()
+
+    def run(self):
+        if self.receiver is None:
+            self.receiver = SOURCES[self.source_name]()
+        try:
+            device = self.receiver.open()
+            self.logger.log(f"Sniffer started on '{device}'", "Info", "AcquisitionBus")
+        except Exception as e:
+            self.logger.log(f"Sniffer error: {e}", "Error", "AcquisitionBus")
+            self.running = False
+            return
+
+        self.calibration = load_calibration(self.calibration_device)
+        if self.calibration is not None:
+            self.logger.log(f"Калибровка TDC '{self.calibration_device}' от {self.calibration.created}", "Info",
+                            "AcquisitionBus")
+        self.sequence.reset()
+        self._last_flush = time.monotonic()
+        while self.running:
+            try:
+                block = self.receiver.read_block()
+                if len(block):
+                    self.record(block)
+                    self.collect(decode_payloads(block, self.calibration))
+                self.flush()
+            except Exception as e:
+                self.logger.log(f"Неудачный парсинг пакетов: {e}", "Error", "AcquisitionBus")
+
+        self.flush(force=True)
+        self.stop_recording()
+        self.receiver.close()
+        self.logger.log("Sniffer stopped", "Info", "AcquisitionBus")
+
+    def start_recording(self, index_path, chunk_packets=1_000_000):
+        """Начинает запись сырого потока (см. RawRecorder)"""
+        recorder = RawRecorder(index_path, chunk_packets)
+        with self._recorder_lock:
+            previous, self.recorder = self.recorder, recorder
+        if previous:
+            previous.close()
+        self.logger.log(f"Запись потока в {recorder.index_path}", "Info", "AcquisitionBus")
+
+    def stop_recording(self):
+        with self._recorder_lock:
+            recorder, self.recorder = self.recorder, None
+            if recorder:
+                recorder.close()
+        if recorder:
+            self.logger.log(f"Записано пакетов: {recorder.packets}", "Info", "AcquisitionBus")
+
+    def record(self, block):
+        with self._recorder_lock:
+            if self.recorder:
+                self.recorder.write(block)
+
+    def collect(self, decoded: dict):
+        """Проверяет непрерывность package_id и копит валидные пакеты блока до следующей отправки"""
+        batch = self.sequence.accept(decoded)
+        count = len(batch["package_id"])
+        if not count:
+            return
+        self.received_packets += count
+        self._pending.append(batch)
+        self._pending_packets += count
+
+    def flush(self, force=False):
+        """Отправляет накопленное одним блоком по истечении интервала или по порогу размера"""
+        now = time.monotonic()
+        due = (now - self._last_flush) * 1000 >= self.batch_interval_ms
+        if not self._pending or not (force or due or self._pending_packets >= self.batch_max_packets):
+            return
+        batch = concatenate(self._pending)
+        self._pending = []
+        self._pending_packets = 0
+        self._last_flush = now
+        self.publish(batch)
+
+    def publish(self, batch: dict):
+        """Раздаёт блок всем подписчикам"""
+        self.published_batches += 1
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(batch)
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+
+def open_replay(logger, index_path, speed=1.0) -> AcquisitionBus:
+    """
+    Создаёт шину воспроизведения записи, заменяя предыдущую
+
+    Args:
+        index_path (str): индекс записи RawRecorder
+        speed (float): 1 - реальное время, N - в N раз быстрее, 0 - максимально быстро
+    """
+    previous = _buses.pop("replay", None)
+    if previous:
+        previous.stop()
+    _buses["replay"] = AcquisitionBus(logger, "replay", receiver=ReplayReceiver(index_path, speed))
+    return _buses["replay"]
+
+
+def set_acquisition_mode(mode):
+    """
+    Задаёт режим захвата для шин, создаваемых после вызова
+
+    Args:
+        mode (str): "thread" или "process"
+    """
+    global ACQUISITION_MODE
+    if mode not in ACQUISITION_MODES:
+        raise ValueError(f"Неизвестный режим захвата: {mode}")
+    ACQUISITION_MODE = mode
+
+
+def get_bus(logger, source_name=DEFAULT_SOURCE) -> AcquisitionBus:
+    """Возвращает общую для процесса шину захвата указанного источника"""
+    if source_name not in _buses:
+        if ACQUISITION_MODE not in ACQUISITION_MODES:
+            raise ValueError(f"Неизвестный режим захвата: {ACQUISITION_MODE}")
+        if ACQUISITION_MODE == "process":
+            from acquisition.shm import ProcessAcquisitionBus
+            _buses[source_name] = ProcessAcquisitionBus(logger, source_name)
+        else:
+            _buses[source_name] = AcquisitionBus(logger, source_name)
+    return _buses[source_name]
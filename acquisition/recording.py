@@ -0,0 +1,221 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from hardware.counter_packet import PAYLOAD_SIZE
+
+# Заголовок файла фрагмента: сигнатура, версия, размер записи
+CHUNK_MAGIC = b"SNVRAW01"
+CHUNK_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('record_size', '<u4')])
+FORMAT_VERSION = 1
+
+# Запись: время приёма (нс, time.time_ns) и сырая полезная нагрузка
+RECORD_DTYPE = np.dtype([('t_ns', '<u8'), ('payload', 'u1', (PAYLOAD_SIZE,))])
+
+INDEX_SUFFIX = ".snvidx"
+CHUNK_SUFFIX = ".snvraw"
+
+
+def _chunk_path(base, number):
+    return f"{base}_{number:05d}{CHUNK_SUFFIX}"
+
+
+def _base_path(index_path):
+    return index_path[:-len(INDEX_SUFFIX)] if index_path.endswith(INDEX_SUFFIX) else index_path
+
+
+class RawRecorder:
+    """
+    Запись сырого потока счётчика в компактные бинарные фрагменты с индексом
+
+    Фрагменты <base>_NNNNN.snvraw ротируются по числу пакетов, индекс <base>.snvidx (JSON)
+    перезаписывается при каждой ротации и закрытии. Число пакетов во фрагменте при чтении
+    определяется по размеру файла, поэтому оборванная запись остаётся читаемой.
+    """
+
+    def __init__(self, index_path, chunk_packets=1_000_000):
+        self.base = _base_path(index_path)
+        self.index_path = self.base + INDEX_SUFFIX
+        self.chunk_packets = chunk_packets
+        self.packets = 0
+        self.chunks = []
+        self._file = None
+        self._chunk_count = 0
+        self._open_chunk()
+
+    def _open_chunk(self):
+        path = _chunk_path(self.base, len(self.chunks))
+        self._file = open(path, "wb")
+        header = np.array([(CHUNK_MAGIC, FORMAT_VERSION, RECORD_DTYPE.itemsize)], dtype=CHUNK_HEADER_DTYPE)
+        header.tofile(self._file)
+        self._chunk_count = 0
+        self.chunks.append({"file": os.path.basename(path), "packets": 0, "first_t_ns": None, "last_t_ns": None})
+        self._write_index()
+
+    def _write_index(self):
+        index = {
+            "version": FORMAT_VERSION,
+            "record_size": RECORD_DTYPE.itemsize,
+            "payload_size": PAYLOAD_SIZE,
+            "packets": self.packets,
+            "chunks": self.chunks,
+        }
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(temp_path, self.index_path)
+
+    def write(self, block, t_ns=None):
+        """
+        Дописывает блок полезных нагрузок, принятых в момент t_ns
+
+        Args:
+            block: n подряд идущих 64-байтных полезных нагрузок
+            t_ns (int): время приёма, по умолчанию текущее
+        """
+        payloads = np.frombuffer(block, dtype=np.uint8) if not isinstance(block, np.ndarray) else block
+        payloads = payloads.reshape(-1, PAYLOAD_SIZE)
+        t_ns = time.time_ns() if t_ns is None else t_ns
+
+        while len(payloads):
+            if self._chunk_count >= self.chunk_packets:
+                self._close_chunk()
+                self._open_chunk()
+            part = payloads[:self.chunk_packets - self._chunk_count]
+            payloads = payloads[len(part):]
+
+            records = np.empty(len(part), dtype=RECORD_DTYPE)
+            records['t_ns'] = t_ns
+            records['payload'] = part
+            records.tofile(self._file)
+
+            chunk = self.chunks[-1]
+            if chunk["first_t_ns"] is None:
+                chunk["first_t_ns"] = t_ns
+            chunk["last_t_ns"] = t_ns
+            chunk["packets"] += len(part)
+            self._chunk_count += len(part)
+            self.packets += len(part)
+
+    def _close_chunk(self):
+        self._file.close()
+        self._file = None
+        self._write_index()
+
+    def close(self):
+        if self._file:
+            self._close_chunk()
+
+
+def map_records(path, start=0, count=None) -> np.memmap:
+    """
+    Отображает в память записи [start, start + count) файла фрагмента
+
+    Args:
+        count (int): число записей, None - до конца файла
+    """
+    available = (os.path.getsize(path) - CHUNK_HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize - start
+    count = available if count is None else min(count, available)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                     offset=CHUNK_HEADER_DTYPE.itemsize + start * RECORD_DTYPE.itemsize, shape=(count,))
+
+
+def load_chunks(index_path) -> list:
+    """
+    Отображает фрагменты записи в память
+
+    Returns:
+        list: массивы RECORD_DTYPE (np.memmap) в порядке записи
+    """
+    base = _base_path(index_path)
+    with open(base + INDEX_SUFFIX) as f:
+        index = json.load(f)
+    if index["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"Неподдерживаемый размер записи: {index['record_size']}")
+
+    directory = os.path.dirname(base)
+    chunks = []
+    for chunk in index["chunks"]:
+        path = os.path.join(directory, chunk["file"])
+        count = (os.path.getsize(path) - CHUNK_HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+        if count > 0:
+            chunks.append(map_records(path, 0, count))
+    return chunks
+
+
+class ReplayReceiver:
+    """
+    Источник пакетов из записи RawRecorder с тем же интерфейсом, что у живых приёмников
+
+    speed: 1 - реальное время, N - в N раз быстрее, 0 - максимально быстро.
+    """
+
+    def __init__(self, index_path, speed=1.0, max_packets=4096, timeout_ms=20, loop=False):
+        self.index_path = index_path
+        self.speed = speed
+        self.max_packets = max_packets
+        self.timeout_ms = timeout_ms
+        self.loop = loop
+        self.bad_packets = 0
+        self.finished = False
+        self.replayed = 0
+        self._chunks = []
+        self._chunk = 0
+        self._position = 0
+        self._t0 = None
+        self._wall0 = None
+
+    def open(self):
+        self._chunks = load_chunks(self.index_path)
+        self._rewind()
+        return f"replay://{os.path.basename(self.index_path)} x{self.speed or 'max'}"
+
+    def _rewind(self):
+        self._chunk = 0
+        self._position = 0
+        self.finished = False
+        self._t0 = int(self._chunks[0]['t_ns'][0]) if self._chunks else None
+        self._wall0 = time.monotonic_ns()
+
+    def read_block(self, max_packets=-1) -> np.ndarray:
+        """
+        Возвращает следующие пакеты записи, время приёма которых уже наступило
+
+        Returns:
+            np.ndarray: полезные нагрузки формы (n, 64); пустой массив, если пакетов пока нет
+        """
+        limit = self.max_packets if max_packets < 0 else min(max_packets, self.max_packets)
+
+        while self._chunk < len(self._chunks) and self._position >= len(self._chunks[self._chunk]):
+            self._chunk += 1
+            self._position = 0
+        if self._chunk >= len(self._chunks):
+            if self.loop and self._chunks:
+                self._rewind()
+            else:
+                self.finished = True
+                time.sleep(self.timeout_ms / 1000)
+                return np.empty((0, PAYLOAD_SIZE), dtype=np.uint8)
+
+        records = self._chunks[self._chunk]
+        stop = min(self._position + limit, len(records))
+
+        if self.speed:
+            # Время записи, соответствующее прошедшему реальному времени
+            due = self._t0 + (time.monotonic_ns() - self._wall0) * self.speed
+            times = records['t_ns'][self._position:stop]
+            stop = self._position + int(np.searchsorted(times, due, side='right'))
+            if stop == self._position:
+                wait_s = (int(times[0]) - due) / self.speed / 1e9
+                time.sleep(min(max(wait_s, 0), self.timeout_ms / 1000))
+                return np.empty((0, PAYLOAD_SIZE), dtype=np.uint8)
+
+        block = np.ascontiguousarray(records['payload'][self._position:stop])
+        self.replayed += len(block)
+        self._position = stop
+        return block
+
+    def close(self):
+        self._chunks = []
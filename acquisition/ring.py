@@ -0,0 +1,129 @@
+import numpy as np
+
+from hardware.counter_packet import TIMESTAMP_CHANNELS, TIMESTAMPS_PER_CHANNEL
+
+# Колонки кольцевого буфера: имя -> (тип, форма одной записи)
+COLUMNS = {
+    "package_id": (np.uint16, ()),
+    "flag": (np.uint8, ()),
+    "flag_pos": (np.uint8, ()),
+    "flag_neg": (np.uint8, ()),
+    "cnt_photon_1": (np.uint16, ()),
+    "cnt_photon_2": (np.uint16, ()),
+    "count_pos": (np.uint32, ()),
+    "count_neg": (np.uint16, ()),
+    "lost_before": (np.uint32, ()),
+    **{name: (dtype, (TIMESTAMPS_PER_CHANNEL,))
+       for channel in TIMESTAMP_CHANNELS
+       for name, dtype in ((channel, np.float64), (f"{channel}_valid", np.bool_))},
+}
+
+
+class PhotonRing:
+    """
+    Кольцевой буфер пакетов счётчика фиксированной ёмкости в виде набора NumPy колонок
+
+    Каждая запись хранится дважды (в позициях i и i + capacity), поэтому любое окно
+    из не более чем capacity последних записей - непрерывный срез, и выборки
+    возвращаются как представления без копирования. Записи нумеруются сквозным
+    порядковым номером seq; head - номер следующей записи.
+
+    Колонки и head могут размещаться во внешнем буфере (например, разделяемой памяти),
+    раскладка задаётся buffer_size/_layout.
+    """
+
+    def __init__(self, capacity=10000, buffer=None, readonly=False):
+        self.capacity = capacity
+        if buffer is None:
+            buffer = bytearray(self.buffer_size(capacity))
+        self._head, self.columns = self._layout(buffer, capacity)
+        if readonly:
+            for column in self.columns.values():
+                column.setflags(write=False)
+
+    @staticmethod
+    def _offsets(capacity):
+        # Ячейка head, затем колонки, каждая выровнена на 64 байта
+        offset = 64
+        offsets = {}
+        for name, (dtype, shape) in COLUMNS.items():
+            offsets[name] = offset
+            size = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64)) * 2 * capacity
+            offset += (size + 63) // 64 * 64
+        return offsets, offset
+
+    @classmethod
+    def buffer_size(cls, capacity) -> int:
+        """Размер буфера в байтах для заданной ёмкости"""
+        return cls._offsets(capacity)[1]
+
+    @classmethod
+    def _layout(cls, buffer, capacity):
+        offsets, _ = cls._offsets(capacity)
+        head = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=0)
+        columns = {name: np.ndarray((2 * capacity,) + shape, dtype=dtype, buffer=buffer, offset=offsets[name])
+                   for name, (dtype, shape) in COLUMNS.items()}
+        return head, columns
+
+    @property
+    def head(self) -> int:
+        return int(self._head[0])
+
+    @head.setter
+    def head(self, value):
+        self._head[0] = value
+
+    def clear(self):
+        self.head = 0
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    @property
+    def oldest(self) -> int:
+        """Порядковый номер самой старой хранящейся записи"""
+        return self.head - len(self)
+
+    def append(self, batch: dict, start=0):
+        """
+        Дописывает разобранный блок (см. decode_payloads), начиная со строки start
+
+        Returns:
+            int: порядковый номер первой дописанной записи
+        """
+        count = len(batch["package_id"]) - start
+        first = self.head
+        if count <= 0:
+            return first
+        # Из слишком длинного блока сохраняются только последние capacity записей
+        skip = max(0, count - self.capacity)
+        rows = slice(start + skip, start + count)
+        positions = (first + skip + np.arange(count - skip)) % self.capacity
+
+        for name, column in self.columns.items():
+            values = batch[name][rows]
+            column[positions] = values
+            column[positions + self.capacity] = values
+
+        # head обновляется после записи данных: читатель не видит недописанные строки
+        self.head = first + count
+        return first
+
+    def window(self, start, stop=None) -> dict:
+        """
+        Представления колонок для записей [start, stop) без копирования
+
+        Номера вне хранящегося диапазона обрезаются до него.
+        """
+        stop = self.head if stop is None else min(stop, self.head)
+        start = min(max(start, self.oldest), stop)
+        offset = start % self.capacity if self.capacity else 0
+        return {name: column[offset:offset + stop - start] for name, column in self.columns.items()}
+
+    def since(self, seq) -> dict:
+        """Все записи начиная с порядкового номера seq"""
+        return self.window(seq)
+
+    def last(self, count) -> dict:
+        """Последние count записей"""
+        return self.window(self.head - count)
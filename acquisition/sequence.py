@@ -0,0 +1,149 @@
+import numpy as np
+
+from hardware.counter_packet import select
+
+# Счётчик package_id 16-битный и переполняется
+ID_MODULO = 1 << 16
+HALF_MODULO = ID_MODULO // 2
+# Сколько последних номеров помнится для распознавания дубликатов и опоздавших пакетов
+SEEN_WINDOW = 1 << 14
+
+
+class SequenceTracker:
+    """
+    Контроль непрерывности package_id с учётом переполнения
+
+    Идентификаторы разворачиваются в сквозную 64-битную последовательность по
+    кратчайшему знаковому шагу. Пакет с номером больше максимального виденного -
+    новый (пропуск перед ним учитывается как потери). Меньший номер, которого ещё не было
+    среди последних SEEN_WINDOW, - пришедший не по порядку (учтённая ранее потеря снимается);
+    уже виденный, более старый или предшествующий началу отслеживания - дубликат.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.received = 0
+        self.lost = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.gaps = 0
+        self._lost_carry = 0
+        self._first = None
+        self._last = None
+        self._max = None
+        # Битовая карта принятых номеров из (_max - SEEN_WINDOW, _max], индекс - номер по модулю окна
+        self._seen = np.zeros(SEEN_WINDOW, dtype=bool)
+
+    @property
+    def expected(self) -> int:
+        """Сколько пакетов должно было прийти с начала отслеживания"""
+        return 0 if self._max is None else self._max - self._first + 1
+
+    @property
+    def loss_rate(self) -> float:
+        return self.lost / self.expected if self.expected else 0.0
+
+    def update(self, package_ids: np.ndarray) -> np.ndarray:
+        """
+        Учитывает блок идентификаторов в порядке прихода
+
+        Returns:
+            np.ndarray: для каждого пакета число потерянных непосредственно перед ним
+        """
+        ids = np.asarray(package_ids, dtype=np.int64)
+        count = len(ids)
+        lost_before = np.zeros(count, dtype=np.int64)
+        if not count:
+            return lost_before
+
+        # Разворачивание 16-битных номеров в сквозную последовательность
+        previous = ids[0] if self._last is None else self._last % ID_MODULO
+        steps = np.diff(ids, prepend=previous)
+        steps = (steps + HALF_MODULO) % ID_MODULO - HALF_MODULO
+        start = ids[0] if self._last is None else self._last
+        extended = start + np.cumsum(steps)
+
+        if self._max is None:
+            self._first = int(extended[0])
+            self._max = int(extended[0]) - 1
+
+        running_max = np.maximum.accumulate(np.concatenate(([self._max], extended)))
+        advance = extended - running_max[:-1]
+
+        forward = advance > 0
+        lost_before[forward] = advance[forward] - 1
+
+        # Не продвинувшие максимум: опоздавшие, если номер ещё не встречался (ни до блока, ни раньше в блоке)
+        previous_max = self._max
+        late = ~forward
+        first_index = np.unique(extended, return_index=True)[1]
+        repeated = np.ones(count, dtype=bool)
+        repeated[first_index] = False
+        in_window = (extended > previous_max - SEEN_WINDOW) & (extended <= previous_max)
+        seen = np.zeros(count, dtype=bool)
+        seen[in_window] = self._seen[extended[in_window] % SEEN_WINDOW]
+        # Старше окна или раньше начала отслеживания: неизвестно, учитывались ли как потери
+        stale = (extended <= previous_max - SEEN_WINDOW) | (extended < self._first)
+        recovered = late & ~repeated & ~seen & ~stale
+        reordered = int(np.count_nonzero(recovered))
+        duplicates = int(np.count_nonzero(late)) - reordered
+
+        self.received += count
+        self.lost += int(lost_before.sum()) - reordered
+        self.duplicated += duplicates
+        self.reordered += reordered
+        self.gaps += int(np.count_nonzero(lost_before))
+        self._last = int(extended[-1])
+        self._max = int(running_max[-1])
+        self._mark_seen(previous_max, extended)
+        return lost_before
+
+    def _mark_seen(self, previous_max, extended):
+        # Позиции номеров, впервые попавших в окно, очищаются, затем отмечаются принятые
+        fresh = min(self._max - previous_max, SEEN_WINDOW)
+        self._seen[np.arange(self._max - fresh + 1, self._max + 1) % SEEN_WINDOW] = False
+        kept = extended[extended > self._max - SEEN_WINDOW]
+        self._seen[kept % SEEN_WINDOW] = True
+
+    def accept(self, decoded: dict) -> dict:
+        """
+        Учитывает разобранный блок и оставляет в нём только валидные пакеты
+
+        В блок добавляется колонка lost_before - число потерянных пакетов перед каждой
+        строкой; потери перед отброшенными невалидными пакетами переносятся на следующий валидный.
+        """
+        lost = self.update(decoded["package_id"])
+        valid = decoded["flag_valid"] == 1
+        if np.all(valid):
+            lost[0] += self._lost_carry
+            self._lost_carry = 0
+            decoded["lost_before"] = lost
+            return decoded
+
+        total = np.cumsum(lost)
+        kept = np.flatnonzero(valid)
+        batch = select(decoded, valid)
+        batch["lost_before"] = np.diff(total[kept], prepend=-self._lost_carry)
+        self._lost_carry = int(total[-1] - total[kept[-1]] if len(kept) else self._lost_carry + total[-1])
+        return batch
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "duplicated": self.duplicated,
+            "reordered": self.reordered,
+            "gaps": self.gaps,
+            "loss_rate": self.loss_rate,
+        }
+
+    def summary(self) -> str:
+        return format_summary(self.stats())
+
+
+def format_summary(stats: dict) -> str:
+    """Краткая строка состояния для интерфейса"""
+    return (f"Пакеты: {stats['received']} | потеряно: {stats['lost']} ({100 * stats['loss_rate']:.2f}%) | "
+            f"дубли: {stats['duplicated']} | не по порядку: {stats['reordered']}")
@@ -0,0 +1,259 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+from acquisition.bus import AcquisitionBus, DEFAULT_SOURCE, BATCH_INTERVAL_MS
+from acquisition.recording import RawRecorder
+from acquisition.ring import PhotonRing
+from acquisition.sequence import SequenceTracker, format_summary
+from hardware.counter_packet import decode_payloads
+from hardware.counter_receiver import SOURCES
+from hardware.tdc_calibration import load_calibration
+
+# Ёмкость кольца в разделяемой памяти, пакетов
+SHARED_CAPACITY = 1 << 16
+# Максимум строк, дописываемых в кольцо за одно обновление head
+WRITE_CHUNK = 4096
+# Период опроса состояния процесса захвата, с
+STATUS_PERIOD_S = 1.0
+COMMAND_TIMEOUT_S = 5.0
+
+
+def _attach(name):
+    """Подключение к сегменту, созданному GUI процессом; удаляет его только создатель"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # До Python 3.13: resource_tracker общий с родителем, повторная регистрация безвредна
+        return shared_memory.SharedMemory(name=name)
+
+
+def _append_chunked(ring, batch):
+    count = len(batch["package_id"])
+    for start in range(0, count, WRITE_CHUNK):
+        ring.append({name: column[start:start + WRITE_CHUNK] for name, column in batch.items()})
+
+
+def acquisition_process(source_name, shm_name, capacity, conn, calibration_device=None):
+    """
+    Точка входа процесса захвата: приём, разбор и запись в кольцо разделяемой памяти
+
+    Команды по conn - кортежи (команда, аргумент): start, stop, status, record ((путь индекса,
+    пакетов во фрагменте) или None), quit. На каждую команду отправляется ответ-словарь состояния.
+
+    Args:
+        calibration_device (str): устройство, таблица TDC которого применяется (см. AcquisitionBus);
+                                  по умолчанию - источник захвата
+    """
+    calibration_device = calibration_device or source_name
+    shm = _attach(shm_name)
+    ring = PhotonRing(capacity, buffer=shm.buf)
+    receiver = SOURCES[source_name]()
+    sequence = SequenceTracker()
+    calibration = None
+    recorder = None
+    capturing = False
+    device = None
+    error = None
+
+    def status():
+        return {"capturing": capturing, "device": device, "error": error, "head": ring.head,
+                "bad_packets": receiver.bad_packets, "sequence": sequence.stats(),
+                "recording": recorder.index_path if recorder else None,
+                "calibration": calibration.created if calibration is not None else None}
+
+    try:
+        while True:
+            if conn.poll(0 if capturing else 0.1):
+                command, argument = conn.recv()
+                if command == "start" and not capturing:
+                    try:
+                        device = receiver.open()
+                        calibration = load_calibration(calibration_device)
+                        sequence.reset()
+                        error = None
+                        capturing = True
+                    except Exception as e:
+                        error = f"Sniffer error: {e}"
+                elif command == "stop" and capturing:
+                    capturing = False
+                    receiver.close()
+                elif command == "record":
+                    if recorder:
+                        recorder.close()
+                    recorder = RawRecorder(*argument) if argument else None
+                elif command == "quit":
+                    conn.send(status())
+                    break
+                conn.send(status())
+
+            if capturing:
+                try:
+                    block = receiver.read_block()
+                    if len(block):
+                        if recorder:
+                            recorder.write(block)
+                        _append_chunked(ring, sequence.accept(decode_payloads(block, calibration)))
+                except Exception as e:
+                    error = f"Неудачный парсинг пакетов: {e}"
+    finally:
+        if recorder:
+            recorder.close()
+        if capturing:
+            receiver.close()
+        del ring
+        shm.close()
+
+
+class ProcessAcquisitionBus(AcquisitionBus):
+    """
+    Шина, у которой захват и разбор выполняются в отдельном процессе
+
+    Процесс пишет разобранные пакеты в PhotonRing в разделяемой памяти, GUI процесс
+    читает его только на чтение и раздаёт копии новых строк подписчикам, поэтому
+    задержки отрисовки не приводят к потере пакетов на приёме.
+    """
+
+    def __init__(self, logger, source_name=DEFAULT_SOURCE, batch_interval_ms=BATCH_INTERVAL_MS,
+                 capacity=SHARED_CAPACITY):
+        super().__init__(logger, source_name, batch_interval_ms)
+        self.capacity = capacity
+        self.overrun_packets = 0
+        self.process = None
+        self._shm = None
+        self._ring = None
+        self._conn = None
+        self._command_lock = threading.Lock()
+        self._atexit_registered = False
+        self._status = {"sequence": SequenceTracker().stats()}
+
+    def _ensure_process(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        # Процесс завершился аварийно: его сегмент больше не нужен
+        self.shutdown()
+        self._shm = shared_memory.SharedMemory(create=True, size=PhotonRing.buffer_size(self.capacity))
+        self._ring = PhotonRing(self.capacity, buffer=self._shm.buf, readonly=True)
+        self._conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=acquisition_process,
+                                               args=(self.source_name, self._shm.name, self.capacity, child_conn,
+                                                     self.calibration_device),
+                                               daemon=True)
+        self.process.start()
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def command(self, command, argument=None) -> dict:
+        """Отправляет команду процессу захвата и возвращает его состояние"""
+        with self._command_lock:
+            self._conn.send((command, argument))
+            if not self._conn.poll(COMMAND_TIMEOUT_S):
+                raise TimeoutError(f"Процесс захвата не ответил на команду {command}")
+            self._status = self._conn.recv()
+        return self._status
+
+    def status_text(self) -> str:
+        """Непрерывность потока в процессе захвата и строки, перезаписанные в кольце до чтения"""
+        return f"{format_summary(self._status['sequence'])} | перезаписано в кольце: {self.overrun_packets}"
+
+    def start_recording(self, index_path, chunk_packets=1_000_000):
+        self._ensure_process()
+        self.command("record", (index_path, chunk_packets))
+        self.recorder = index_path
+        self.logger.log(f"Запись потока в {index_path}", "Info", "ProcessAcquisitionBus")
+
+    def stop_recording(self):
+        if self.recorder and self.process is not None:
+            self.command("record", None)
+        self.recorder = None
+
+    def run(self):
+        try:
+            self._ensure_process()
+            status = self.command("start")
+        except Exception as e:
+            self.logger.log(f"Sniffer error: {e}", "Error", "ProcessAcquisitionBus")
+            self.running = False
+            return
+        if status["error"]:
+            self.logger.log(status["error"], "Error", "ProcessAcquisitionBus")
+            self.running = False
+            return
+        self.logger.log(f"Sniffer started on '{status['device']}' (отдельный процесс)", "Info",
+                        "ProcessAcquisitionBus")
+        if status["calibration"] is not None:
+            self.logger.log(f"Калибровка TDC '{self.calibration_device}' от {status['calibration']}", "Info",
+                            "ProcessAcquisitionBus")
+
+        cursor = self._ring.head
+        last_status = time.monotonic()
+        while self.running:
+            time.sleep(self.batch_interval_ms / 1000)
+            cursor = self.read_new(cursor)
+
+            if time.monotonic() - last_status >= STATUS_PERIOD_S:
+                last_status = time.monotonic()
+                try:
+                    self.command("status")
+                except Exception as e:
+                    self.logger.log(f"Процесс захвата недоступен: {e}", "Error", "ProcessAcquisitionBus")
+                    break
+
+        try:
+            self.command("stop")
+        except Exception as e:
+            self.logger.log(f"Error stopping sniffer: {e}", "Error", "ProcessAcquisitionBus")
+        self.logger.log("Sniffer stopped", "Info", "ProcessAcquisitionBus")
+
+    def read_new(self, cursor) -> int:
+        """
+        Копирует строки кольца, появившиеся после cursor, и раздаёт их подписчикам
+
+        Returns:
+            int: новое положение курсора
+        """
+        head = self._ring.head
+        if head <= cursor:
+            return cursor
+        window = self._ring.window(cursor, head)
+        batch = {name: column.copy() for name, column in window.items()}
+        first = head - len(batch["package_id"])
+
+        # Строки, которые писатель мог перезаписать во время копирования, отбрасываются
+        safe = self._ring.head + WRITE_CHUNK - self.capacity
+        skip = max(0, safe - first)
+        self.overrun_packets += max(0, first - cursor) + min(skip, head - first)
+        if skip:
+            batch = {name: column[skip:] for name, column in batch.items()}
+
+        if len(batch["package_id"]):
+            self.received_packets += len(batch["package_id"])
+            self.publish(batch)
+        return head
+
+    def shutdown(self):
+        """Завершает процесс захвата и освобождает разделяемую память"""
+        if self.process is not None:
+            try:
+                if self.process.is_alive():
+                    self.command("quit")
+            except Exception:
+                pass
+            self.process.join(timeout=COMMAND_TIMEOUT_S)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._shm is not None:
+            self._ring = None
+            try:
+                self._shm.close()
+            except BufferError:
+                pass
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,225 @@
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from analysis.correlator import TimelineCorrelator, COUNTERS
+
+FORMAT_VERSION = 1
+ARCHIVE_SUFFIX = ".snvrun"
+HIST_SUFFIX = "_hist.bin"
+EVENTS_SUFFIXES = {"t1": "_t1.bin", "t2": "_t2.bin"}
+# Период сохранения контрольных точек гистограммы, с
+CHECKPOINT_PERIOD_S = 60
+
+HIST_DTYPE = np.dtype('<f8')
+# События на восстановленной шкале времени, пс (см. TimelineCorrelator.absolute_times)
+EVENT_DTYPE = np.dtype('<i8')
+
+
+def _base_path(path):
+    return path[:-len(ARCHIVE_SUFFIX)] if path.endswith(ARCHIVE_SUFFIX) else path
+
+
+class RunArchive:
+    """
+    Архив запуска g2 из дописываемых файлов: контрольные точки гистограммы и, по желанию, события
+
+    <base>.snvrun (JSON) - параметры гистограммы, время начала и счётчики каждой контрольной
+    точки; <base>_hist.bin - гистограммы контрольных точек подряд (float64, num_bins на точку);
+    <base>_t1.bin, <base>_t2.bin - абсолютные времена событий (int64, пс).
+    События дописываются для заданий, уже учтённых в гистограмме, и каждая контрольная точка
+    хранит число событий на момент своей гистограммы. Данные сбрасываются на диск до атомарной
+    перезаписи индекса, поэтому после сбоя архив открывается на последней полной контрольной
+    точке с событиями ровно до неё. Существующий архив продолжается только явно (resume)
+    коррелятором в состоянии его последней контрольной точки (см. restore_correlator),
+    иначе перезаписывается.
+
+    Запись на диск (и fsync контрольных точек) выполняется в собственном потоке архива,
+    поэтому write_events() и checkpoint() не блокируют поток GUI; ошибка записи
+    возвращается исключением при следующем вызове.
+    """
+
+    def __init__(self, path, correlator: TimelineCorrelator, events=False, resume=False,
+                 checkpoint_period_s=CHECKPOINT_PERIOD_S):
+        """
+        Args:
+            path (str): путь архива (.snvrun)
+            correlator (TimelineCorrelator): коррелятор запуска
+            events (bool): сохранять ли события
+            resume (bool): продолжить существующий архив; False - начать запуск заново, удалив старые данные
+        """
+        self.base = _base_path(path)
+        self.path = self.base + ARCHIVE_SUFFIX
+        self.checkpoint_period_s = checkpoint_period_s
+        self.events = events
+        self._last_checkpoint = time.monotonic()
+
+        if resume:
+            self.meta = read_meta(self.path)
+            if self.meta["num_bins"] != correlator.num_bins or self.meta["bin_width_ns"] != correlator.bin_width_ns:
+                raise ValueError("Параметры гистограммы не совпадают с архивом")
+            points = self.meta["checkpoints"]
+            state = {key: getattr(correlator, key) for key in COUNTERS}
+            if state != ({key: points[-1][key] for key in COUNTERS} if points else dict.fromkeys(COUNTERS, 0)):
+                raise ValueError("Состояние коррелятора не совпадает с последней контрольной точкой архива")
+            if points:
+                self.meta["events"] = dict(points[-1].get("events", self.meta["events"]))
+            # Хвосты, дописанные после последней контрольной точки (например, до сбоя), отбрасываются
+            self._truncate(HIST_SUFFIX, len(self.meta["checkpoints"]) * self.meta["num_bins"] * HIST_DTYPE.itemsize)
+            for name, suffix in EVENTS_SUFFIXES.items():
+                self._truncate(suffix, self.meta["events"][name] * EVENT_DTYPE.itemsize)
+        else:
+            for suffix in (HIST_SUFFIX, *EVENTS_SUFFIXES.values()):
+                self._truncate(suffix, 0)
+            self.meta = {
+                "version": FORMAT_VERSION,
+                "tau_max_ns": correlator.tau_max_ns,
+                "bin_width_ns": correlator.bin_width_ns,
+                "num_bins": correlator.num_bins,
+                "start_time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "checkpoints": [],
+                "events": {name: 0 for name in EVENTS_SUFFIXES},
+            }
+        self._hist_file = open(self.base + HIST_SUFFIX, "ab")
+        self._event_files = {name: open(self.base + suffix, "ab") for name, suffix in EVENTS_SUFFIXES.items()} \
+            if events else {}
+        self._write_meta()
+        self.error = None
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="RunArchive", daemon=True)
+        self._writer.start()
+
+    def _truncate(self, suffix, size):
+        path = self.base + suffix
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def _write_meta(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(temp_path, self.path)
+
+    def _write_loop(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                task()
+            except Exception as e:
+                self.error = e
+
+    def _submit(self, task):
+        if self.error is not None:
+            raise self.error
+        self._queue.put(task)
+
+    def write_events(self, job: dict):
+        """Дописывает события задания (см. TimelineCorrelator.stitch), гистограмма которого уже накоплена"""
+        if not self._event_files:
+            return
+        events = {name: np.asarray(job[name], dtype=EVENT_DTYPE) for name in self._event_files}
+
+        def write():
+            for name, file in self._event_files.items():
+                events[name].tofile(file)
+                self.meta["events"][name] += len(events[name])
+
+        self._submit(write)
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last_checkpoint >= self.checkpoint_period_s
+
+    def checkpoint(self, correlator: TimelineCorrelator):
+        """Дописывает текущую гистограмму и счётчики коррелятора (запись - в потоке архива)"""
+        hist = correlator.hist.astype(HIST_DTYPE)
+        point = {key: getattr(correlator, key) for key in COUNTERS}
+        point["time"] = datetime.datetime.now().isoformat(timespec="seconds")
+        point["timeline_ps"] = correlator.timeline_ps
+
+        def write():
+            hist.tofile(self._hist_file)
+            for file in (self._hist_file, *self._event_files.values()):
+                file.flush()
+                os.fsync(file.fileno())
+            point["events"] = dict(self.meta["events"])
+            self.meta["checkpoints"].append(point)
+            self._write_meta()
+
+        self._submit(write)
+        self._last_checkpoint = time.monotonic()
+
+    def close(self, correlator=None):
+        """Сохраняет последнюю контрольную точку, дожидается записи и закрывает файлы"""
+        try:
+            if correlator is not None:
+                self.checkpoint(correlator)
+        finally:
+            self._queue.put(None)
+            self._writer.join()
+            for file in (self._hist_file, *self._event_files.values()):
+                file.close()
+            self._event_files = {}
+        if self.error is not None:
+            raise self.error
+
+
+def read_meta(path) -> dict:
+    with open(_base_path(path) + ARCHIVE_SUFFIX) as f:
+        meta = json.load(f)
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия архива: {meta['version']}")
+    return meta
+
+
+def load_archive(path) -> dict:
+    """
+    Отображает архив запуска в память без чтения данных
+
+    Returns:
+        dict: meta, histograms (np.memmap формы (контрольные точки, num_bins)),
+              t1/t2 (np.memmap событий или None)
+    """
+    base = _base_path(path)
+    meta = read_meta(path)
+
+    def mapped(file_path, dtype, count, shape):
+        if not count or not os.path.exists(file_path):
+            return None
+        return np.memmap(file_path, dtype=dtype, mode="r", shape=shape)
+
+    # Учитываются только контрольные точки, записанные в индекс
+    row_size = meta["num_bins"] * HIST_DTYPE.itemsize
+    size = os.path.getsize(base + HIST_SUFFIX) if os.path.exists(base + HIST_SUFFIX) else 0
+    points = min(len(meta["checkpoints"]), size // row_size)
+    meta["checkpoints"] = meta["checkpoints"][:points]
+
+    archive = {"meta": meta,
+               "histograms": mapped(base + HIST_SUFFIX, HIST_DTYPE, points, (points, meta["num_bins"]))}
+    # События - до последней учтённой контрольной точки, как и гистограмма
+    events = meta["checkpoints"][-1].get("events", meta["events"]) if points else dict.fromkeys(EVENTS_SUFFIXES, 0)
+    meta["events"] = dict(events)
+    for name, suffix in EVENTS_SUFFIXES.items():
+        count = meta["events"][name]
+        archive[name] = mapped(base + suffix, EVENT_DTYPE, count, (count,))
+    return archive
+
+
+def restore_correlator(archive: dict) -> TimelineCorrelator:
+    """Коррелятор в состоянии последней контрольной точки архива для продолжения накопления"""
+    meta = archive["meta"]
+    correlator = TimelineCorrelator(meta["tau_max_ns"] - meta["bin_width_ns"] / 2, meta["bin_width_ns"])
+    if correlator.num_bins != meta["num_bins"]:
+        raise ValueError("Не удалось восстановить параметры гистограммы архива")
+    if meta["checkpoints"]:
+        point = meta["checkpoints"][-1]
+        correlator.restore(archive["histograms"][-1], {key: point[key] for key in COUNTERS}, point["timeline_ps"])
+    return correlator
@@ -0,0 +1,216 @@
+import itertools
+
+import numpy as np
+
+from analysis.correlator import CHANNELS, TimelineCorrelator
+
+TICKS_PER_NS = TimelineCorrelator.TICKS_PER_NS
+
+
+def job_streams(job: dict, channels=len(CHANNELS)):
+    """
+    Потоки событий задания TimelineCorrelator по каналам
+
+    Returns:
+        tuple: (новые события, хвосты предыдущих блоков) - списки массивов int64 в пикосекундах
+    """
+    return ([job[f"t{i}"] for i in range(1, channels + 1)],
+            [job[f"tail{i}"] for i in range(1, channels + 1)])
+
+
+def window_openers(beyond: np.ndarray, first: int) -> np.ndarray:
+    """
+    События, открывающие окна жадного разбиения потока: first, beyond[first], beyond[beyond[first]], ...
+
+    Цепочка строится удвоением переходов - O(log n) векторных шагов вместо цикла по окнам.
+
+    Args:
+        beyond (np.ndarray): для каждого события - индекс первого события за пределами его окна
+        first (int): индекс события, открывающего первое окно
+
+    Returns:
+        np.ndarray: индексы событий по возрастанию
+    """
+    count = len(beyond)
+    reached = np.zeros(count + 1, dtype=bool)
+    if first >= count:
+        return np.empty(0, dtype=np.int64)
+    # Индекс count - сток, переход из него ведёт в него же
+    step = np.append(beyond, count)
+    reached[first] = True
+    while True:
+        targets = step[reached]
+        if reached[targets].all():
+            break
+        reached[targets] = True
+        step = step[step]
+    return np.flatnonzero(reached[:count])
+
+
+class CoincidenceCounter:
+    """
+    Гистограммы авто- и взаимных корреляций и k-кратные совпадения N каналов за один проход
+
+    Каналы - потоки t{i}/tail{i} заданий TimelineCorrelator, то есть каналы декодера CHANNELS
+    (список задаётся в counter_packet.TIMESTAMP_CHANNELS); channels меньше их числа
+    ограничивает расчёт первыми каналами.
+
+    События всех каналов (новые и хвосты предыдущих блоков) сливаются в один отсортированный
+    поток. Пары для гистограмм перебираются по нему один раз: партнёры каждого события -
+    более ранние события в пределах tau_max_ns, поэтому каждая пара встречается ровно
+    однажды, а нужные гистограммы выбираются по каналам пары.
+
+    Совпадения считаются по окнам: поток жадно разбивается на неперекрывающиеся окна
+    [t, t + window_ns] (граница включается), каждое открывает первое событие, не попавшее
+    в предыдущее окно. Кратность окна - число различных каналов в нём, и окно учитывается
+    один раз: тройное совпадение добавляет единицу к числу совпадений кратности не меньше 2
+    и единицу к числу кратности не меньше 3, группа - единицу, если в окне есть все её каналы.
+    Последнее окно задания может продолжиться в следующем и учитывается вместе с ним.
+
+    Гистограмма пары (a, b) - разности t_a - t_b с бинами, центрированными на кратных
+    bin_width_ns задержках; для автокорреляции (a, a) учитываются обе разности пары различных
+    событий. tau_max_ns не должно превышать, а window_ns - достигать tau_max_ns коррелятора,
+    формирующего задания (хвосты короче не хранятся).
+
+    histogram() хранит начало незакрытого окна совпадений, поэтому задания передаются ей
+    последовательно в порядке take() (она может выполняться в рабочем потоке); accumulate() -
+    в потоке GUI.
+    """
+
+    def __init__(self, channels=len(CHANNELS), pairs=None, tau_max_ns=100, bin_width_ns=0.1, window_ns=1.0,
+                 groups=None):
+        """
+        Args:
+            channels (int): число каналов (первые каналы CHANNELS)
+            pairs (list): пары каналов (a, b) с нуля для гистограмм; None - все авто- и взаимные, [] - без гистограмм
+            tau_max_ns (float): половина диапазона гистограмм, нс
+            bin_width_ns (float): ширина бина, нс
+            window_ns (float): окно совпадений, нс
+            groups (list): наборы каналов, совпадения которых считаются отдельно (например, с каналом-герольдом)
+        """
+        self.channels = channels
+        self.pairs = [tuple(pair) for pair in pairs] if pairs is not None else \
+            list(itertools.combinations_with_replacement(range(channels), 2))
+        self.groups = [tuple(group) for group in groups or []]
+        self.bin_width_ns = bin_width_ns
+        self.half_bins = int(round(tau_max_ns / bin_width_ns))
+        self.num_bins = 2 * self.half_bins + 1
+        self.tau_max_ns = (self.half_bins + 0.5) * bin_width_ns
+        self.bins = np.linspace(-self.tau_max_ns, self.tau_max_ns, self.num_bins + 1)
+        self.window_ns = window_ns
+        # Номер гистограммы для упорядоченной пары каналов (-1 - пара не запрошена)
+        self._pair_index = np.full((channels, channels), -1, dtype=np.int64)
+        for index, (a, b) in enumerate(self.pairs):
+            self._pair_index[a, b] = index
+        self.reset()
+
+    def reset(self):
+        self.hist = np.zeros((len(self.pairs), self.num_bins))
+        # Элемент k - 1: число совпадений кратности не меньше k
+        self.coincidences = np.zeros(self.channels, dtype=np.int64)
+        self.group_coincidences = np.zeros(len(self.groups), dtype=np.int64)
+        self.singles = np.zeros(self.channels, dtype=np.int64)
+        self.duration_ns = 0
+        # Начало последнего окна совпадений, которое может продолжиться в следующем задании, пс
+        self._open_window_ps = None
+
+    def histogram(self, job: dict) -> dict:
+        """
+        Гистограммы и совпадения задания TimelineCorrelator (пары с хотя бы одним новым событием
+        и окна совпадений, закрытые к концу задания)
+
+        Returns:
+            dict: частичные hist, coincidences, group_coincidences, singles и duration_ns для accumulate()
+        """
+        streams, tails = job_streams(job, self.channels)
+        times = np.concatenate(tails + streams)
+        channel = np.concatenate([np.full(len(t), c, dtype=np.int64) for c, t in enumerate(tails + streams)])
+        channel %= self.channels
+        new = np.arange(len(times)) >= sum(len(tail) for tail in tails)
+        order = np.argsort(times, kind='stable')
+        times, channel, new = times[order], channel[order], new[order]
+
+        partial = {
+            "hist": self._pair_histograms(times, channel, new),
+            "singles": np.array([len(t) for t in streams], dtype=np.int64),
+            "duration_ns": job["duration_ns"],
+        }
+        partial.update(self._coincidences(times, channel, new))
+        return partial
+
+    def _pair_histograms(self, times, channel, new) -> np.ndarray:
+        if not self.pairs:
+            return np.zeros((0, self.num_bins))
+        window = self.tau_max_ns * TICKS_PER_NS
+        # Партнёры события i - события lo[i]..i-1 слитого потока
+        lo = np.searchsorted(times, times - window, side='right')
+        counts = np.arange(len(times)) - lo
+        total = int(counts.sum())
+        hist = np.zeros((len(self.pairs), self.num_bins))
+        if not total:
+            return hist
+        owners = np.repeat(np.arange(len(times)), counts)
+        partners = lo[owners] + np.arange(total) - (np.cumsum(counts) - counts)[owners]
+        keep = new[owners] | new[partners]
+        owners, partners = owners[keep], partners[keep]
+
+        delta = (times[owners] - times[partners]) / TICKS_PER_NS
+        forward = self._pair_index[channel[owners], channel[partners]]
+        backward = self._pair_index[channel[partners], channel[owners]]
+        index = np.concatenate((forward, backward))
+        delta = np.concatenate((delta, -delta))
+        selected = index >= 0
+        bins = np.floor((delta[selected] + self.tau_max_ns) / self.bin_width_ns).astype(np.int64)
+        inside = (bins >= 0) & (bins < self.num_bins)
+        flat = index[selected][inside] * self.num_bins + bins[inside]
+        return np.bincount(flat, minlength=hist.size).reshape(hist.shape).astype(np.float64)
+
+    def _coincidences(self, times, channel, new) -> dict:
+        window = int(round(self.window_ns * TICKS_PER_NS))
+        # Разбиение продолжается с незакрытого окна (оно в хвостах) или с первого нового события
+        if self._open_window_ps is None:
+            first = int(np.argmax(new)) if new.any() else len(times)
+        else:
+            first = int(np.searchsorted(times, self._open_window_ps))
+        beyond = np.searchsorted(times, times + window, side='right')
+        openers = window_openers(beyond, first)
+        if len(openers):
+            self._open_window_ps = int(times[openers[-1]])
+            openers = openers[:-1]
+        # present[c, w]: в окне w есть событие канала c
+        present = np.empty((self.channels, len(openers)), dtype=bool)
+        for c in range(self.channels):
+            hits = np.concatenate(([0], np.cumsum(channel == c)))
+            present[c] = hits[beyond[openers]] > hits[openers]
+        fold = np.bincount(present.sum(axis=0), minlength=self.channels + 1)[1:]
+        groups = np.array([np.count_nonzero(present[list(group)].all(axis=0)) for group in self.groups],
+                          dtype=np.int64)
+        return {"coincidences": np.cumsum(fold[::-1])[::-1], "group_coincidences": groups}
+
+    def accumulate(self, partial: dict):
+        self.hist += partial["hist"]
+        self.coincidences += partial["coincidences"]
+        self.group_coincidences += partial["group_coincidences"]
+        self.singles += partial["singles"]
+        self.duration_ns += partial["duration_ns"]
+
+    def rates(self) -> dict:
+        """
+        Частоты совпадений, 1/с
+
+        Returns:
+            dict: {k: частота совпадений кратности не меньше k} для k >= 2 и {группа: частота};
+                  пустой, пока время накопления неизвестно
+        """
+        if self.duration_ns <= 0:
+            return {}
+        seconds = self.duration_ns / 1e9
+        rates = {k: self.coincidences[k - 1] / seconds for k in range(2, self.channels + 1)}
+        rates.update({group: count / seconds for group, count in zip(self.groups, self.group_coincidences)})
+        return rates
+
+    def correlation(self, a, b) -> np.ndarray:
+        """Накопленная гистограмма пары каналов (a, b)"""
+        if self._pair_index[a, b] < 0:
+            raise KeyError(f"Гистограмма пары каналов {(a, b)} не накапливается")
+        return self.hist[self._pair_index[a, b]]
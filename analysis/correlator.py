@@ -0,0 +1,339 @@
+import numpy as np
+from fast_histogram import histogram1d
+
+from hardware.counter_packet import TIMESTAMP_CHANNELS, TIMESTAMP_PERIOD_NS, FINE_STEP_NS
+
+# Каналы меток декодера; в заданиях TimelineCorrelator канал i (с 1) - ключи t{i}, tail{i}, singles{i}
+CHANNELS = TIMESTAMP_CHANNELS
+# Колонки кольцевого буфера, нужные для расчёта корреляций
+TIMESTAMP_COLUMNS = tuple(name for channel in CHANNELS for name in (channel, f"{channel}_valid"))
+
+# Накопление ведётся с шагом разрешения меток в широком диапазоне,
+# более грубые представления получаются суммированием соседних бинов (см. view)
+NATIVE_BIN_NS = 0.1
+NATIVE_TAU_MAX_NS = 500
+# Наименьшее окно оценки g2(0): шаги точной шкалы 0.18 нс, округлённые до 0.1 нс, неравномерно
+# заполняют бины и повторяются через 5 шагов (0.9 нс), поэтому окно должно охватывать весь период
+G2_ZERO_MIN_HALF_WIDTH_NS = 2.5 * FINE_STEP_NS
+
+# Счётчики задания, накапливаемые вместе с гистограммой: пакеты, одиночные события каналов
+# (действительные метки) и время накопления, нс
+COUNTERS = ("packets", *(f"singles{i}" for i in range(1, len(CHANNELS) + 1)), "duration_ns")
+
+
+def job_counters(job: dict) -> dict:
+    """Скалярные счётчики задания для передачи в accumulate() без массивов меток"""
+    return {key: job.get(key, 0) for key in COUNTERS}
+
+
+def within_packet_deltas(tp1, tp1_valid, tp2, tp2_valid) -> np.ndarray:
+    """
+    Попарные разности TP1 - TP2 внутри каждого пакета по действительным меткам
+
+    Args:
+        tp1, tp2 (np.ndarray): метки формы (n, 6), нс
+        tp1_valid, tp2_valid (np.ndarray): маски действительных меток той же формы
+
+    Returns:
+        np.ndarray: одномерный массив разностей, нс
+    """
+    pairs = tp1_valid[:, :, None] & tp2_valid[:, None, :]
+    return (tp1[:, :, None] - tp2[:, None, :])[pairs]
+
+
+class IncrementalCorrelator:
+    """
+    Накопление гистограммы g2, в которой каждый пакет учитывается ровно один раз
+
+    Курсор хранит порядковый номер следующего необработанного пакета кольцевого буфера,
+    поэтому стоимость обновления зависит только от объёма новых данных.
+
+    Бины центрированы на кратных bin_width_ns задержках (нулевая задержка - центр
+    среднего бина), tau_max_ns - внешняя граница крайних бинов.
+    """
+
+    def __init__(self, tau_max_ns=NATIVE_TAU_MAX_NS, bin_width_ns=NATIVE_BIN_NS):
+        self.bin_width_ns = bin_width_ns
+        self.half_bins = int(round(tau_max_ns / bin_width_ns))
+        self.num_bins = 2 * self.half_bins + 1
+        self.tau_max_ns = (self.half_bins + 0.5) * bin_width_ns
+        self.bins = np.linspace(-self.tau_max_ns, self.tau_max_ns, self.num_bins + 1)
+        self.reset()
+
+    def reset(self):
+        self.hist = np.zeros(self.num_bins)
+        self.cursor = None
+        self.skipped_packets = 0
+        for key in COUNTERS:
+            setattr(self, key, 0)
+
+    def take(self, ring) -> dict:
+        """
+        Забирает копию ещё не обработанных пакетов кольцевого буфера и сдвигает курсор
+
+        Пакеты, вытесненные из буфера до обработки, учитываются в skipped_packets.
+        """
+        if self.cursor is None:
+            self.cursor = ring.oldest
+        if self.cursor < ring.oldest:
+            self.skipped_packets += ring.oldest - self.cursor
+        window = ring.since(self.cursor)
+        self.cursor = ring.head
+        data = {name: window[name].copy() for name in TIMESTAMP_COLUMNS}
+        data["packets"] = len(window["tp1"])
+        data["singles1"] = int(np.count_nonzero(data["tp1_valid"]))
+        data["singles2"] = int(np.count_nonzero(data["tp2_valid"]))
+        return data
+
+    def histogram(self, data: dict) -> np.ndarray:
+        """Гистограмма разностей для блока пакетов (можно вызывать из рабочего потока)"""
+        deltas = within_packet_deltas(*(data[name] for name in TIMESTAMP_COLUMNS))
+        valid = deltas[(deltas > -self.tau_max_ns) & (deltas < self.tau_max_ns)]
+        return histogram1d(valid, bins=self.num_bins, range=(-self.tau_max_ns, self.tau_max_ns))
+
+    def accumulate(self, partial: np.ndarray, counters=None):
+        """
+        Добавляет частичную гистограмму и счётчики её задания (см. job_counters)
+        """
+        self.hist += partial
+        for key, value in (counters or {}).items():
+            setattr(self, key, getattr(self, key) + value)
+
+    def accidentals_per_ns(self):
+        """
+        Ожидаемое число случайных совпадений на 1 нс задержки для некоррелированных потоков
+
+        N1 * N2 / T по одиночным событиям, попавшим в гистограмму; None, пока время накопления неизвестно.
+        """
+        if self.duration_ns <= 0 or not self.singles1 or not self.singles2:
+            return None
+        return self.singles1 * self.singles2 / self.duration_ns
+
+    def normalized(self, edges, counts):
+        """
+        Нормированная g2 и её пуассоновская погрешность для представления (edges, counts)
+
+        Returns:
+            tuple: (g2, погрешность) или (None, None), если нормировка пока невозможна
+        """
+        accidentals = self.accidentals_per_ns()
+        if accidentals is None:
+            return None, None
+        expected = accidentals * np.diff(edges)
+        return counts / expected, np.sqrt(counts) / expected
+
+    def g2_zero(self, half_width_ns=G2_ZERO_MIN_HALF_WIDTH_NS):
+        """
+        Оценка g2(0) по бинам с центрами в пределах ±half_width_ns (не уже G2_ZERO_MIN_HALF_WIDTH_NS)
+
+        Returns:
+            tuple: (g2(0), погрешность) или (None, None)
+        """
+        accidentals = self.accidentals_per_ns()
+        if accidentals is None:
+            return None, None
+        half_width_ns = max(half_width_ns, G2_ZERO_MIN_HALF_WIDTH_NS)
+        half = int(half_width_ns / self.bin_width_ns + 1e-9)
+        counts = self.hist[self.half_bins - half:self.half_bins + half + 1].sum()
+        expected = accidentals * (2 * half + 1) * self.bin_width_ns
+        return counts / expected, np.sqrt(counts) / expected
+
+    def view(self, bin_width_ns, tau_max_ns):
+        """
+        Представление накопленной гистограммы с другим шагом и диапазоном без потери данных
+
+        Шаг округляется до целого числа исходных бинов, диапазон ограничивается накопленным.
+        Центральный исходный бин (tau = 0) попадает в средний бин представления, по сторонам
+        от него - одинаковое число целых бинов; не вошедшие исходные бины по краям отбрасываются.
+        При чётном укрупнении середина центрального бина смещена на половину исходного бина.
+        Стоимость - один срез и одно суммирование по соседним бинам.
+
+        Returns:
+            tuple: (границы бинов, отсчёты)
+        """
+        factor = min(max(1, int(round(bin_width_ns / self.bin_width_ns))), self.num_bins)
+        half = min(self.half_bins, int(round(tau_max_ns / self.bin_width_ns)))
+        side = max(0, (half - factor // 2) // factor)
+        groups = 2 * side + 1
+        start = self.half_bins - (factor - 1) // 2 - side * factor
+        counts = self.hist[start:start + groups * factor].reshape(groups, factor).sum(axis=1)
+        edges = self.bins[start] + np.arange(groups + 1) * factor * self.bin_width_ns
+        return edges, counts
+
+
+def coincidence_pairs(t1: np.ndarray, t2: np.ndarray, tau_max_ns):
+    """
+    Индексы всех пар с t1 - t2 в интервале (-tau_max, tau_max) для отсортированных потоков (в единицах потоков)
+
+    Для каждого события t1 окно партнёров в t2 находится двоичным поиском, после чего
+    пары разворачиваются без попарного перебора: O((n + m) log m + число пар).
+
+    Returns:
+        tuple: (индексы в t1, индексы в t2)
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(t1) or not len(t2):
+        return empty, empty
+    lo = np.searchsorted(t2, t1 - tau_max_ns, side='right')
+    hi = np.searchsorted(t2, t1 + tau_max_ns, side='left')
+    counts = hi - lo
+    total = int(counts.sum())
+    if not total:
+        return empty, empty
+    owners = np.repeat(np.arange(len(t1)), counts)
+    # Индекс партнёра: начало окна владельца плюс номер пары внутри окна
+    starts = np.cumsum(counts) - counts
+    partners = lo[owners] + np.arange(total) - starts[owners]
+    return owners, partners
+
+
+def coincidence_deltas(t1: np.ndarray, t2: np.ndarray, tau_max_ns) -> np.ndarray:
+    """Все разности t1 - t2 в интервале (-tau_max, tau_max) для отсортированных потоков (см. coincidence_pairs)"""
+    owners, partners = coincidence_pairs(t1, t2, tau_max_ns)
+    return t1[owners] - t2[partners]
+
+
+class TimelineCorrelator(IncrementalCorrelator):
+    """
+    Корреляции TP1/TP2 на восстановленной непрерывной шкале времени, включая пары соседних пакетов
+
+    Метки каждого пакета переводятся в абсолютное время: опорные метки пакетов разворачиваются
+    с периодом переполнения грубого счётчика в порядке прихода, а пропуск package_id
+    (lost_before) начинает новый сегмент, отделённый от предыдущего интервалом SEGMENT_GUARD_NS,
+    чтобы события по разные стороны потери не коррелировались. Соседние пакеты
+    предполагаются разнесёнными менее чем на половину периода переполнения.
+
+    Сшивка шкалы и хвосты событий выполняются в take() (последовательно, в потоке GUI);
+    histogram() не имеет состояния и может выполняться в рабочем потоке.
+    """
+    SEGMENT_GUARD_NS = 1e9
+    # Шкала хранится в целых пикосекундах, чтобы разности не теряли точность на больших временах
+    TICKS_PER_NS = 1000
+
+    def reset(self):
+        super().reset()
+        self._last_reference = None
+        self._last_absolute = 0
+        self._tails = [np.empty(0, dtype=np.int64) for _ in CHANNELS]
+
+    @property
+    def timeline_ps(self) -> int:
+        """Положение последнего пакета на восстановленной шкале времени, пс"""
+        return self._last_absolute
+
+    def restore(self, hist, counters: dict, timeline_ps=0):
+        """
+        Продолжение накопления с сохранённого состояния (см. analysis.archive)
+
+        Новые пакеты начнут отдельный сегмент шкалы после timeline_ps.
+        """
+        self.reset()
+        self.hist[:] = hist
+        self.accumulate(0, counters)
+        self._last_absolute = int(timeline_ps)
+
+    def absolute_times(self, data: dict):
+        """
+        Абсолютные времена действительных меток блока
+
+        Returns:
+            tuple: (t1, t2, ...) - по одному одномерному несортированному массиву int64 в пикосекундах
+                   на канал CHANNELS, и длительность блока на шкале без разрывов между сегментами, пс
+        """
+        stamps = [np.rint(data[channel] * self.TICKS_PER_NS).astype(np.int64) for channel in CHANNELS]
+        masks = [data[f"{channel}_valid"] for channel in CHANNELS]
+        count = len(stamps[0])
+        period = int(TIMESTAMP_PERIOD_NS * self.TICKS_PER_NS)
+
+        # Опорная метка пакета - минимальная действительная; пустые пакеты наследуют предыдущую
+        valid = np.concatenate(masks, axis=1)
+        has_stamps = valid.any(axis=1)
+        first = np.where(valid, np.concatenate(stamps, axis=1), np.iinfo(np.int64).max).min(axis=1)
+        filled = np.maximum.accumulate(np.where(has_stamps, np.arange(count), -1))
+        previous = self._last_reference
+        if previous is None:
+            previous = first[has_stamps][0] if np.any(has_stamps) else 0
+        reference = np.where(filled >= 0, first[np.maximum(filled, 0)], previous)
+
+        steps = np.diff(reference, prepend=previous)
+        steps = (steps + period // 2) % period - period // 2
+        breaks = data["lost_before"] > 0
+        if self._last_reference is None:
+            breaks = breaks.copy()
+            breaks[:1] = True
+        steps[breaks] = int(self.SEGMENT_GUARD_NS * self.TICKS_PER_NS)
+        duration = int(steps[~breaks].sum())
+        absolute = self._last_absolute + np.cumsum(steps)
+
+        if count:
+            self._last_reference = int(reference[-1])
+            self._last_absolute = int(absolute[-1])
+
+        def unwrap(tp, valid):
+            offsets = (tp - reference[:, None] + period // 2) % period - period // 2
+            return (absolute[:, None] + offsets)[valid]
+
+        return (*(unwrap(tp, mask) for tp, mask in zip(stamps, masks)), duration)
+
+    def take(self, ring) -> dict:
+        """
+        Забирает новые пакеты, переводит их метки на общую шкалу и прикладывает хвосты
+        предыдущего блока, с которыми новые события ещё могут образовать пары
+        """
+        if self.cursor is None:
+            self.cursor = ring.oldest
+        if self.cursor < ring.oldest:
+            self.skipped_packets += ring.oldest - self.cursor
+            # Пропущенные пакеты разрывают шкалу
+            self._last_reference = None
+        window = ring.since(self.cursor)
+        self.cursor = ring.head
+        return self.stitch(window)
+
+    def stitch(self, window: dict) -> dict:
+        """
+        Переводит очередной блок пакетов (колонки TIMESTAMP_COLUMNS и lost_before) на общую шкалу
+
+        Returns:
+            dict: задание для histogram() - новые события и хвосты предыдущих блоков
+        """
+        *times, duration = self.absolute_times(window)
+        job = {"packets": len(window[CHANNELS[0]]), "duration_ns": duration / self.TICKS_PER_NS}
+        for i, (t, tail) in enumerate(zip(times, self._tails), 1):
+            job.update({f"t{i}": t, f"tail{i}": tail, f"singles{i}": len(t)})
+
+        events = np.concatenate(times)
+        if len(events):
+            horizon = events.max() - self.tau_max_ns * self.TICKS_PER_NS
+            self._tails = [np.concatenate((tail, t)) for tail, t in zip(self._tails, times)]
+            self._tails = [tail[tail > horizon] for tail in self._tails]
+        return job
+
+    @staticmethod
+    def merge_jobs(jobs: list) -> dict:
+        """
+        Объединяет последовательные задания take()/stitch() в одно с той же суммарной гистограммой
+
+        Хвосты более поздних заданий состоят из событий предыдущих, поэтому достаточно
+        хвостов первого задания.
+        """
+        if len(jobs) == 1:
+            return jobs[0]
+        merged = {}
+        for i in range(1, len(CHANNELS) + 1):
+            merged[f"t{i}"] = np.concatenate([job[f"t{i}"] for job in jobs])
+            merged[f"tail{i}"] = jobs[0][f"tail{i}"]
+            merged[f"singles{i}"] = sum(job[f"singles{i}"] for job in jobs)
+        merged.update({key: sum(job[key] for job in jobs) for key in COUNTERS})
+        return merged
+
+    def histogram(self, job: dict) -> np.ndarray:
+        """Гистограмма пар, в которых участвует хотя бы одно новое событие"""
+        t1 = np.sort(job["t1"])
+        t2 = np.sort(job["t2"])
+        window = self.tau_max_ns * self.TICKS_PER_NS
+        deltas = np.concatenate((
+            coincidence_deltas(t1, np.sort(np.concatenate((job["tail2"], t2))), window),
+            coincidence_deltas(np.sort(job["tail1"]), t2, window),
+        )) / self.TICKS_PER_NS
+        return histogram1d(deltas, bins=self.num_bins, range=(-self.tau_max_ns, self.tau_max_ns))
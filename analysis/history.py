@@ -0,0 +1,159 @@
+import numpy as np
+
+# Точек на уровень и число уровней по умолчанию: около 3 МБ для двух каналов,
+# исходное разрешение 0.1 с сохраняется ~3.5 мин, весь сеанс - без ограничения длительности
+DEFAULT_CAPACITY = 2048
+DEFAULT_LEVELS = 12
+
+
+class _Level:
+    """Кольцевой уровень пирамиды: каждая точка объединяет span точек предыдущего уровня"""
+
+    def __init__(self, capacity, channels, span, merge=False):
+        self.capacity = capacity
+        self.span = span
+        # Последний уровень не вытесняет точки, а попарно объединяет их (см. compact)
+        self.merge = merge
+        self.time = np.zeros(2 * capacity)
+        self.low = np.zeros((2 * capacity, channels))
+        self.high = np.zeros((2 * capacity, channels))
+        self.total = np.zeros((2 * capacity, channels))
+        self.count = np.zeros(2 * capacity, dtype=np.int64)
+        self.head = 0
+        self._pending = None
+        self._pending_items = 0
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    @property
+    def complete(self) -> bool:
+        """Уровень хранит все свои точки с начала сеанса"""
+        return self.head <= self.capacity
+
+    def add(self, time, low, high, total, count):
+        """
+        Добавляет точку предыдущего уровня
+
+        Returns:
+            tuple: готовая точка этого уровня или None, пока не набрано span точек
+        """
+        if self._pending is None:
+            self._pending = [time, low.copy(), high.copy(), total.copy(), count]
+        else:
+            pending = self._pending
+            np.minimum(pending[1], low, out=pending[1])
+            np.maximum(pending[2], high, out=pending[2])
+            pending[3] += total
+            pending[4] += count
+        self._pending_items += 1
+        if self._pending_items < self.span:
+            return None
+        item = self._pending
+        self._pending = None
+        self._pending_items = 0
+        self._store(*item)
+        # Уплотнение сразу после заполнения: следующие точки набираются уже с удвоенным span,
+        # и все точки уровня объединяют одинаковое число исходных
+        if self.merge and self.head >= self.capacity:
+            self.compact()
+        return item
+
+    def _store(self, time, low, high, total, count):
+        position = self.head % self.capacity
+        for index in (position, position + self.capacity):
+            self.time[index] = time
+            self.low[index] = low
+            self.high[index] = high
+            self.total[index] = total
+            self.count[index] = count
+        self.head += 1
+
+    def view(self):
+        """Точки уровня в порядке времени без копирования: (time, low, high, total, count)"""
+        count = len(self)
+        start = (self.head - count) % self.capacity
+        rows = slice(start, start + count)
+        return self.time[rows], self.low[rows], self.high[rows], self.total[rows], self.count[rows]
+
+    def compact(self):
+        """Попарно объединяет точки заполненного уровня, span удваивается"""
+        time, low, high, total, count = (values.copy() for values in self.view())
+        half = self.capacity // 2
+        merged = (time[0::2], np.minimum(low[0::2], low[1::2]), np.maximum(high[0::2], high[1::2]),
+                  total[0::2] + total[1::2], count[0::2] + count[1::2])
+        for column, values in zip((self.time, self.low, self.high, self.total, self.count), merged):
+            column[:half] = values
+            column[self.capacity:self.capacity + half] = values
+        self.head = half
+        self.span *= 2
+
+
+class CountHistory:
+    """
+    История счёта фотонов за весь сеанс в фиксированном объёме памяти
+
+    Уровень 0 хранит последние capacity точек в исходном разрешении, каждый следующий -
+    последние capacity точек, объединяющих по две точки предыдущего (время начала, минимум,
+    сумма и максимум по каналам). Последний уровень охватывает весь сеанс: когда он заполняется,
+    соседние точки попарно объединяются. Уровни хранят каждую точку дважды, как PhotonRing,
+    поэтому выборка диапазона при прокрутке и масштабировании - срезы готовых уровней без пересчёта.
+    Точки грубых уровней появляются по мере набора, поэтому их правый край отстаёт от уровня 0.
+    """
+
+    def __init__(self, channels=2, capacity=DEFAULT_CAPACITY, levels=DEFAULT_LEVELS):
+        if capacity < 2 or capacity % 2:
+            raise ValueError("Ёмкость уровня должна быть чётной")
+        self.channels = channels
+        self.capacity = capacity
+        self.num_levels = levels
+        self.reset()
+
+    def reset(self):
+        self.levels = [_Level(self.capacity, self.channels, 1 if level == 0 else 2,
+                              merge=level == self.num_levels - 1) for level in range(self.num_levels)]
+
+    def __len__(self):
+        """Число точек исходного разрешения за сеанс"""
+        return self.levels[0].head
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.time.nbytes + level.low.nbytes + level.high.nbytes + level.total.nbytes +
+                   level.count.nbytes for level in self.levels)
+
+    def append(self, time, values):
+        """
+        Добавляет точку исходного разрешения
+
+        Args:
+            time (float): время точки, с
+            values: значения каналов
+        """
+        values = np.asarray(values, dtype=np.float64)
+        item = (time, values, values, values, 1)
+        for level in self.levels:
+            item = level.add(*item)
+            if item is None:
+                break
+
+    def window(self, start, stop, max_points) -> dict:
+        """
+        Точки диапазона времени [start, stop] с самого подробного уровня, на котором их не больше max_points
+
+        Returns:
+            dict: time (с), min, mean, max (массивы точек x каналы) и level; время и экстремумы -
+                  представления уровня
+        """
+        for number, level in enumerate(self.levels):
+            time, low, high, total, count = level.view()
+            last = number == len(self.levels) - 1
+            # Уровень, с которого вытеснены точки до начала диапазона, его не покрывает
+            if not last and not level.complete and time[0] > start:
+                continue
+            first = max(int(np.searchsorted(time, start, side='right')) - 1, 0)
+            stop_index = int(np.searchsorted(time, stop, side='right'))
+            if stop_index - first <= max_points or last:
+                rows = slice(first, stop_index)
+                return {"time": time[rows], "min": low[rows], "mean": total[rows] / count[rows, None],
+                        "max": high[rows], "level": number}
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class SweepAccumulator:
+    """
+    Накопление отсчётов ODMR по точкам развёртки
+
+    Каждый пакет с флагом flag_pos соответствует следующей точке. Позиция проходит
+    значения 0..num_points (последняя - служебная, отсчёты в ней не учитываются),
+    после чего начинается новый проход развёртки. updates растёт при каждом изменении
+    данных, по нему отрисовка определяет, нужен ли новый кадр.
+    """
+
+    def __init__(self, num_points):
+        self.num_points = num_points
+        self.reset()
+
+    def reset(self):
+        self.data = np.zeros(self.num_points)
+        self.current_point = 0
+        self.increment_sweep = 0
+        self.updates = 0
+
+    def add(self, counts: np.ndarray) -> np.ndarray:
+        """
+        Добавляет отсчёты последовательных точек развёртки
+
+        Args:
+            counts (np.ndarray): count_pos пакетов с флагом flag_pos в порядке прихода
+
+        Returns:
+            np.ndarray: позиции развёртки, на которые пришлись отсчёты
+        """
+        cycle = self.num_points + 1
+        count = len(counts)
+        points = (self.current_point + np.arange(count)) % cycle
+        self.data += np.bincount(points, weights=counts, minlength=cycle)[:self.num_points]
+        self.increment_sweep += (self.current_point + count) // cycle
+        self.current_point = (self.current_point + count) % cycle
+        self.updates += 1
+        return points
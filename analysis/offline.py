@@ -0,0 +1,239 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from acquisition.recording import RECORD_DTYPE, load_chunks, map_records
+from acquisition.sequence import SequenceTracker
+from analysis.correlator import CHANNELS, TimelineCorrelator, NATIVE_BIN_NS, NATIVE_TAU_MAX_NS, job_counters
+from hardware.counter_packet import PAYLOAD_DTYPE, TIMESTAMP_PERIOD_NS, decode_payloads, select
+from hardware.tdc_calibration import TdcCalibration, code_density
+
+# Пакетов в одном задании пула: несколько миллисекунд счёта на задание при умеренном объёме пересылки
+JOB_PACKETS = 200_000
+
+# Номер и флаги пакета прямо в записях RECORD_DTYPE: проверка последовательности без разбора меток
+_SEQUENCE_DTYPE = np.dtype({
+    'names': ['package_id', 'flags'],
+    'formats': ['<u2', 'u1'],
+    'offsets': [RECORD_DTYPE.fields['payload'][1] + PAYLOAD_DTYPE.fields[name][1] for name in ('package_id', 'flags')],
+    'itemsize': RECORD_DTYPE.itemsize,
+})
+
+# Коррелятор и таблица TDC рабочего процесса, создаются инициализатором пула
+_worker_correlator = None
+_worker_calibration = None
+
+
+def _init_worker(tau_max_ns, bin_width_ns, calibration=None):
+    global _worker_correlator, _worker_calibration
+    _worker_correlator = TimelineCorrelator(tau_max_ns, bin_width_ns)
+    _worker_calibration = calibration
+
+
+def _first_reference(batch):
+    """Опорная метка первого пакета с событиями, пс (как в TimelineCorrelator.absolute_times)"""
+    ticks = TimelineCorrelator.TICKS_PER_NS
+    valid = np.concatenate([batch[f"{channel}_valid"] for channel in CHANNELS], axis=1)
+    rows = np.flatnonzero(valid.any(axis=1))
+    if not len(rows):
+        return None
+    stamps = np.concatenate([batch[channel][rows[0]] for channel in CHANNELS])
+    return int(np.rint(stamps[valid[rows[0]]] * ticks).astype(np.int64).min())
+
+
+def _histogram_job(path, start, count, lost_rows, lost_values):
+    """
+    Разбор и гистограмма диапазона записей фрагмента на собственной шкале задания
+
+    Шкала задания начинается с разрыва (как после потери пакетов), пары с событиями
+    соседних заданий считаются в родительском процессе по возвращённым краям.
+
+    Args:
+        path (str): файл фрагмента
+        start, count (int): диапазон записей фрагмента
+        lost_rows, lost_values: ненулевые lost_before валидных пакетов (см. SequenceTracker.accept)
+
+    Returns:
+        dict: hist, counters, опорные метки первого и последнего пакетов, положение последнего пакета
+              на шкале задания, события в пределах tau от начала (heads) и от конца (tails) по каналам
+    """
+    correlator = _worker_correlator
+    records = map_records(path, start, count)
+    decoded = decode_payloads(np.ascontiguousarray(records['payload']), _worker_calibration)
+    batch = select(decoded, decoded["flag_valid"] == 1)
+    batch["lost_before"] = np.zeros(len(batch["package_id"]), dtype=np.int64)
+    batch["lost_before"][lost_rows] = lost_values
+
+    correlator.reset()
+    job = correlator.stitch(batch)
+    times = [job[f"t{i}"] for i in range(1, len(CHANNELS) + 1)]
+    events = np.concatenate(times)
+    window = correlator.tau_max_ns * correlator.TICKS_PER_NS
+    first, last = (events.min(), events.max()) if len(events) else (0, 0)
+    return {
+        "hist": correlator.histogram(job),
+        "counters": job_counters(job),
+        "events": len(events),
+        "first_reference": _first_reference(batch),
+        "last_reference": correlator._last_reference,
+        "last_absolute": correlator.timeline_ps,
+        "heads": [t[t < first + window] for t in times],
+        "tails": [t[t > last - window] for t in times],
+    }
+
+
+def recorded_ranges(index_path, job_packets=JOB_PACKETS):
+    """
+    Разбивает запись RawRecorder на последовательные задания и учитывает последовательность пакетов
+
+    Номера пакетов читаются прямо из отображённых фрагментов без разбора меток, поэтому
+    этот проход дешёвый и выполняется последовательно; разбор выполняют рабочие процессы.
+
+    Yields:
+        tuple: (файл фрагмента, первая запись, число записей, номера строк и значения ненулевых
+               lost_before среди валидных пакетов задания)
+    """
+    sequence = SequenceTracker()
+    for records in load_chunks(index_path):
+        header = records.view(_SEQUENCE_DTYPE)
+        for start in range(0, len(records), job_packets):
+            part = header[start:start + job_packets]
+            lost = sequence.accept({"package_id": part['package_id'].astype(np.uint16),
+                                    "flag_valid": part['flags'] & 0x1})["lost_before"]
+            rows = np.flatnonzero(lost)
+            yield records.filename, start, len(part), rows, lost[rows]
+
+
+class _TimelineStitcher:
+    """
+    Последовательная сшивка заданий, разобранных на собственных шкалах (см. _histogram_job)
+
+    Сдвиг шкалы задания определяется опорными метками соседних заданий, а пары событий
+    по разные стороны границы заданий считаются по хвостам предыдущих и началу нового.
+    """
+
+    def __init__(self, correlator):
+        self.correlator = correlator
+        self.window = correlator.tau_max_ns * correlator.TICKS_PER_NS
+        self.guard = int(correlator.SEGMENT_GUARD_NS * correlator.TICKS_PER_NS)
+        self.period = int(TIMESTAMP_PERIOD_NS * correlator.TICKS_PER_NS)
+        self.reference = None
+        self.absolute = 0
+        self.tails = [np.empty(0, dtype=np.int64) for _ in CHANNELS]
+
+    def add(self, result, broken):
+        """
+        Добавляет результат задания в порядке записи
+
+        Args:
+            result (dict): результат _histogram_job
+            broken (bool): перед первым валидным пакетом задания есть потери
+        """
+        correlator = self.correlator
+        counters = dict(result["counters"])
+        if not counters["packets"]:
+            return
+        first = result["first_reference"]
+        if self.reference is None or broken:
+            step = self.guard
+        elif first is None:
+            step = 0
+        else:
+            step = (first - self.reference + self.period // 2) % self.period - self.period // 2
+            counters["duration_ns"] += step / correlator.TICKS_PER_NS
+        # Первый пакет задания стоит на его шкале на месте разрыва
+        offset = self.absolute + step - self.guard
+
+        heads = [head + offset for head in result["heads"]]
+        empty = np.empty(0, dtype=np.int64)
+        boundary = correlator.histogram({"t1": heads[0], "t2": empty, "tail1": empty, "tail2": self.tails[1]}) + \
+            correlator.histogram({"t1": empty, "t2": heads[1], "tail1": self.tails[0], "tail2": empty})
+        correlator.accumulate(result["hist"] + boundary, counters)
+
+        tails = [np.concatenate((tail, new + offset)) for tail, new in zip(self.tails, result["tails"])]
+        if result["events"]:
+            horizon = max(tail.max() for tail in tails if len(tail)) - self.window
+            tails = [tail[tail > horizon] for tail in tails]
+        self.tails = tails
+        self.absolute = offset + result["last_absolute"]
+        if first is not None:
+            self.reference = result["last_reference"]
+        correlator._last_absolute = self.absolute
+
+
+def recorded_packets(index_path) -> int:
+    return sum(len(records) for records in load_chunks(index_path))
+
+
+def calibrate_recording(index_path, device, job_packets=JOB_PACKETS) -> TdcCalibration:
+    """
+    Таблица TDC по тесту плотности кодов на записи некоррелированного со счётчиком света
+
+    Args:
+        index_path (str): индекс записи (.snvidx)
+        device (str): устройство (источник захвата), для которого сохраняется таблица
+    """
+    counts = 0
+    for records in load_chunks(index_path):
+        for start in range(0, len(records), job_packets):
+            counts = counts + code_density(np.ascontiguousarray(records['payload'][start:start + job_packets]))
+    return TdcCalibration.from_code_density(counts, device)
+
+
+def offline_g2(index_path, tau_max_ns=NATIVE_TAU_MAX_NS, bin_width_ns=NATIVE_BIN_NS, workers=None,
+               job_packets=JOB_PACKETS, progress=None, calibration=None) -> TimelineCorrelator:
+    """
+    Пересчёт g2 по записанному потоку в пуле процессов
+
+    Рабочие процессы получают диапазоны записей, сами разбирают их и строят гистограммы
+    на шкале задания; родительский процесс только проверяет последовательность пакетов
+    и сшивает шкалы заданий по опорным меткам. Результат совпадает с последовательным
+    расчётом. Число заданий в работе ограничено, чтобы не держать всю запись в памяти.
+
+    Args:
+        index_path (str): индекс записи (.snvidx)
+        workers (int): число процессов, по умолчанию - число ядер
+        progress (callable): progress(обработано пакетов, всего пакетов, событий/с)
+        calibration (TdcCalibration): таблица TDC устройства, на котором сделана запись
+
+    Returns:
+        TimelineCorrelator: коррелятор с накопленной гистограммой и счётчиками (hist, packets, ...)
+    """
+    workers = workers or os.cpu_count() or 1
+    correlator = TimelineCorrelator(tau_max_ns, bin_width_ns)
+    total = recorded_packets(index_path)
+    # Записи законченных заданий: коррелятор считает только валидные пакеты, и с ним прогресс не доходил бы до total
+    processed = 0
+    events = 0
+    started = time.perf_counter()
+
+    # spawn: GUI процесс многопоточный, fork в нём небезопасен
+    context = multiprocessing.get_context("spawn")
+    stitcher = _TimelineStitcher(correlator)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(tau_max_ns, bin_width_ns, calibration)) as pool:
+        # Задания в работе в порядке записи: шкалы сшиваются строго по порядку
+        queue = []
+
+        def collect():
+            nonlocal events, processed
+            future, broken, count = queue.pop(0)
+            result = future.result()
+            stitcher.add(result, broken)
+            events += result["events"]
+            processed += count
+            if progress:
+                progress(processed, total, events / max(time.perf_counter() - started, 1e-9))
+
+        for path, start, count, lost_rows, lost_values in recorded_ranges(index_path, job_packets):
+            broken = len(lost_rows) > 0 and lost_rows[0] == 0
+            queue.append((pool.submit(_histogram_job, path, start, count, lost_rows, lost_values), broken, count))
+            if len(queue) >= 2 * workers:
+                collect()
+        while queue:
+            collect()
+
+    return correlator
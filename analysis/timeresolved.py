@@ -0,0 +1,95 @@
+import numpy as np
+
+from analysis.correlator import TimelineCorrelator, coincidence_pairs
+
+# Память под двумерную гистограмму по умолчанию, байт
+DEFAULT_BUDGET_BYTES = 4 << 20
+
+
+class TimeResolvedG2:
+    """
+    Гистограмма g2(tau, t) последовательными срезами по времени в фиксированном объёме памяти
+
+    Пара относится к срезу по времени более позднего (нового) события на восстановленной
+    шкале TimelineCorrelator, поэтому интервалы-разделители после потерь пакетов тоже
+    занимают место на оси времени. Когда срезы заканчиваются, соседние срезы попарно
+    складываются, а длительность среза удваивается. По tau - нечётное число бинов
+    с центрами на кратных bin_width_ns задержках, центральный бин - tau = 0.
+
+    histogram() не имеет состояния (срезы в единицах исходной длительности) и может
+    выполняться в рабочем потоке, accumulate() - в потоке GUI.
+    """
+
+    def __init__(self, tau_max_ns=100, bin_width_ns=1.0, slice_s=1.0, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.half_bins = int(round(tau_max_ns / bin_width_ns))
+        self.num_bins = 2 * self.half_bins + 1
+        self.tau_max_ns = (self.half_bins + 0.5) * bin_width_ns
+        self.bin_width_ns = bin_width_ns
+        self.base_slice_ps = int(slice_s * 1e9 * TimelineCorrelator.TICKS_PER_NS)
+        # Чётное число срезов, чтобы попарное слияние освобождало ровно половину
+        self.max_slices = max(2, budget_bytes // (self.num_bins * 8) // 2 * 2)
+        self.reset()
+
+    def reset(self):
+        self.slices = np.zeros((self.max_slices, self.num_bins))
+        self.level = 0
+        self.origin = None
+        self.used = 0
+
+    @property
+    def slice_s(self) -> float:
+        """Текущая длительность среза, с"""
+        return self.base_slice_ps * (1 << self.level) / TimelineCorrelator.TICKS_PER_NS / 1e9
+
+    def histogram(self, job: dict):
+        """
+        Двумерная гистограмма пар задания (см. TimelineCorrelator.stitch)
+
+        Returns:
+            tuple: (номер первого исходного среза, массив (срезы, num_bins)) или (None, None)
+        """
+        t1 = np.sort(job["t1"])
+        t2 = np.sort(job["t2"])
+        tail2 = np.sort(np.concatenate((job["tail2"], t2)))
+        tail1 = np.sort(job["tail1"])
+        window = self.tau_max_ns * TimelineCorrelator.TICKS_PER_NS
+
+        owners, partners = coincidence_pairs(t1, tail2, window)
+        late_owners, late_partners = coincidence_pairs(tail1, t2, window)
+        deltas = np.concatenate((t1[owners] - tail2[partners], tail1[late_owners] - t2[late_partners]))
+        times = np.concatenate((np.maximum(t1[owners], tail2[partners]), t2[late_partners]))
+        if not len(deltas):
+            return None, None
+
+        index = times // self.base_slice_ps
+        first = int(index.min())
+        rows = index - first
+        columns = np.clip(np.floor((deltas / TimelineCorrelator.TICKS_PER_NS + self.tau_max_ns) / self.bin_width_ns)
+                          .astype(np.int64), 0, self.num_bins - 1)
+        partial = np.bincount(rows * self.num_bins + columns, minlength=(int(rows.max()) + 1) * self.num_bins)
+        return first, partial.reshape(-1, self.num_bins).astype(np.float64)
+
+    def accumulate(self, first, partial):
+        if partial is None:
+            return
+        if self.origin is None:
+            self.origin = first
+        rows = (first - self.origin + np.arange(len(partial))) >> self.level
+        rows = np.maximum(rows, 0)
+        while rows[-1] >= self.max_slices:
+            self._merge()
+            rows >>= 1
+        np.add.at(self.slices, rows, partial)
+        self.used = max(self.used, int(rows[-1]) + 1)
+
+    def _merge(self):
+        # Соседние срезы складываются, длительность среза удваивается
+        half = self.max_slices // 2
+        self.slices[:half] = self.slices[0::2] + self.slices[1::2]
+        self.slices[half:] = 0
+        self.used = (self.used + 1) // 2
+        self.level += 1
+
+    def image(self) -> np.ndarray:
+        """Заполненные срезы (время x tau) без копирования"""
+        return self.slices[:self.used]
@@ -0,0 +1,183 @@
+"""
+Замеры пропускной способности и задержки конвейера обработки пакетов счётчика
+
+Пакеты заранее генерируются SyntheticSource и прогоняются блоками, как их выдаёт шина захвата.
+Этапы замеряются по отдельности (decode, ring, g2, coincidence, odmr) и вместе (pipeline); результаты
+пишутся в JSON для сравнения версий:
+
+    python -m benchmarks.pipeline --rate 1e6 --statistics antibunched --loss 0.001 -o bench.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from acquisition.ring import PhotonRing
+from acquisition.sequence import SequenceTracker
+from analysis.coincidence import CoincidenceCounter
+from analysis.correlator import TimelineCorrelator, job_counters
+from analysis.odmr import SweepAccumulator
+from hardware.counter_packet import decode_payloads
+from hardware.synthetic import SyntheticSource, POISSON, ANTIBUNCHED
+
+RESULTS_VERSION = 1
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(blocks, step, setup=None) -> dict:
+    """
+    Прогоняет step по всем блокам и собирает статистику
+
+    Args:
+        blocks (list): входные блоки этапа
+        step (callable): step(state, block) -> число обработанных событий
+        setup (callable): создаёт состояние этапа
+
+    Returns:
+        dict: пакеты/с, события/с и задержка обработки блока (мс)
+    """
+    state = setup() if setup else None
+    latencies = np.empty(len(blocks))
+    packets = 0
+    events = 0
+    started = time.perf_counter()
+    for i, block in enumerate(blocks):
+        t0 = time.perf_counter()
+        events += step(state, block) or 0
+        latencies[i] = time.perf_counter() - t0
+        packets += len(block["package_id"]) if isinstance(block, dict) else len(block)
+    elapsed = time.perf_counter() - started
+    return {
+        "blocks": len(blocks),
+        "packets": packets,
+        "events": events,
+        "seconds": elapsed,
+        "packets_per_s": packets / elapsed,
+        "events_per_s": events / elapsed,
+        "latency_ms": {
+            "mean": float(latencies.mean() * 1e3),
+            "p50": float(np.percentile(latencies, 50) * 1e3),
+            "p99": float(np.percentile(latencies, 99) * 1e3),
+            "max": float(latencies.max() * 1e3),
+        },
+    }
+
+
+def _events(batch):
+    return int(np.count_nonzero(batch["tp1_valid"]) + np.count_nonzero(batch["tp2_valid"]))
+
+
+def run(packets=500_000, block_packets=4096, rate_cps=1e6, statistics=POISSON, loss=0.0, packet_period_ns=5000.0,
+        ring_capacity=10000, odmr_points=1000, seed=1) -> dict:
+    source = SyntheticSource(rate_cps, statistics, loss=loss, packet_period_ns=packet_period_ns, seed=seed)
+    raw = [source.generate(block_packets) for _ in range(max(1, packets // block_packets))]
+    sequence = SequenceTracker()
+    decoded = [sequence.accept(decode_payloads(block)) for block in raw]
+
+    def ring_step(state, batch):
+        state.append(batch)
+
+    def g2_setup():
+        ring = PhotonRing(ring_capacity)
+        return ring, TimelineCorrelator()
+
+    def g2_step(state, batch):
+        ring, correlator = state
+        ring.append(batch)
+        job = correlator.take(ring)
+        correlator.accumulate(correlator.histogram(job), job_counters(job))
+        return job["singles1"] + job["singles2"]
+
+    def coincidence_setup():
+        ring = PhotonRing(ring_capacity)
+        return ring, TimelineCorrelator(), CoincidenceCounter()
+
+    def coincidence_step(state, batch):
+        ring, correlator, counter = state
+        ring.append(batch)
+        job = correlator.take(ring)
+        counter.accumulate(counter.histogram(job))
+        return job["singles1"] + job["singles2"]
+
+    def odmr_step(state, batch):
+        return len(state.add(batch["count_pos"][batch["flag_pos"] == 1]))
+
+    def pipeline_setup():
+        ring = PhotonRing(ring_capacity)
+        return SequenceTracker(), ring, TimelineCorrelator(), SweepAccumulator(odmr_points)
+
+    def pipeline_step(state, block):
+        tracker, ring, correlator, sweep = state
+        batch = tracker.accept(decode_payloads(block))
+        first = ring.append(batch)
+        job = correlator.take(ring)
+        correlator.accumulate(correlator.histogram(job), job_counters(job))
+        window = ring.since(first)
+        sweep.add(window["count_pos"][window["flag_pos"] == 1])
+        return job["singles1"] + job["singles2"]
+
+    results = {
+        "decode": measure(raw, lambda state, block: _events(decode_payloads(block))),
+        "ring": measure(decoded, ring_step, lambda: PhotonRing(ring_capacity)),
+        "g2": measure(decoded, g2_step, g2_setup),
+        "coincidence": measure(decoded, coincidence_step, coincidence_setup),
+        "odmr": measure(decoded, odmr_step, lambda: SweepAccumulator(odmr_points)),
+        "pipeline": measure(raw, pipeline_step, pipeline_setup),
+    }
+    return {
+        "version": RESULTS_VERSION,
+        "revision": _revision(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                     "system": platform.system(), "processor": platform.processor()},
+        "config": {"packets": len(raw) * block_packets, "block_packets": block_packets, "rate_cps": rate_cps,
+                   "statistics": statistics, "loss": loss, "packet_period_ns": packet_period_ns,
+                   "ring_capacity": ring_capacity, "odmr_points": odmr_points, "seed": seed,
+                   "lost_packets": sequence.lost},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры конвейера обработки пакетов счётчика")
+    parser.add_argument("--packets", type=int, default=500_000)
+    parser.add_argument("--block", type=int, default=4096, help="пакетов в блоке (как у шины захвата)")
+    parser.add_argument("--rate", type=float, default=1e6, help="интенсивность на канал, 1/с")
+    parser.add_argument("--statistics", choices=(POISSON, ANTIBUNCHED), default=POISSON)
+    parser.add_argument("--loss", type=float, default=0.0, help="доля теряемых пакетов")
+    parser.add_argument("--period", type=float, default=5000.0, help="интервал одного пакета, нс")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="файл JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    report = run(args.packets, args.block, args.rate, args.statistics, args.loss, args.period, seed=args.seed)
+    for stage, result in report["results"].items():
+        print(f"{stage:12s} {result['packets_per_s']:14,.0f} пакетов/с {result['events_per_s']:14,.0f} событий/с  "
+              f"задержка блока p50 {result['latency_ms']['p50']:.2f} мс, p99 {result['latency_ms']['p99']:.2f} мс")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Сравнение с {baseline.get('revision')} от {baseline.get('date')}:")
+        for stage, result in report["results"].items():
+            if stage in baseline["results"]:
+                ratio = result["packets_per_s"] / baseline["results"][stage]["packets_per_s"]
+                print(f"{stage:12s} x{ratio:.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import numpy as np
+
+# Размер полезной нагрузки UDP пакета счётчика фотонов
+PAYLOAD_SIZE = 64
+# Количество временных меток на канал в одном пакете
+TIMESTAMPS_PER_CHANNEL = 6
+# Каналы меток пакета (поля PAYLOAD_DTYPE); канал i (с 1) несёт счётчик событий cnt_photon_{i}.
+# От этого списка зависят колонки кольцевого буфера, калибровка и задания корреляторов
+TIMESTAMP_CHANNELS = ("tp1", "tp2")
+
+# Цена младшего разряда точной (fine) и грубой (coarse) частей метки, нс
+FINE_STEP_NS = 0.18
+COARSE_STEP_NS = 5
+# Грубая часть метки - 25 старших бит, после переполнения время начинается с нуля
+TIMESTAMP_PERIOD_NS = (1 << 25) * COARSE_STEP_NS
+
+# Значение незанятой позиции метки. У события такая метка означала бы одновременно нулевые
+# грубую и точную части (вероятность ~1e-9 на событие), поэтому 0 считается признаком пустой позиции
+UNUSED_TIMESTAMP = 0
+# Считать ли cnt_photon_1/2 числом занятых позиций меток канала (если это гарантирует прошивка);
+# иначе действительность позиций определяется по UNUSED_TIMESTAMP
+SLOT_COUNTS_FROM_CNT_PHOTON = False
+
+# Раскладка 64-байтной полезной нагрузки
+PAYLOAD_DTYPE = np.dtype({
+    'names': ['package_id', 'flags', 'cnt_photon_1', 'cnt_photon_2', 'tp1', 'tp2', 'count_pos', 'count_neg'],
+    'formats': ['<u2', 'u1', '<u2', '<u2', ('<u4', (TIMESTAMPS_PER_CHANNEL,)), ('<u4', (TIMESTAMPS_PER_CHANNEL,)),
+                ('u1', (3,)), '<u2'],
+    'offsets': [1, 5, 6, 8, 10, 34, 58, 61],
+    'itemsize': PAYLOAD_SIZE,
+})
+
+
+def as_records(data) -> np.ndarray:
+    """
+    Представляет блок полезных нагрузок как массив записей PAYLOAD_DTYPE без копирования
+
+    Args:
+        data: bytes/bytearray/memoryview длиной n * 64 или массив uint8 формы (n, 64)
+
+    Returns:
+        np.ndarray: структурированный массив из n записей
+    """
+    if isinstance(data, np.ndarray) and data.dtype == PAYLOAD_DTYPE:
+        return data
+    buffer = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    buffer = np.ascontiguousarray(buffer).reshape(-1)
+    if buffer.size % PAYLOAD_SIZE:
+        raise ValueError(f"Размер блока {buffer.size} не кратен {PAYLOAD_SIZE} байтам")
+    return buffer.view(PAYLOAD_DTYPE)
+
+
+def timestamps_to_ns(raw: np.ndarray) -> np.ndarray:
+    """
+    Переводит сырые метки TDC в наносекунды
+
+    Args:
+        raw (np.ndarray): сырые 32-битные метки
+
+    Returns:
+        np.ndarray: время в нс, округлённое до 0.1 нс
+    """
+    fine = np.round((raw & 0x1F) * FINE_STEP_NS, 1)
+    coarse = np.round((raw >> 7) * COARSE_STEP_NS, 1)
+    return fine + coarse
+
+
+def timestamp_mask(raw: np.ndarray, used=None) -> np.ndarray:
+    """
+    Маска действительных позиций меток; повторяющиеся значения считаются отдельными событиями
+
+    Args:
+        raw (np.ndarray): сырые метки формы (n, 6)
+        used (np.ndarray): число занятых позиций в каждом пакете (заняты первые used);
+                           None - незанятыми считаются позиции со значением UNUSED_TIMESTAMP
+
+    Returns:
+        np.ndarray: булева маска той же формы
+    """
+    if used is None:
+        return raw != UNUSED_TIMESTAMP
+    width = raw.shape[-1]
+    return np.arange(width) < np.minimum(used, width)[:, None]
+
+
+def decode_payloads(data, calibration=None, slot_counts=SLOT_COUNTS_FROM_CNT_PHOTON) -> dict:
+    """
+    Разбирает блок полезных нагрузок одним векторным вызовом
+
+    Args:
+        data: n подряд идущих 64-байтных полезных нагрузок (см. as_records)
+        calibration: таблица TdcCalibration устройства; без неё точная часть переводится
+                     номинальным шагом FINE_STEP_NS
+        slot_counts (bool): правило действительности меток (см. timestamp_mask)
+
+    Returns:
+        dict: массивы длины n (package_id, flag, flag_valid, flag_pos, flag_neg,
+              cnt_photon_1, cnt_photon_2, count_pos, count_neg), матрицы tp1/tp2 формы (n, 6) в нс
+              и маски действительных меток tp1_valid/tp2_valid (метки незанятых позиций в расчётах не участвуют)
+    """
+    records = as_records(data)
+    flags = records['flags']
+    count_pos = records['count_pos'].astype(np.uint32)
+    timestamps = {}
+    for index, channel in enumerate(TIMESTAMP_CHANNELS):
+        raw = records[channel]
+        used = records[f'cnt_photon_{index + 1}'] if slot_counts else None
+        if calibration is None:
+            timestamps[channel] = timestamps_to_ns(raw)
+        else:
+            timestamps[channel] = calibration.to_ns(raw, index)
+        timestamps[f"{channel}_valid"] = timestamp_mask(raw, used)
+
+    return {
+        "package_id": records['package_id'].astype(np.uint16),
+        "flag": (flags >> 7) & 1,
+        "flag_valid": flags & 0x1,
+        "flag_pos": (flags & 0x10) >> 4,
+        "flag_neg": (flags & 0x8) >> 3,
+        "cnt_photon_1": records['cnt_photon_1'].astype(np.uint16),
+        "cnt_photon_2": records['cnt_photon_2'].astype(np.uint16),
+        "count_pos": count_pos[:, 0] | (count_pos[:, 1] << 8) | (count_pos[:, 2] << 16),
+        "count_neg": records['count_neg'].astype(np.uint16),
+        **timestamps,
+    }
+
+
+def select(batch: dict, mask: np.ndarray) -> dict:
+    """Возвращает подмножество строк разобранного блока"""
+    return {key: value[mask] for key, value in batch.items()}
+
+
+def concatenate(batches: list) -> dict:
+    """Склеивает несколько разобранных блоков в один"""
+    if len(batches) == 1:
+        return batches[0]
+    return {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
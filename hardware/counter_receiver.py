@@ -0,0 +1,160 @@
+import errno
+import select
+import socket
+
+import pcapy
+
+from hardware.counter_packet import PAYLOAD_SIZE
+from hardware.synthetic import SyntheticReceiver
+
+# Порт, на который счётчик отправляет UDP пакеты (должен совпадать с настройкой платы)
+COUNTER_UDP_PORT = 5000
+COUNTER_HOST = "192.168.1.2"
+
+# Ошибка Windows при приёме датаграммы, не поместившейся в буфер
+WSAEMSGSIZE = 10040
+
+
+class PcapReceiver:
+    """Пассивный захват пакетов счётчика через libpcap"""
+
+    def __init__(self, device="Ethernet", bpf_filter="udp and src host 192.168.1.2", header_size=42, snaplen=106,
+                 timeout_ms=20):
+        """
+        Args:
+            device (str | None): имя интерфейса; None - искать loopback интерфейс
+            bpf_filter (str): BPF фильтр захвата
+            header_size (int): суммарный размер заголовков перед полезной нагрузкой
+            snaplen (int): максимальная длина захватываемого кадра
+            timeout_ms (int): таймаут чтения, определяет задержку реакции на остановку
+        """
+        self.device = device
+        self.bpf_filter = bpf_filter
+        self.header_size = header_size
+        self.snaplen = snaplen
+        self.timeout_ms = timeout_ms
+        self.bad_packets = 0
+        self.cap = None
+        self._chunks = []
+
+    def open(self):
+        device = self.device or self._find_loopback()
+        self.cap = pcapy.open_live(device, self.snaplen, 0, self.timeout_ms)
+        self.cap.setfilter(self.bpf_filter)
+        return device
+
+    @staticmethod
+    def _find_loopback():
+        interfaces = pcapy.findalldevs()
+        if not interfaces:
+            raise RuntimeError("Не найдены интерфейсы!")
+
+        # В Windows loopback интерфейс часто называется "Adapter for loopback traffic capture"
+        # или содержит "loopback". Если не нашли, используем первый интерфейс.
+        for iface in interfaces:
+            if 'loopback' in iface.lower() or '127.0.0.1' in iface:
+                return iface
+        return interfaces[0]
+
+    def _on_packet(self, header, packet):
+        payload = packet[self.header_size:self.header_size + PAYLOAD_SIZE]
+        if len(payload) == PAYLOAD_SIZE:
+            self._chunks.append(payload)
+        else:
+            self.bad_packets += 1
+
+    def read_block(self, max_packets=-1) -> bytes:
+        """
+        Забирает все пакеты, пришедшие за одно пробуждение
+
+        Returns:
+            bytes: подряд идущие 64-байтные полезные нагрузки (пусто по таймауту)
+        """
+        self._chunks = []
+        self.cap.dispatch(max_packets, self._on_packet)
+        return b"".join(self._chunks)
+
+    def close(self):
+        self.cap = None
+
+
+class UdpReceiver:
+    """Приём пакетов счётчика обычным UDP сокетом, без libpcap и прав администратора"""
+
+    def __init__(self, host="0.0.0.0", port=COUNTER_UDP_PORT, source_host=COUNTER_HOST, rcvbuf=8 * 1024 * 1024,
+                 max_packets=4096, timeout_ms=20):
+        """
+        Args:
+            host (str): локальный адрес для bind
+            port (int): локальный UDP порт
+            source_host (str | None): принимать датаграммы только от этого адреса; None - от любого
+            rcvbuf (int): запрашиваемый размер приёмного буфера ядра, байт
+            max_packets (int): ёмкость буфера одного пробуждения, пакетов
+            timeout_ms (int): таймаут ожидания, определяет задержку реакции на остановку
+        """
+        self.host = host
+        self.port = port
+        self.source_host = source_host
+        self.rcvbuf = rcvbuf
+        self.max_packets = max_packets
+        self.timeout_ms = timeout_ms
+        self.bad_packets = 0
+        self.sock = None
+        # Лишний байт в конце позволяет отличить усечённую длинную датаграмму от корректной
+        self.buffer = bytearray(max_packets * PAYLOAD_SIZE + 1)
+        self._view = memoryview(self.buffer)
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        self.sock.bind((self.host, self.port))
+        self.sock.setblocking(False)
+        return f"udp://{self.host}:{self.sock.getsockname()[1]}"
+
+    def read_block(self, max_packets=-1) -> memoryview:
+        """
+        Ждёт первую датаграмму и вычитывает все накопившиеся в предвыделенный буфер
+
+        Returns:
+            memoryview: подряд идущие 64-байтные полезные нагрузки; действителен до следующего вызова
+        """
+        limit = self.max_packets if max_packets < 0 else min(max_packets, self.max_packets)
+        ready, _, _ = select.select([self.sock], [], [], self.timeout_ms / 1000)
+        if not ready:
+            return self._view[:0]
+
+        count = 0
+        while count < limit:
+            slot = self._view[count * PAYLOAD_SIZE:(count + 1) * PAYLOAD_SIZE + 1]
+            try:
+                nbytes, address = self.sock.recvfrom_into(slot)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                # Слишком длинная датаграмма: в Windows приходит ошибкой, буфер при этом заполнен
+                if e.errno in (errno.EMSGSIZE, WSAEMSGSIZE) or getattr(e, "winerror", None) == WSAEMSGSIZE:
+                    self.bad_packets += 1
+                    continue
+                raise
+
+            if nbytes != PAYLOAD_SIZE or (self.source_host and address[0] != self.source_host):
+                self.bad_packets += 1
+                continue
+            count += 1
+
+        return self._view[:count * PAYLOAD_SIZE]
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+# Источники захвата по имени; для одного источника в процессе существует одна шина
+SOURCES = {
+    "ethernet": lambda: PcapReceiver(device="Ethernet", bpf_filter="udp and src host 192.168.1.2", header_size=42),
+    "loopback": lambda: PcapReceiver(device=None, bpf_filter="udp", header_size=32, snaplen=65536),
+    "udp": lambda: UdpReceiver(),
+    # Генератор пакетов для проверки без счётчика (см. hardware.synthetic)
+    "synthetic": lambda: SyntheticReceiver(),
+}
@@ -0,0 +1,153 @@
+import time
+
+import numpy as np
+
+from hardware.counter_packet import PAYLOAD_DTYPE, PAYLOAD_SIZE, TIMESTAMPS_PER_CHANNEL, FINE_STEP_NS, \
+    COARSE_STEP_NS, TIMESTAMP_PERIOD_NS
+
+# Наибольшее значение точной части метки, укладывающееся в один шаг грубой
+FINE_MAX = int(COARSE_STEP_NS / FINE_STEP_NS)
+
+POISSON = "poisson"
+ANTIBUNCHED = "antibunched"
+
+
+def encode_timestamps(t_ns: np.ndarray) -> np.ndarray:
+    """
+    Переводит время в сырые метки TDC (обратно timestamps_to_ns с точностью до шага точной части)
+
+    Args:
+        t_ns (np.ndarray): время, нс
+
+    Returns:
+        np.ndarray: 32-битные метки
+    """
+    t_ns = np.mod(t_ns, TIMESTAMP_PERIOD_NS)
+    coarse = np.floor(t_ns / COARSE_STEP_NS)
+    fine = np.clip(np.rint((t_ns - coarse * COARSE_STEP_NS) / FINE_STEP_NS), 0, FINE_MAX)
+    return (coarse.astype(np.uint32) << 7) | fine.astype(np.uint32)
+
+
+class SyntheticSource:
+    """
+    Генератор полезных нагрузок счётчика в формате PAYLOAD_DTYPE с заданной статистикой фотонов
+
+    Каждый пакет охватывает интервал packet_period_ns и содержит до 6 меток на канал
+    (незанятые позиции содержат UNUSED_TIMESTAMP); cnt_photon_1/2 - число фотонов канала
+    за интервал, так что первые min(cnt_photon, 6) позиций заняты. poisson - два независимых
+    пуассоновских потока с интенсивностью rate_cps каждый; antibunched - одиночный излучатель
+    с мёртвым временем dead_time_ns за светоделителем 50/50 (g2(0) = 0) с той же средней
+    интенсивностью на канал. Доля loss пакетов теряется (package_id при этом продолжает расти).
+    """
+
+    def __init__(self, rate_cps=1e6, statistics=POISSON, dead_time_ns=20.0, loss=0.0, packet_period_ns=5000.0,
+                 flag_every=1000, odmr_every=100, seed=None):
+        if statistics == ANTIBUNCHED and dead_time_ns >= 1e9 / (2 * rate_cps):
+            raise ValueError("Мёртвое время излучателя больше среднего интервала между фотонами")
+        self.rate_cps = rate_cps
+        self.statistics = statistics
+        self.dead_time_ns = dead_time_ns
+        self.loss = loss
+        self.packet_period_ns = packet_period_ns
+        self.flag_every = flag_every
+        self.odmr_every = odmr_every
+        self.rng = np.random.default_rng(seed)
+        self.packets = 0
+        self._last_emission = 0.0
+
+    def photons(self, start_ns, stop_ns):
+        """Времена фотонов каналов 1 и 2 в интервале [start_ns, stop_ns)"""
+        if self.statistics == POISSON:
+            def channel():
+                count = self.rng.poisson(self.rate_cps * (stop_ns - start_ns) / 1e9)
+                return np.sort(self.rng.uniform(start_ns, stop_ns, count))
+            return channel(), channel()
+
+        mean_gap = 1e9 / (2 * self.rate_cps) - self.dead_time_ns
+        emissions = []
+        last = max(self._last_emission, start_ns)
+        while last < stop_ns:
+            count = int((stop_ns - last) * 1.1 / (mean_gap + self.dead_time_ns)) + 16
+            times = last + np.cumsum(self.dead_time_ns + self.rng.exponential(mean_gap, count))
+            emissions.append(times[times < stop_ns])
+            last = times[-1]
+        self._last_emission = last
+        emissions = np.concatenate(emissions) if emissions else np.empty(0)
+        channel = self.rng.random(len(emissions)) < 0.5
+        return emissions[channel], emissions[~channel]
+
+    def _pack(self, times, start_ns, count):
+        # Метки раскладываются по пакетам, лишние сверх 6 на канал отбрасываются
+        index = ((times - start_ns) // self.packet_period_ns).astype(np.int64)
+        slot = np.arange(len(times)) - np.searchsorted(index, index)
+        kept = slot < TIMESTAMPS_PER_CHANNEL
+        raw = np.zeros((count, TIMESTAMPS_PER_CHANNEL), dtype=np.uint32)
+        # Нулевая метка реального события неотличима от пустой позиции - сдвигается на шаг точной части
+        raw[index[kept], slot[kept]] = np.maximum(encode_timestamps(times[kept]), 1)
+        return raw, np.bincount(index, minlength=count)
+
+    def generate(self, count) -> np.ndarray:
+        """
+        Следующие count пакетов (до потерь)
+
+        Returns:
+            np.ndarray: полезные нагрузки формы (n, 64), n <= count
+        """
+        start_ns = self.packets * self.packet_period_ns
+        stop_ns = start_ns + count * self.packet_period_ns
+        times1, times2 = self.photons(start_ns, stop_ns)
+        tp1, photons1 = self._pack(times1, start_ns, count)
+        tp2, photons2 = self._pack(times2, start_ns, count)
+
+        numbers = self.packets + np.arange(count)
+        records = np.zeros(count, dtype=PAYLOAD_DTYPE)
+        records['package_id'] = numbers % (1 << 16)
+        flag = (numbers % self.flag_every == 0) if self.flag_every else np.zeros(count, dtype=bool)
+        marker = (numbers % self.odmr_every == 0) if self.odmr_every else np.zeros(count, dtype=bool)
+        records['flags'] = 0x1 | (flag.astype(np.uint8) << 7) | (marker.astype(np.uint8) << 4)
+        records['cnt_photon_1'] = np.minimum(photons1, 0xFFFF)
+        records['cnt_photon_2'] = np.minimum(photons2, 0xFFFF)
+        records['tp1'] = tp1
+        records['tp2'] = tp2
+        # Точка ODMR: сумма фотонов обоих каналов за пакет
+        total = np.where(marker, np.minimum(photons1 + photons2, 0xFFFFFF), 0).astype(np.uint32)
+        records['count_pos'] = np.stack((total & 0xFF, (total >> 8) & 0xFF, total >> 16), axis=1)
+        self.packets += count
+
+        if self.loss:
+            records = records[self.rng.random(count) >= self.loss]
+        return records.view(np.uint8).reshape(-1, PAYLOAD_SIZE)
+
+
+class SyntheticReceiver:
+    """
+    Источник пакетов SyntheticSource с интерфейсом живых приёмников
+
+    realtime: пакеты выдаются с темпом 1 / packet_period_ns; иначе - максимально быстро.
+    """
+
+    def __init__(self, source=None, realtime=True, max_packets=4096, timeout_ms=20):
+        self.source = source or SyntheticSource()
+        self.realtime = realtime
+        self.max_packets = max_packets
+        self.timeout_ms = timeout_ms
+        self.bad_packets = 0
+        self._start = None
+
+    def open(self):
+        self._start = time.monotonic_ns()
+        self._first = self.source.packets
+        return f"synthetic://{self.source.statistics} {self.source.rate_cps:.0f} 1/с"
+
+    def read_block(self, max_packets=-1) -> np.ndarray:
+        limit = self.max_packets if max_packets < 0 else min(max_packets, self.max_packets)
+        if self.realtime:
+            due = self._first + int((time.monotonic_ns() - self._start) / self.source.packet_period_ns)
+            limit = min(limit, due - self.source.packets)
+            if limit <= 0:
+                time.sleep(min(self.source.packet_period_ns / 1e9, self.timeout_ms / 1000))
+                return np.empty((0, PAYLOAD_SIZE), dtype=np.uint8)
+        return self.source.generate(limit)
+
+    def close(self):
+        self._start = None
@@ -0,0 +1,103 @@
+import datetime
+import json
+import os
+
+import numpy as np
+
+from hardware.counter_packet import COARSE_STEP_NS, TIMESTAMP_CHANNELS, as_records, timestamp_mask
+
+# Точная часть метки - 5 младших бит
+FINE_CODES = 32
+FINE_MASK = FINE_CODES - 1
+CHANNELS = TIMESTAMP_CHANNELS
+# Таблицы хранятся по одной на устройство (источник захвата)
+CALIBRATION_DIR = "calibration"
+# Минимум событий на канал для надёжной оценки ширины кодов
+MIN_EVENTS = 100_000
+
+
+class TdcCalibration:
+    """
+    Таблица перевода кода точной части метки во время для каждого канала
+
+    Строится по тесту плотности кодов: для некоррелированных со счётчиком событий число
+    попаданий в код пропорционально его ширине, поэтому ширины кодов нормируются на шаг
+    грубой части, а времени кода соответствует середина его интервала.
+    """
+
+    def __init__(self, widths_ns: np.ndarray, device=None, events=None, created=None):
+        """
+        Args:
+            widths_ns (np.ndarray): ширины кодов точной части, нс, форма (каналы, 32)
+        """
+        self.widths_ns = np.asarray(widths_ns, dtype=np.float64).reshape(len(CHANNELS), FINE_CODES)
+        self.fine_ns = np.cumsum(self.widths_ns, axis=1) - self.widths_ns / 2
+        self.device = device
+        self.events = events or [0] * len(CHANNELS)
+        self.created = created or datetime.datetime.now().isoformat(timespec="seconds")
+
+    @classmethod
+    def from_code_density(cls, counts: np.ndarray, device=None):
+        """
+        Args:
+            counts (np.ndarray): число событий каждого кода, форма (каналы, 32)
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        if np.any(totals < MIN_EVENTS):
+            raise ValueError(f"Недостаточно событий для калибровки: {totals.ravel().astype(int).tolist()}")
+        return cls(COARSE_STEP_NS * counts / totals, device, totals.ravel().astype(int).tolist())
+
+    def dnl(self) -> np.ndarray:
+        """Дифференциальная нелинейность встречающихся кодов в долях их средней ширины (0 - для остальных)"""
+        used = self.widths_ns > 0
+        mean = COARSE_STEP_NS / used.sum(axis=1, keepdims=True)
+        return np.where(used, self.widths_ns / mean - 1, 0)
+
+    def to_ns(self, raw: np.ndarray, channel: int) -> np.ndarray:
+        """Переводит сырые метки канала в наносекунды по таблице"""
+        return self.fine_ns[channel][raw & FINE_MASK] + (raw >> 7) * COARSE_STEP_NS
+
+    def save(self, path=None) -> str:
+        path = path or calibration_path(self.device)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"device": self.device, "created": self.created, "events": self.events,
+                       "widths_ns": self.widths_ns.tolist()}, f, indent=1)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["widths_ns"], data["device"], data["events"], data["created"])
+
+
+def calibration_path(device) -> str:
+    return os.path.join(CALIBRATION_DIR, f"{device}.json")
+
+
+def load_calibration(device):
+    """Таблица устройства или None, если устройство не калибровалось"""
+    path = calibration_path(device)
+    return TdcCalibration.load(path) if os.path.exists(path) else None
+
+
+def code_density(payloads) -> np.ndarray:
+    """
+    Число событий каждого кода точной части по каналам
+
+    Args:
+        payloads: блок полезных нагрузок (см. as_records)
+
+    Returns:
+        np.ndarray: форма (каналы, 32)
+    """
+    records = as_records(payloads)
+    counts = np.zeros((len(CHANNELS), FINE_CODES), dtype=np.int64)
+    valid = (records['flags'] & 0x1) == 1
+    for channel, name in enumerate(CHANNELS):
+        raw = records[name][valid]
+        fine = (raw & FINE_MASK)[timestamp_mask(raw)]
+        counts[channel] = np.bincount(fine, minlength=FINE_CODES)
+    return counts
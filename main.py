@@ -1,9 +1,15 @@
+import argparse
+import multiprocessing
+import sys
+
 from PyQt6.QtWidgets import QPushButton
 from PyQt6.QtCore import QCoreApplication
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QTabWidget
 from QtLogger import QtLogger
 
+from acquisition.bus import ACQUISITION_MODE, ACQUISITION_MODES, set_acquisition_mode
+
 from ui.CorrelationTab import CorrelationTab
 from ui.PhotonCounterWindow import PhotonCounterWindow
 from ui.ImpulseTab import ImpulseTab
@@ -67,9 +73,17 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == '__main__':
+    # Нужно для процесса захвата (acquisition.shm) в сборке PyInstaller
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--acquisition-mode", choices=ACQUISITION_MODES, default=ACQUISITION_MODE,
+                        help="thread - захват в потоке, process - в отдельном процессе "
+                             "(по умолчанию SNV_ACQUISITION_MODE или thread)")
+    args, qt_args = parser.parse_known_args()
+    set_acquisition_mode(args.acquisition_mode)
     QCoreApplication.setApplicationName("ΣNV")
     QCoreApplication.setOrganizationDomain("NANOCENTER")
-    app = QApplication([])
+    app = QApplication(sys.argv[:1] + qt_args)
     window = MainWindow()
     window.show()
     app.exec()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from analysis.archive import RunArchive, load_archive, restore_correlator
+from analysis.correlator import TimelineCorrelator
+
+
+def run(correlator, packets):
+    correlator.accumulate(np.ones(correlator.num_bins), {"packets": packets, "singles1": packets,
+                                                         "singles2": packets, "duration_ns": 1000 * packets})
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    correlator = TimelineCorrelator()
+    archive = RunArchive(str(tmp_path / "run.snvrun"), correlator, events=True)
+    run(correlator, 10)
+    archive.write_events({"t1": np.arange(5), "t2": np.arange(3)})
+    archive.close(correlator)
+    return archive.path
+
+
+def test_new_run_overwrites_existing_archive(archive_path):
+    correlator = TimelineCorrelator()
+    RunArchive(archive_path, correlator, events=True).close(correlator)
+
+    archive = load_archive(archive_path)
+    assert len(archive["meta"]["checkpoints"]) == 1
+    assert archive["meta"]["checkpoints"][0]["packets"] == 0
+    assert archive["t1"] is None and archive["t2"] is None
+
+
+def test_resume_requires_restored_correlator(archive_path):
+    with pytest.raises(ValueError):
+        RunArchive(archive_path, TimelineCorrelator(), resume=True)
+
+    correlator = restore_correlator(load_archive(archive_path))
+    archive = RunArchive(archive_path, correlator, events=True, resume=True)
+    run(correlator, 5)
+    archive.close(correlator)
+
+    archive = load_archive(archive_path)
+    assert [point["packets"] for point in archive["meta"]["checkpoints"]] == [10, 15]
+    assert len(archive["t1"]) == 5
+    np.testing.assert_array_equal(archive["histograms"][-1], 2 * np.ones(correlator.num_bins))
+
+
+def test_events_after_last_checkpoint_are_dropped(tmp_path):
+    correlator = TimelineCorrelator()
+    archive = RunArchive(str(tmp_path / "run.snvrun"), correlator, events=True)
+    run(correlator, 10)
+    archive.write_events({"t1": np.arange(5), "t2": np.arange(3)})
+    archive.checkpoint(correlator)
+    # Обрыв: события следующих заданий дошли до диска, контрольной точки для них нет
+    archive.write_events({"t1": np.arange(5, 9), "t2": np.arange(3, 4)})
+    archive.close()
+
+    loaded = load_archive(archive.path)
+    assert [point["events"] for point in loaded["meta"]["checkpoints"]] == [{"t1": 5, "t2": 3}]
+    np.testing.assert_array_equal(loaded["t1"], np.arange(5))
+    np.testing.assert_array_equal(loaded["t2"], np.arange(3))
+
+    restored = restore_correlator(loaded)
+    resumed = RunArchive(archive.path, restored, events=True, resume=True)
+    resumed.write_events({"t1": np.array([100]), "t2": np.empty(0, dtype=np.int64)})
+    run(restored, 1)
+    resumed.close(restored)
+
+    loaded = load_archive(archive.path)
+    np.testing.assert_array_equal(loaded["t1"], [0, 1, 2, 3, 4, 100])
+    assert [point["packets"] for point in loaded["meta"]["checkpoints"]] == [10, 11]
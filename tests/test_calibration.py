@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from hardware.counter_packet import PAYLOAD_DTYPE, COARSE_STEP_NS, FINE_STEP_NS, decode_payloads
+from hardware.tdc_calibration import TdcCalibration, CHANNELS, FINE_CODES, MIN_EVENTS, code_density
+
+# Коды точной части, которые успевает пройти TDC за шаг грубой части
+USED_CODES = 28
+
+
+def uniform_counts(events=MIN_EVENTS * 2):
+    counts = np.zeros((len(CHANNELS), FINE_CODES))
+    counts[:, :USED_CODES] = events // USED_CODES
+    return counts
+
+
+def make_records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(count, dtype=PAYLOAD_DTYPE)
+    records['flags'] = 1
+    for channel in CHANNELS:
+        fine = rng.integers(0, USED_CODES, (count, 6))
+        coarse = rng.integers(1, 1 << 20, (count, 6))
+        records[channel] = (coarse << 7) | fine
+    return records
+
+
+def test_uniform_histogram_gives_linear_table():
+    calibration = TdcCalibration.from_code_density(uniform_counts())
+
+    step = COARSE_STEP_NS / USED_CODES
+    codes = np.arange(USED_CODES)
+    for channel in range(len(CHANNELS)):
+        np.testing.assert_allclose(calibration.fine_ns[channel][:USED_CODES], (codes + 0.5) * step)
+    np.testing.assert_allclose(calibration.dnl(), 0, atol=1e-12)
+
+
+def test_skewed_histogram_moves_bin_centres():
+    counts = uniform_counts()
+    # Код 3 вдвое шире, код 10 вдвое уже
+    counts[0, 3] *= 2
+    counts[0, 10] /= 2
+    calibration = TdcCalibration.from_code_density(counts)
+    uniform = TdcCalibration.from_code_density(uniform_counts())
+
+    widths = calibration.widths_ns[0]
+    assert widths[3] == pytest.approx(2 * widths[2])
+    assert widths[10] == pytest.approx(widths[2] / 2)
+    assert widths.sum() == pytest.approx(COARSE_STEP_NS)
+    # Время кода - середина его интервала
+    centres = [widths[:code].sum() + widths[code] / 2 for code in range(FINE_CODES)]
+    np.testing.assert_allclose(calibration.fine_ns[0], centres)
+    fine = calibration.fine_ns[0]
+    assert fine[3] - fine[2] == pytest.approx(1.5 * widths[2])
+    assert fine[4] - fine[3] == pytest.approx(1.5 * widths[2])
+    assert fine[11] - fine[10] == pytest.approx(0.75 * widths[2])
+    np.testing.assert_allclose(calibration.fine_ns[1], uniform.fine_ns[1])
+
+
+def test_too_few_events_are_rejected():
+    counts = uniform_counts()
+    counts[1] = 0
+    counts[1, :USED_CODES] = 1
+    with pytest.raises(ValueError):
+        TdcCalibration.from_code_density(counts)
+
+
+def test_json_round_trip(tmp_path):
+    counts = uniform_counts()
+    counts[0, 5] *= 3
+    calibration = TdcCalibration.from_code_density(counts, device="udp")
+
+    loaded = TdcCalibration.load(calibration.save(str(tmp_path / "udp.json")))
+
+    np.testing.assert_array_equal(loaded.widths_ns, calibration.widths_ns)
+    np.testing.assert_array_equal(loaded.fine_ns, calibration.fine_ns)
+    assert (loaded.device, loaded.events, loaded.created) == \
+           (calibration.device, calibration.events, calibration.created)
+
+
+def test_code_density_counts_valid_packets_only():
+    records = make_records(100)
+    records['flags'][:10] = 0
+
+    counts = code_density(records)
+
+    assert counts.sum(axis=1).tolist() == [90 * 6, 90 * 6]
+    assert counts[:, USED_CODES:].sum() == 0
+
+
+def test_nominal_table_matches_uncalibrated_decoding():
+    records = make_records(200)
+    # Таблица с номинальной шириной кодов: время кода - середина его интервала
+    calibration = TdcCalibration(np.full((len(CHANNELS), FINE_CODES), FINE_STEP_NS))
+
+    calibrated = decode_payloads(records, calibration)
+    for channel in CHANNELS:
+        raw = records[channel].astype(np.int64)
+        expected = (raw & 0x1F) * FINE_STEP_NS + (raw >> 7) * COARSE_STEP_NS
+        np.testing.assert_allclose(calibrated[channel] - FINE_STEP_NS / 2, expected, rtol=0, atol=1e-6)
+        # Без калибровки метки округлены до 0.1 нс
+        np.testing.assert_allclose(decode_payloads(records)[channel], expected, rtol=0, atol=0.05 + 1e-6)
+        np.testing.assert_array_equal(calibrated[f"{channel}_valid"], decode_payloads(records)[f"{channel}_valid"])
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from analysis.coincidence import CoincidenceCounter
+
+TAU_MAX_PS = 100_000
+
+
+def make_jobs(streams, splits=()):
+    """Задания как у TimelineCorrelator.stitch: новые события блока и хвосты предыдущих в пределах TAU_MAX_PS"""
+    bounds = [-np.inf, *splits, np.inf]
+    jobs = []
+    tails = [np.empty(0, dtype=np.int64) for _ in streams]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        block = [t[(t >= lo) & (t < hi)] for t in streams]
+        job = {"duration_ns": 1.0}
+        for i, (t, tail) in enumerate(zip(block, tails), 1):
+            job.update({f"t{i}": t, f"tail{i}": tail})
+        jobs.append(job)
+        events = np.concatenate(block)
+        if len(events):
+            horizon = events.max() - TAU_MAX_PS
+            tails = [np.concatenate((tail, t)) for tail, t in zip(tails, block)]
+            tails = [tail[tail > horizon] for tail in tails]
+    return jobs
+
+
+def count(counter, streams, splits=()):
+    for job in make_jobs(streams, splits):
+        counter.accumulate(counter.histogram(job))
+    return counter
+
+
+def brute_force(streams, window_ps, groups=()):
+    """Жадные окна перебором; последнее окно не закрыто и не учитывается"""
+    events = sorted((t, c) for c, stream in enumerate(streams) for t in stream)
+    folds = np.zeros(len(streams), dtype=np.int64)
+    group_counts = np.zeros(len(groups), dtype=np.int64)
+    windows = []
+    i = 0
+    while i < len(events):
+        opened = events[i][0]
+        present = set()
+        while i < len(events) and events[i][0] <= opened + window_ps:
+            present.add(events[i][1])
+            i += 1
+        windows.append(present)
+    for present in windows[:-1]:
+        folds[:len(present)] += 1
+        for g, group in enumerate(groups):
+            group_counts[g] += set(group) <= present
+    return folds, group_counts
+
+
+def streams_of(*times):
+    return [np.array(t, dtype=np.int64) for t in times]
+
+
+def test_pair_counts_once():
+    counter = count(CoincidenceCounter(channels=2, pairs=[]), streams_of([1000, 50_000], [1500, 90_000]))
+
+    # Окна: {0, 1} при 1 нс, {0}; последнее {1} ещё открыто
+    assert counter.coincidences.tolist() == [2, 1]
+
+
+def test_triple_adds_one_to_each_fold():
+    counter = count(CoincidenceCounter(channels=3, pairs=[], groups=[(0, 2)]),
+                    streams_of([1000, 80_000], [1200], [1900]))
+
+    assert counter.coincidences.tolist() == [1, 1, 1]
+    assert counter.group_coincidences.tolist() == [1]
+
+
+def test_window_edge_is_inclusive():
+    inside = count(CoincidenceCounter(channels=2, pairs=[]), streams_of([1000, 80_000], [2000]))
+    outside = count(CoincidenceCounter(channels=2, pairs=[]), streams_of([1000, 80_000], [2001]))
+
+    assert inside.coincidences.tolist() == [1, 1]
+    # Событие за границей открывает своё окно
+    assert outside.coincidences.tolist() == [2, 0]
+
+
+def test_window_continues_into_next_job():
+    streams = streams_of([1000, 80_000], [1800])
+    whole = count(CoincidenceCounter(channels=2, pairs=[]), streams)
+    split = count(CoincidenceCounter(channels=2, pairs=[]), streams, splits=[1500])
+
+    assert split.coincidences.tolist() == whole.coincidences.tolist() == [1, 1]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    channels = 3
+    # Плотные пачки, чтобы окна часто цепляли соседние события и пересекали границы заданий
+    streams = [np.sort(rng.integers(0, 2_000_000, 400)) for _ in range(channels)]
+    groups = [(0, 1), (0, 1, 2)]
+    splits = np.sort(rng.integers(0, 2_000_000, 7))
+    counter = count(CoincidenceCounter(channels=channels, pairs=[], window_ns=5, groups=groups), streams, splits)
+
+    folds, group_counts = brute_force(streams, 5000, groups)
+    assert counter.coincidences.tolist() == folds.tolist()
+    assert counter.group_coincidences.tolist() == group_counts.tolist()
+
+
+def test_pair_histogram_matches_brute_force():
+    rng = np.random.default_rng(1)
+    streams = [np.sort(rng.integers(0, 5_000_000, 300)) for _ in range(2)]
+    counter = count(CoincidenceCounter(channels=2, pairs=[(0, 1)], tau_max_ns=20, bin_width_ns=1),
+                    streams, splits=[2_500_000])
+
+    delta = (streams[0][:, None] - streams[1][None, :]).ravel() / 1000
+    expected, _ = np.histogram(delta, bins=counter.bins)
+    np.testing.assert_array_equal(counter.correlation(0, 1), expected)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from acquisition.sequence import SequenceTracker
+from analysis.correlator import TimelineCorrelator, job_counters
+from analysis.timeresolved import TimeResolvedG2
+from hardware.counter_packet import decode_payloads
+from hardware.synthetic import SyntheticSource
+
+
+@pytest.fixture
+def correlator():
+    correlator = TimelineCorrelator()
+    # Отсчёт только в бине tau = 0 и по одному в каждом исходном бине
+    correlator.hist[:] = 1
+    correlator.hist[correlator.half_bins] = 1000
+    return correlator
+
+
+@pytest.mark.parametrize("factor", [1, 2, 3, 4, 10])
+def test_view_keeps_zero_delay_in_central_bin(correlator, factor):
+    edges, counts = correlator.view(factor * correlator.bin_width_ns, 50)
+
+    assert len(counts) % 2 == 1
+    middle = len(counts) // 2
+    assert counts[middle] == 1000 + factor - 1
+    assert edges[middle] <= 0 < edges[middle + 1]
+    np.testing.assert_allclose(np.diff(edges), factor * correlator.bin_width_ns)
+    # Стороны симметричны и не выходят за запрошенный диапазон
+    assert abs(edges[0] + edges[-1]) <= correlator.bin_width_ns * (1 + 1e-6)
+    assert edges[-1] <= 50 + correlator.bin_width_ns
+
+
+def test_view_bin_wider_than_range(correlator):
+    edges, counts = correlator.view(5, 1)
+
+    assert len(counts) == 1
+    assert counts[0] == 1000 + 49
+
+
+def test_g2_zero_of_uncorrelated_streams_is_one():
+    source = SyntheticSource(rate_cps=1e6, packet_period_ns=1000, seed=3)
+    correlator = TimelineCorrelator()
+    sequence = SequenceTracker()
+    for _ in range(100):
+        job = correlator.stitch(sequence.accept(decode_payloads(source.generate(20000))))
+        correlator.accumulate(correlator.histogram(job), job_counters(job))
+
+    # Окно уже периода точной шкалы расширяется до него
+    g2_zero, error = correlator.g2_zero(correlator.bin_width_ns / 2)
+    assert abs(g2_zero - 1) < 4 * error
+
+
+def test_time_resolved_bins_are_centred_on_zero_delay():
+    resolved = TimeResolvedG2(tau_max_ns=10, bin_width_ns=1.0)
+    ticks = TimelineCorrelator.TICKS_PER_NS
+    empty = np.empty(0, dtype=np.int64)
+    t2 = np.array([0, 100, 200]) * 1000 * ticks
+    deltas = np.array([0, -0.4, 1.0]) * ticks
+    first, partial = resolved.histogram({"t1": (t2 + deltas).astype(np.int64), "t2": t2,
+                                         "tail1": empty, "tail2": empty})
+
+    assert resolved.num_bins == 21
+    assert resolved.tau_max_ns == 10.5
+    counts = partial.sum(axis=0)
+    assert counts[resolved.half_bins] == 2
+    assert counts[resolved.half_bins + 1] == 1
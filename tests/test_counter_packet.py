@@ -0,0 +1,95 @@
+import struct
+
+import numpy as np
+import pytest
+
+from hardware.counter_packet import PAYLOAD_SIZE, PAYLOAD_DTYPE, decode_payloads, timestamp_mask
+
+# Раскладка полезной нагрузки по описанию прошивки, независимо от PAYLOAD_DTYPE
+PAYLOAD_STRUCT = struct.Struct("<xHxxBHH6I6I3sHx")
+
+
+def reference_decode(payload: bytes) -> dict:
+    package_id, flags, cnt1, cnt2, *rest = PAYLOAD_STRUCT.unpack(payload)
+    tp1, tp2, (count_pos, count_neg) = rest[:6], rest[6:12], rest[12:]
+
+    def to_ns(raw):
+        return round((raw & 0x1F) * 0.18, 1) + round((raw >> 7) * 5, 1)
+
+    return {
+        "package_id": package_id,
+        "flag": flags >> 7 & 1,
+        "flag_valid": flags & 1,
+        "flag_pos": flags >> 4 & 1,
+        "flag_neg": flags >> 3 & 1,
+        "cnt_photon_1": cnt1,
+        "cnt_photon_2": cnt2,
+        "count_pos": int.from_bytes(count_pos, "little"),
+        "count_neg": count_neg,
+        "tp1": [to_ns(raw) for raw in tp1],
+        "tp1_valid": [raw != 0 for raw in tp1],
+        "tp2": [to_ns(raw) for raw in tp2],
+        "tp2_valid": [raw != 0 for raw in tp2],
+    }
+
+
+def random_payloads(count, seed):
+    rng = np.random.default_rng(seed)
+    payloads = rng.integers(0, 256, (count, PAYLOAD_SIZE), dtype=np.uint8)
+    # Незанятые позиции меток - нулевые слова в любых позициях
+    slots = payloads[:, 10:58].view('<u4')
+    slots[rng.random(slots.shape) < 0.3] = 0
+    return payloads
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_decode_matches_struct_reference(seed):
+    payloads = random_payloads(500, seed)
+
+    decoded = decode_payloads(payloads.tobytes())
+
+    assert PAYLOAD_STRUCT.size == PAYLOAD_SIZE
+    for row, payload in enumerate(payloads):
+        expected = reference_decode(payload.tobytes())
+        for key, value in expected.items():
+            if key in ("tp1", "tp2"):
+                np.testing.assert_allclose(decoded[key][row], value, rtol=0, atol=1e-6, err_msg=key)
+            else:
+                np.testing.assert_array_equal(decoded[key][row], value, err_msg=key)
+
+
+def test_flag_bits_are_independent():
+    payloads = np.zeros((4, PAYLOAD_SIZE), dtype=np.uint8)
+    payloads[:, 5] = [0x80, 0x10, 0x08, 0x01]
+
+    decoded = decode_payloads(payloads)
+
+    assert decoded["flag"].tolist() == [1, 0, 0, 0]
+    assert decoded["flag_pos"].tolist() == [0, 1, 0, 0]
+    assert decoded["flag_neg"].tolist() == [0, 0, 1, 0]
+    assert decoded["flag_valid"].tolist() == [0, 0, 0, 1]
+
+
+def test_zero_timestamp_inside_packet_is_unused():
+    raw = np.array([[5, 0, 7, 0, 0, 0]], dtype=np.uint32)
+
+    assert timestamp_mask(raw).tolist() == [[True, False, True, False, False, False]]
+    # По счётчику заняты первые позиции, нулевая метка среди них - событие
+    assert timestamp_mask(raw, np.array([3])).tolist() == [[True, True, True, False, False, False]]
+
+
+def test_slot_counts_limit_filled_slots():
+    records = np.zeros(3, dtype=PAYLOAD_DTYPE)
+    records['tp1'] = np.arange(1, 7)
+    records['tp2'] = np.arange(1, 7)
+    # cnt_photon меньше числа заполненных позиций, равен нулю и больше их числа
+    records['cnt_photon_1'] = [2, 0, 9]
+    records['cnt_photon_2'] = [6, 1, 4]
+
+    counted = decode_payloads(records, slot_counts=True)
+    by_value = decode_payloads(records, slot_counts=False)
+
+    assert counted["tp1_valid"].sum(axis=1).tolist() == [2, 0, 6]
+    assert counted["tp2_valid"].sum(axis=1).tolist() == [6, 1, 4]
+    assert counted["tp1_valid"][0].tolist() == [True, True, False, False, False, False]
+    assert by_value["tp1_valid"].all() and by_value["tp2_valid"].all()
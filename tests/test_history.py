@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from analysis.history import CountHistory
+
+
+def fill(history, count, seed=0):
+    values = np.random.default_rng(seed).random((count, history.channels)) * 100
+    for i, value in enumerate(values):
+        history.append(float(i), value)
+    return values
+
+
+def groups(values, span):
+    """Точки, объединяющие по span исходных: (начало, минимум, максимум, сумма, число)"""
+    complete = len(values) // span * span
+    blocks = values[:complete].reshape(-1, span, values.shape[1])
+    return np.arange(0, complete, span), blocks.min(axis=1), blocks.max(axis=1), blocks.sum(axis=1), span
+
+
+@pytest.mark.parametrize("count", [3, 8, 13, 30])
+def test_levels_keep_true_extremes(count):
+    history = CountHistory(capacity=4, levels=4)
+    values = fill(history, count)
+
+    # Уровень level объединяет по 2 ** level исходных точек; хранятся последние capacity
+    for number, level in enumerate(history.levels[:-1]):
+        time, low, high, total, counts = level.view()
+        start, expected_low, expected_high, expected_total, span = groups(values, 2 ** number)
+        kept = slice(max(len(start) - history.capacity, 0), None)
+        np.testing.assert_array_equal(time, start[kept])
+        np.testing.assert_array_equal(low, expected_low[kept])
+        np.testing.assert_array_equal(high, expected_high[kept])
+        np.testing.assert_allclose(total, expected_total[kept])
+        assert np.all(counts == span)
+
+
+def test_oldest_points_are_trimmed_at_capacity():
+    history = CountHistory(capacity=4, levels=3)
+    fill(history, 6)
+
+    level = history.levels[0]
+    assert len(history) == 6
+    assert len(level) == 4
+    assert not level.complete
+    np.testing.assert_array_equal(level.view()[0], [2, 3, 4, 5])
+    assert history.levels[1].complete
+    np.testing.assert_array_equal(history.levels[1].view()[0], [0, 2, 4])
+
+
+def test_last_level_covers_whole_session():
+    history = CountHistory(capacity=4, levels=2)
+    values = fill(history, 64)
+
+    level = history.levels[-1]
+    time, low, high, total, counts = level.view()
+    # Последний уровень попарно объединяет точки вместо вытеснения, все точки - одинаковой длины
+    assert time[0] == 0
+    assert level.span == 32
+    assert counts.tolist() == [32, 32]
+    start, expected_low, expected_high, expected_total, _ = groups(values, 32)
+    np.testing.assert_array_equal(time, start)
+    np.testing.assert_array_equal(low, expected_low)
+    np.testing.assert_array_equal(high, expected_high)
+    np.testing.assert_allclose(total, expected_total)
+
+
+def test_window_picks_finest_covering_level():
+    history = CountHistory(capacity=8, levels=4)
+    values = fill(history, 40)
+
+    recent = history.window(35, 39, max_points=10)
+    assert recent["level"] == 0
+    np.testing.assert_array_equal(recent["time"], [35, 36, 37, 38, 39])
+
+    # Уровни 0 и 1 не хранят начало сеанса
+    whole = history.window(0, 39, max_points=10)
+    assert whole["level"] == 3
+    np.testing.assert_array_equal(whole["time"], [0, 8, 16, 24, 32])
+    np.testing.assert_allclose(whole["mean"][0], values[:8].mean(axis=0))
+    np.testing.assert_array_equal(whole["min"][1], values[8:16].min(axis=0))
+    np.testing.assert_array_equal(whole["max"][1], values[8:16].max(axis=0))
+
+
+def test_odd_capacity_is_rejected():
+    with pytest.raises(ValueError):
+        CountHistory(capacity=5)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from analysis.odmr import SweepAccumulator
+
+
+def reference(num_points, counts):
+    """Попакетное накопление: позиция проходит 0..num_points, последняя - служебная"""
+    data = np.zeros(num_points)
+    point = sweeps = 0
+    for count in counts:
+        if point < num_points:
+            data[point] += count
+        point += 1
+        if point == num_points + 1:
+            point = 0
+            sweeps += 1
+    return data, point, sweeps
+
+
+def test_wrap_skips_service_point():
+    sweep = SweepAccumulator(3)
+
+    points = sweep.add(np.array([1, 2, 3, 100, 10, 20]))
+
+    assert points.tolist() == [0, 1, 2, 3, 0, 1]
+    assert sweep.data.tolist() == [11, 22, 3]
+    assert (sweep.current_point, sweep.increment_sweep) == (2, 1)
+
+
+@pytest.mark.parametrize("sizes", [[1] * 25, [4, 4, 4, 4, 4, 5], [25], [7, 0, 11, 7], [3, 13, 9]])
+def test_batches_match_packet_by_packet(sizes):
+    num_points = 4
+    counts = np.arange(1, sum(sizes) + 1, dtype=np.float64)
+    sweep = SweepAccumulator(num_points)
+
+    points = []
+    for batch in np.split(counts, np.cumsum(sizes)[:-1]):
+        points.extend(sweep.add(batch).tolist())
+
+    data, point, sweeps = reference(num_points, counts)
+    np.testing.assert_array_equal(sweep.data, data)
+    assert (sweep.current_point, sweep.increment_sweep) == (point, sweeps)
+    assert points == [i % (num_points + 1) for i in range(len(counts))]
+    assert sweep.updates == len(sizes)
+
+
+def test_reset():
+    sweep = SweepAccumulator(2)
+    sweep.add(np.array([5, 6, 7, 8]))
+
+    sweep.reset()
+
+    assert sweep.data.tolist() == [0, 0]
+    assert (sweep.current_point, sweep.increment_sweep, sweep.updates) == (0, 0, 0)
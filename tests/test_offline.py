@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from acquisition.recording import RawRecorder, load_chunks
+from acquisition.sequence import SequenceTracker
+from analysis.correlator import TimelineCorrelator, job_counters
+from analysis.offline import offline_g2
+from hardware.counter_packet import decode_payloads
+from hardware.synthetic import SyntheticSource
+
+
+def serial_g2(index_path):
+    correlator = TimelineCorrelator()
+    sequence = SequenceTracker()
+    for records in load_chunks(index_path):
+        job = correlator.stitch(sequence.accept(decode_payloads(np.ascontiguousarray(records['payload']))))
+        correlator.accumulate(correlator.histogram(job), job_counters(job))
+    return correlator
+
+
+def test_offline_g2_matches_serial_stitching(tmp_path):
+    source = SyntheticSource(rate_cps=2e6, packet_period_ns=1000, loss=0.001, seed=4)
+    recorder = RawRecorder(str(tmp_path / "run.snvidx"), chunk_packets=7000)
+    for _ in range(5):
+        recorder.write(source.generate(4000))
+    recorder.close()
+
+    expected = serial_g2(recorder.index_path)
+    correlator = offline_g2(recorder.index_path, workers=2, job_packets=1500)
+
+    np.testing.assert_array_equal(correlator.hist, expected.hist)
+    for key in ("packets", "singles1", "singles2"):
+        assert getattr(correlator, key) == getattr(expected, key)
+    assert correlator.duration_ns == pytest.approx(expected.duration_ns)
+    assert correlator.hist.sum() > 0
+
+
+def test_offline_progress_reaches_recorded_total(tmp_path):
+    source = SyntheticSource(rate_cps=1e6, packet_period_ns=1000, seed=5)
+    recorder = RawRecorder(str(tmp_path / "run.snvidx"), chunk_packets=3000)
+    for _ in range(3):
+        payloads = source.generate(2000)
+        # Пакеты без бита валидности входят в запись, но не в счётчик пакетов коррелятора
+        payloads[::10, 5] &= 0xFE
+        recorder.write(payloads)
+    recorder.close()
+
+    updates = []
+    correlator = offline_g2(recorder.index_path, workers=2, job_packets=700,
+                            progress=lambda done, total, rate: updates.append((done, total)))
+
+    done = [update[0] for update in updates]
+    assert all(total == 6000 for _, total in updates)
+    assert done == sorted(done) and done[-1] == 6000
+    assert correlator.packets < 6000
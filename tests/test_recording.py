@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from acquisition.recording import RawRecorder, ReplayReceiver, load_chunks, RECORD_DTYPE
+from hardware.counter_packet import PAYLOAD_SIZE
+
+
+def make_payloads(first, count):
+    rng = np.random.default_rng(first)
+    payloads = rng.integers(0, 256, (count, PAYLOAD_SIZE), dtype=np.uint8)
+    payloads[:, 1:3] = np.arange(first, first + count, dtype='<u2').view(np.uint8).reshape(-1, 2)
+    return payloads
+
+
+def replay_all(index_path):
+    receiver = ReplayReceiver(index_path, speed=0, max_packets=7)
+    receiver.open()
+    blocks = []
+    while not receiver.finished:
+        blocks.append(receiver.read_block())
+    receiver.close()
+    return np.concatenate(blocks), receiver.replayed
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "run.snvidx")
+
+
+def test_round_trip_across_chunk_rotation(index_path):
+    blocks = [make_payloads(0, 5), make_payloads(5, 12), make_payloads(17, 3)]
+    recorder = RawRecorder(index_path, chunk_packets=8)
+    for t_ns, block in enumerate(blocks, 1):
+        recorder.write(block.tobytes(), t_ns=t_ns)
+    recorder.close()
+
+    with open(index_path) as f:
+        index = json.load(f)
+    assert index["packets"] == 20
+    assert [chunk["packets"] for chunk in index["chunks"]] == [8, 8, 4]
+    assert [(chunk["first_t_ns"], chunk["last_t_ns"]) for chunk in index["chunks"]] == [(1, 2), (2, 2), (2, 3)]
+
+    chunks = load_chunks(index_path)
+    assert [len(chunk) for chunk in chunks] == [8, 8, 4]
+    np.testing.assert_array_equal(np.concatenate([chunk['t_ns'] for chunk in chunks]),
+                                  [1] * 5 + [2] * 12 + [3] * 3)
+
+    replayed, count = replay_all(index_path)
+    assert count == 20
+    assert replayed.tobytes() == np.concatenate(blocks).tobytes()
+
+
+def test_unclosed_recording_is_read_by_file_size(index_path):
+    recorder = RawRecorder(index_path, chunk_packets=8)
+    recorder.write(make_payloads(0, 11), t_ns=1)
+    # Обрыв процесса: данные дошли до диска, индекс остался от последней ротации
+    recorder._file.flush()
+    with open(recorder.base + "_00001.snvraw", "ab") as f:
+        # Недописанная последняя запись
+        f.write(b"\xff" * (RECORD_DTYPE.itemsize // 2))
+
+    with open(index_path) as f:
+        index = json.load(f)
+    assert [chunk["packets"] for chunk in index["chunks"]] == [8, 0]
+
+    assert [len(chunk) for chunk in load_chunks(index_path)] == [8, 3]
+    replayed, _ = replay_all(index_path)
+    assert replayed.tobytes() == make_payloads(0, 11).tobytes()
+    recorder.close()
+
+
+def test_unclosed_recording_before_first_rotation(index_path):
+    recorder = RawRecorder(index_path, chunk_packets=8)
+    recorder.write(make_payloads(0, 4), t_ns=1)
+    recorder._file.flush()
+
+    replayed, _ = replay_all(index_path)
+    assert replayed.tobytes() == make_payloads(0, 4).tobytes()
+    recorder.close()
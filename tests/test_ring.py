@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from acquisition.ring import COLUMNS, PhotonRing
+
+
+def make_batch(first, count):
+    batch = {name: np.zeros((count,) + shape, dtype=dtype) for name, (dtype, shape) in COLUMNS.items()}
+    batch["package_id"] = np.arange(first, first + count, dtype=np.uint16)
+    batch["tp1"] = np.arange(first, first + count, dtype=np.float64)[:, None] + np.zeros(6)
+    return batch
+
+
+def ids(window):
+    return window["package_id"].tolist()
+
+
+def test_wraparound_keeps_order():
+    ring = PhotonRing(8)
+    for first in range(0, 20, 3):
+        assert ring.append(make_batch(first, 3)) == first
+
+    assert ring.head == 21
+    assert len(ring) == 8
+    assert ring.oldest == 13
+    assert ids(ring.since(ring.oldest)) == list(range(13, 21))
+    np.testing.assert_array_equal(ring.since(13)["tp1"][:, 0], np.arange(13, 21))
+
+
+def test_append_longer_than_capacity_keeps_last_rows():
+    ring = PhotonRing(5)
+    ring.append(make_batch(0, 2))
+    first = ring.append(make_batch(100, 12))
+
+    assert first == 2
+    assert ring.head == 14
+    assert ids(ring.since(0)) == list(range(107, 112))
+
+
+def test_append_from_start_row():
+    ring = PhotonRing(5)
+    ring.append(make_batch(0, 4), start=3)
+
+    assert ring.head == 1
+    assert ids(ring.last(1)) == [3]
+
+
+@pytest.mark.parametrize("head", [9, 12, 15])
+def test_views_across_mirror_boundary_are_contiguous(head):
+    ring = PhotonRing(8)
+    ring.append(make_batch(0, head))
+
+    window = ring.window(head - 7, head - 1)
+    assert ids(window) == list(range(head - 7, head - 1))
+    # Окна - представления колонок кольца без копирования
+    assert np.shares_memory(window["package_id"], ring.columns["package_id"])
+    assert ids(ring.last(8)) == list(range(head - 8, head))
+    assert ids(ring.since(head - 3)) == list(range(head - 3, head))
+
+
+def test_window_is_clamped_to_stored_rows():
+    ring = PhotonRing(4)
+    ring.append(make_batch(0, 10))
+
+    assert ids(ring.since(0)) == [6, 7, 8, 9]
+    assert ids(ring.last(100)) == [6, 7, 8, 9]
+    assert ids(ring.window(8, 100)) == [8, 9]
+    assert ids(ring.since(10)) == []
+
+
+def test_shared_buffer_and_readonly_view():
+    buffer = bytearray(PhotonRing.buffer_size(4))
+    writer = PhotonRing(4, buffer=buffer)
+    reader = PhotonRing(4, buffer=buffer, readonly=True)
+    writer.append(make_batch(0, 6))
+
+    assert reader.head == 6
+    assert ids(reader.since(0)) == [2, 3, 4, 5]
+    with pytest.raises(ValueError):
+        reader.append(make_batch(10, 1))
+    with pytest.raises(ValueError):
+        reader.since(0)["package_id"][0] = 1
@@ -0,0 +1,31 @@
+import numpy as np
+
+from acquisition.sequence import SequenceTracker
+
+
+def track(*blocks):
+    tracker = SequenceTracker()
+    for block in blocks:
+        tracker.update(np.array(block))
+    return tracker
+
+
+def test_stale_repeat_is_duplicate_not_recovered_loss():
+    tracker = track([1, 2, 3, 5, 2])
+    assert (tracker.lost, tracker.duplicated, tracker.reordered) == (1, 1, 0)
+
+
+def test_late_missing_id_credits_loss_once():
+    tracker = track([1, 2, 3, 5], [4], [4], [5])
+    assert (tracker.lost, tracker.duplicated, tracker.reordered) == (0, 2, 1)
+
+
+def test_ids_before_start_are_duplicates():
+    tracker = track([10, 11], [5])
+    assert (tracker.lost, tracker.duplicated, tracker.reordered) == (0, 1, 0)
+
+
+def test_wraparound_is_tracked():
+    ids = list(range(65530, 65536)) + list(range(0, 5)) + [2, 65535]
+    tracker = track(ids)
+    assert (tracker.lost, tracker.duplicated, tracker.reordered) == (0, 2, 0)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from acquisition.bus import Subscriber, DROP_OLDEST, DROP_NEWEST
+
+
+def make_batch(first, count):
+    return {"package_id": np.arange(first, first + count, dtype=np.uint16)}
+
+
+@pytest.fixture
+def notifications():
+    return []
+
+
+def subscriber(notifications, **kwargs):
+    subscriber = Subscriber("test", **kwargs)
+    # Прямое соединение: слот вызывается синхронно в put()
+    subscriber.batch_ready.connect(lambda: notifications.append(len(subscriber)))
+    return subscriber
+
+
+def ids(batches):
+    return [int(batch["package_id"][0]) for batch in batches]
+
+
+def test_drop_oldest_keeps_newest_batches(notifications):
+    queue = subscriber(notifications, max_batches=3, drop_policy=DROP_OLDEST)
+
+    results = [queue.put(make_batch(first, first + 1)) for first in range(5)]
+
+    assert results == [True] * 5
+    assert ids(queue.take()) == [2, 3, 4]
+    assert (queue.dropped_batches, queue.dropped_packets) == (2, 1 + 2)
+
+
+def test_drop_newest_rejects_incoming_batches(notifications):
+    queue = subscriber(notifications, max_batches=3, drop_policy=DROP_NEWEST)
+
+    results = [queue.put(make_batch(first, first + 1)) for first in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert ids(queue.take()) == [0, 1, 2]
+    assert (queue.dropped_batches, queue.dropped_packets) == (2, 4 + 5)
+
+
+@pytest.mark.parametrize("policy", [DROP_OLDEST, DROP_NEWEST])
+@pytest.mark.parametrize("max_batches", [1, 3])
+def test_batch_ready_only_when_queue_was_empty(notifications, policy, max_batches):
+    queue = subscriber(notifications, max_batches=max_batches, drop_policy=policy)
+
+    for first in range(5):
+        queue.put(make_batch(first, 1))
+    assert notifications == [1]
+
+    queue.take()
+    queue.put(make_batch(5, 1))
+    queue.put(make_batch(6, 1))
+    assert notifications == [1, 1]
+
+
+def test_take_batch_concatenates_queue(notifications):
+    queue = subscriber(notifications)
+    queue.put(make_batch(0, 2))
+    queue.put(make_batch(2, 3))
+
+    assert queue.take_batch()["package_id"].tolist() == [0, 1, 2, 3, 4]
+    assert queue.take_batch() is None
+    assert len(queue) == 0
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        Subscriber("test", drop_policy="drop_all")
@@ -0,0 +1,79 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from hardware.counter_packet import PAYLOAD_SIZE, PAYLOAD_DTYPE, decode_payloads
+from hardware.counter_receiver import UdpReceiver
+
+
+@pytest.fixture
+def receiver():
+    receiver = UdpReceiver(host="127.0.0.1", port=0, source_host="127.0.0.1", timeout_ms=50)
+    receiver.open()
+    yield receiver
+    receiver.close()
+
+
+@pytest.fixture
+def sender():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield sock
+    sock.close()
+
+
+def make_payloads(count, seed):
+    """Валидные пакеты с последовательными номерами и случайными метками"""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(count, dtype=PAYLOAD_DTYPE)
+    records['package_id'] = np.arange(count)
+    records['flags'] = 1
+    records['cnt_photon_1'] = rng.integers(0, 7, count)
+    records['cnt_photon_2'] = rng.integers(0, 7, count)
+    records['tp1'] = rng.integers(1, 1 << 32, (count, 6), dtype=np.uint32)
+    records['tp2'] = rng.integers(1, 1 << 32, (count, 6), dtype=np.uint32)
+    return records.view(np.uint8).reshape(count, PAYLOAD_SIZE)
+
+
+def read_packets(receiver, count, timeout_s=2.0):
+    # Датаграммы могут прийти за несколько пробуждений
+    blocks = []
+    deadline = time.monotonic() + timeout_s
+    while sum(len(block) for block in blocks) < count * PAYLOAD_SIZE and time.monotonic() < deadline:
+        blocks.append(bytes(receiver.read_block()))
+    return b"".join(blocks)
+
+
+def test_read_block_returns_decoded_packets(receiver, sender):
+    payloads = make_payloads(32, seed=1)
+    for payload in payloads:
+        sender.sendto(payload.tobytes(), receiver.sock.getsockname())
+
+    data = read_packets(receiver, len(payloads))
+
+    assert data == payloads.tobytes()
+    received = decode_payloads(data)
+    expected = decode_payloads(payloads)
+    for key, values in expected.items():
+        np.testing.assert_array_equal(received[key], values)
+    assert receiver.bad_packets == 0
+
+
+def test_wrong_size_datagrams_are_counted(receiver, sender):
+    payload = make_payloads(1, seed=2)[0].tobytes()
+    address = receiver.sock.getsockname()
+    sender.sendto(payload[:10], address)
+    sender.sendto(payload + b"\0", address)
+    sender.sendto(payload, address)
+
+    assert read_packets(receiver, 1) == payload
+    assert receiver.bad_packets == 2
+
+
+def test_timeout_returns_empty_block(receiver):
+    started = time.monotonic()
+    block = receiver.read_block()
+
+    assert len(block) == 0
+    assert time.monotonic() - started >= receiver.timeout_ms / 1000 * 0.9
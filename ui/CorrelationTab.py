@@ -1,16 +1,26 @@
-import struct
+import threading
 import time
 from collections import deque
 
 import numpy as np
 import pyqtgraph as pg
-from PyQt6.QtCore import QThread, pyqtSignal
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog
-from fast_histogram import histogram1d
-from matplotlib.backends.backend_qt import NavigationToolbar2QT
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal, QRectF
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QLabel, QComboBox, \
+    QDoubleSpinBox, QCheckBox, QSpinBox
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
-import pcapy
+
+from acquisition.bus import Subscriber, get_bus, open_replay, DEFAULT_SOURCE, CONSUMER_RING_CAPACITY
+from acquisition.ring import PhotonRing
+from analysis.correlator import TimelineCorrelator, NATIVE_BIN_NS, NATIVE_TAU_MAX_NS, G2_ZERO_MIN_HALF_WIDTH_NS, \
+    job_counters
+from analysis.coincidence import CoincidenceCounter
+from analysis.archive import RunArchive, load_archive, restore_correlator
+from analysis.offline import offline_g2, calibrate_recording
+from analysis.timeresolved import TimeResolvedG2
+from analysis.history import CountHistory
+from hardware.counter_packet import select
+from hardware.tdc_calibration import load_calibration
 
 class MplCanvas(FigureCanvasQTAgg):
 
@@ -19,209 +29,297 @@ class MplCanvas(FigureCanvasQTAgg):
         self.axes = fig.add_subplot(111)
         super(MplCanvas, self).__init__(fig)
 
-class CounterWorker(QThread):
-    def __init__(self, *args):
-        super(CounterWorker, self).__init__()
-        self.args = args
-        self.interval = 0.1
-        self.window_size = 100
-        self.canvas = self.args[0]
-        self.photon_data = self.args[1]
-        self.x_data = np.linspace(0, self.window_size, self.window_size)
-        self.y_data_0 = np.zeros(self.window_size)
-        self.y_data_1 = np.zeros(self.window_size)
-        self.line_0, = self.canvas.axes.plot(self.x_data, self.y_data_0, lw=2, color="red", label="Канал 0")
-        self.line_1, = self.canvas.axes.plot(self.x_data, self.y_data_1, lw=2, color="blue", label="Канал 1")
-        self.canvas.axes.set_xticks([])
-        self.canvas.axes.set_title("Счёт фотонов")
-        self.canvas.axes.set_xlabel('Время')
-        self.canvas.axes.set_ylabel('Отсчеты')
-        self.canvas.axes.legend(loc="upper right")
-        self.canvas.axes.grid()
-        self.is_killed = False
-
-    def run(self):
-        while not self.is_killed:
-            try:
-                data_point_0 = self.photon_data[-1]['cnt_photon_1']
-                data_point_1 = self.photon_data[-1]['cnt_photon_2']
-            except Exception:
-                data_point_0 = 0
-                data_point_1 = 0
-
-            self.y_data_0 = np.roll(self.y_data_0, -1)
-            self.y_data_1 = np.roll(self.y_data_1, -1)
+class CounterView(QWidget):
+    """
+    График счёта фотонов каналов за весь сеанс
+
+    Суммы cnt_photon копятся в add() по мере прихода блоков, по таймеру в потоке GUI из них
+    получается точка кадра - частота счёта, сумма отсчётов после предыдущей точки, делённая на
+    измеренное время с неё. Поэтому значения не зависят ни от периода обновления, ни от размера
+    блоков. Кадр без новых пакетов не перерисовывается. Точки копятся в CountHistory, поэтому сеанс любой длительности можно
+    прокручивать и масштабировать по времени; показывается уровень истории с не более чем
+    одной точкой на пиксель - среднее и полоса минимум-максимум. В режиме "Следовать"
+    видны последние window_s секунд.
+    """
+
+    def __init__(self, refresh_ms=100, window_s=10.0, parent=None):
+        super().__init__(parent)
+        self.running = False
+        # Отсчёты каналов и число пакетов, пришедших после предыдущей точки
+        self.counts = np.zeros(2)
+        self.packets = 0
+        self.history = CountHistory(channels=2)
+        self.started = None
+        self.last_time = 0.0
+        self._drawing = False
 
-            self.y_data_0[-1] = data_point_0
-            self.y_data_1[-1] = data_point_1
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setTitle("Счёт фотонов", size="13pt")
+        self.plot_widget.setLabel("left", "Частота счёта [1/с]", size="13pt")
+        self.plot_widget.setLabel("bottom", "Время [с]", size="13pt")
+        self.plot_widget.showGrid(x=True, y=True)
+        self.plot_widget.addLegend(offset=(-10, 10))
+        # Прокрутка и масштаб - только по времени, шкала отсчётов подстраивается под видимые точки
+        self.plot_widget.setMouseEnabled(x=True, y=False)
+        self.plot_widget.enableAutoRange(axis="y")
+        self.plot_widget.setAutoVisible(y=True)
+        self.curves = []
+        self.bands = []
+        for color, band_color, name in (("r", (255, 0, 0, 60), "Канал 0"), ("b", (0, 0, 255, 60), "Канал 1")):
+            self.curves.append(self.plot_widget.plot(pen=pg.mkPen(color, width=2), name=name))
+            low, high = self.plot_widget.plot(pen=None), self.plot_widget.plot(pen=None)
+            self.plot_widget.addItem(pg.FillBetweenItem(low, high, brush=pg.mkBrush(band_color)))
+            self.bands.append((low, high))
+        view_box = self.plot_widget.getViewBox()
+        view_box.sigRangeChangedManually.connect(lambda *args: self.follow_box.setChecked(False))
+        view_box.sigXRangeChanged.connect(self.range_changed)
+
+        self.refresh_spin = QSpinBox()
+        self.refresh_spin.setPrefix("Обновление: ")
+        self.refresh_spin.setSuffix(" мс")
+        self.refresh_spin.setRange(20, 5000)
+        self.refresh_spin.setValue(refresh_ms)
+        self.refresh_spin.valueChanged.connect(self.settings_changed)
+        self.window_spin = QDoubleSpinBox()
+        self.window_spin.setPrefix("Окно: ")
+        self.window_spin.setSuffix(" с")
+        self.window_spin.setDecimals(1)
+        self.window_spin.setRange(1, 3600)
+        self.window_spin.setValue(window_s)
+        self.window_spin.valueChanged.connect(self.settings_changed)
+        self.follow_box = QCheckBox("Следовать")
+        self.follow_box.setChecked(True)
+        self.follow_box.toggled.connect(self.settings_changed)
+
+        settings_layout = QHBoxLayout()
+        settings_layout.addWidget(self.refresh_spin)
+        settings_layout.addWidget(self.window_spin)
+        settings_layout.addWidget(self.follow_box)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.plot_widget)
+        layout.addLayout(settings_layout)
+        self.setLayout(layout)
 
-            max_data = max(np.max(self.y_data_0),np.max(self.y_data_1))
-            min_data = min(np.min(self.y_data_0),np.min(self.y_data_1))
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_trace)
+        self.settings_changed()
 
-            self.canvas.axes.set_xlim(0, 100)
-            self.canvas.axes.set_ylim(min_data, max_data + 5)
+    def settings_changed(self):
+        self.timer.setInterval(self.refresh_spin.value())
+        self._draw()
 
-            self.line_0.set_ydata(self.y_data_0)
-            self.line_1.set_ydata(self.y_data_1)
+    def start(self):
+        """Начинает новый сеанс по пакетам, добавленным после вызова"""
+        self.running = True
+        self.counts[:] = 0
+        self.packets = 0
+        self.history.reset()
+        self.started = time.monotonic()
+        self.last_time = 0.0
+        self.follow_box.setChecked(True)
+        self._draw()
+        self.timer.start()
 
-            self.canvas.draw()
-            self.canvas.flush_events()
+    def stop(self):
+        self.timer.stop()
+        self.running = False
 
-            # FIXME Обновление каждые 100 мс, можно вынести потом в отдельную переменную
-            time.sleep(0.1)
+    def add(self, batch):
+        """Учитывает отсчёты каналов разобранного блока"""
+        if not self.running:
+            return
+        self.counts += (batch["cnt_photon_1"].sum(), batch["cnt_photon_2"].sum())
+        self.packets += len(batch["cnt_photon_1"])
+
+    def range_changed(self):
+        # Прокрутка и масштаб пользователем: выборка готовых точек истории для нового диапазона
+        if not self._drawing:
+            self._draw()
+
+    def _draw(self):
+        view_box = self.plot_widget.getViewBox()
+        if self.follow_box.isChecked():
+            start, stop = self.last_time - self.window_spin.value(), self.last_time
+            self._drawing = True
+            self.plot_widget.setXRange(start, stop, padding=0)
+            self._drawing = False
+        else:
+            start, stop = view_box.viewRange()[0]
+        points = self.history.window(start, stop, max(int(view_box.width()), 100))
+        for channel, (curve, (low, high)) in enumerate(zip(self.curves, self.bands)):
+            curve.setData(points["time"], points["mean"][:, channel])
+            low.setData(points["time"], points["min"][:, channel])
+            high.setData(points["time"], points["max"][:, channel])
+
+    def update_trace(self):
+        if not self.running or not self.packets:
+            return
+        now = time.monotonic() - self.started
+        interval = max(now - self.last_time, 1e-3)
+        self.last_time = now
+        self.history.append(self.last_time, self.counts / interval)
+        self.counts[:] = 0
+        self.packets = 0
+        self._draw()
 
-        self.canvas.axes.clear()
-        self.canvas.axes.cla()
 
 class HistWorker(QThread):
-    result_ready = pyqtSignal(np.ndarray)
-
-    def __init__(self, logger, data, bins, tau_max_ns):
+    """
+    Постоянный поток расчёта гистограмм g2 с ограниченной очередью заданий
+
+    Все задания, накопившиеся за время предыдущего расчёта, объединяются в одно
+    (см. TimelineCorrelator.merge_jobs), поэтому при высокой частоте флаговых пакетов
+    число расчётов падает, а данные не теряются. Результаты выдаются в порядке заданий
+    вместе с коррелятором, для которого они посчитаны.
+    """
+    # Коррелятор, гистограмма задания и само задание (счётчики и события для архива)
+    result_ready = pyqtSignal(object, np.ndarray, object)
+    # Срезы g2(tau, t) задания: коррелятор, номер первого исходного среза, массив срезов
+    resolved_ready = pyqtSignal(object, object, object)
+    # Совпадения задания: коррелятор, счётчик, для которого они посчитаны, частичный результат
+    coincidences_ready = pyqtSignal(object, object, object)
+
+    def __init__(self, logger, max_pending=16):
         super().__init__()
         self.logger = logger
-        self.data = data
-        self.bins = bins
-        self.tau_max_ns = tau_max_ns
+        self.max_pending = max_pending
+        self.results_emitted = 0
+        # TimeResolvedG2 или None; задаётся из потока GUI
+        self.resolved = None
+        # CoincidenceCounter или None; задаётся из потока GUI
+        self.coincidences = None
+        self.coalesced_jobs = 0
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self.is_killed = False
+
+    def submit(self, correlator, job):
+        """Ставит задание в очередь; при заполнении очереди оно объединяется с последним"""
+        with self._condition:
+            if len(self._pending) >= self.max_pending and self._pending[-1][0] is correlator:
+                self._pending[-1][1].append(job)
+            else:
+                self._pending.append((correlator, [job]))
+            self._condition.notify()
+
+    def _next(self):
+        # Все ожидающие задания текущего коррелятора объединяются в одно
+        with self._condition:
+            while not self._pending and not self.is_killed:
+                self._condition.wait()
+            if self.is_killed:
+                return None, None
+            correlator, jobs = self._pending.popleft()
+            while self._pending and self._pending[0][0] is correlator:
+                jobs.extend(self._pending.popleft()[1])
+        self.coalesced_jobs += len(jobs) - 1
+        return correlator, correlator.merge_jobs(jobs)
 
     def run(self):
-        deltas = np.concatenate([np.subtract.outer(t1, t2).ravel() for t1, t2 in self.data])
-        valid = deltas[(deltas > -self.tau_max_ns) & (deltas < self.tau_max_ns)]
-        hist = histogram1d(valid, bins=len(self.bins) - 1, range=(-self.tau_max_ns, self.tau_max_ns))
+        while True:
+            correlator, job = self._next()
+            if correlator is None:
+                break
+            resolved = self.resolved
+            coincidences = self.coincidences
+            try:
+                hist = correlator.histogram(job)
+                if resolved is not None:
+                    self.resolved_ready.emit(correlator, *resolved.histogram(job))
+                if coincidences is not None:
+                    self.coincidences_ready.emit(correlator, coincidences, coincidences.histogram(job))
+            except Exception as e:
+                self.logger.log(f"Ошибка расчёта гистограммы: {str(e)}", "Error", "HistWorker")
+                continue
+            self.results_emitted += 1
+            self.result_ready.emit(correlator, hist, job)
 
-        self.result_ready.emit(hist)
+    def stop(self):
+        """Отбрасывает очередь и дожидается завершения текущего расчёта"""
+        with self._condition:
+            self.is_killed = True
+            self._pending.clear()
+            self._condition.notify()
+        self.wait()
 
 
-class SniffThread(QThread):
-    packet_signal = pyqtSignal(dict)
+class OfflineWorker(QThread):
+    """Пересчёт g2 по записанному потоку в пуле процессов"""
+    progress = pyqtSignal(int, int, float)
+    finished_analysis = pyqtSignal(object)
 
-    def __init__(self, logger):
+    def __init__(self, logger, index_path):
         super().__init__()
         self.logger = logger
-        self.running = True
-        self.cap = None
+        self.index_path = index_path
 
     def run(self):
-        #self.logger.log("I am photon counter", "Info", "SniffThread")
-
         try:
-
-            self.cap = pcapy.open_live("Ethernet", 106, 0, 0)
-            self.cap.setfilter("udp and src host 192.168.1.2")
-
-            self.logger.log("Sniffer started on 'Ethernet'", "Info", "SniffThread")
-
-            # Основной цикл захвата пакетов
-            self.cap.loop(0, self.packet_callback)
-
+            correlator = offline_g2(self.index_path, progress=self.progress.emit,
+                                    calibration=load_calibration(DEFAULT_SOURCE))
         except Exception as e:
-            self.logger.log(f"Sniffer error: {e}", "Error", "SniffThread")
-
-    def packet_callback(self, header, packet):
-        """Обработка каждого пакета"""
-        #print("Got packet")
-        if not self.running:
-            return
-
-        try:
-            # Пропускаем Ethernet/IP/UDP заголовки
-            payload = packet[42:]
-
-            # Проверка размера
-            if len(payload) < 64:
-                self.logger.log("Некорректный размер пакета", "Error", "packet_callback")
-                return
-
-            # Распаковка служебных байт
-            package_id = struct.unpack('<H', payload[1:3])[0]
-            byte6 = struct.unpack('<B', payload[5:6])[0]
-
-            flag = (byte6 >> 7) & 1
-            flag_valid = byte6 & 0x1
-            flag_pos = (byte6 & 0x10) >> 4
-            flag_neg = (byte6 & 0x8) >> 3
-
-            # Счётчики фотонов
-            cnt_photon_1 = struct.unpack('<H', payload[6:8])[0]
-            cnt_photon_2 = struct.unpack('<H', payload[8:10])[0]
-
-            # Временные метки TP1
-            tp1 = [int.from_bytes(payload[10 + 4 * i:14 + 4 * i], byteorder="little") for i in range(6)]
-            tp1_a = [np.round((t & 0x1F) * 0.18, 1) for t in tp1]  # ns
-            tp1_b = [np.round((t >> 7) * 5, 1) for t in tp1]        # ns
-            tp1_r = [a + b for a, b in zip(tp1_a, tp1_b)]
-
-            # Временные метки TP2
-            tp2 = [int.from_bytes(payload[34 + 4 * i:38 + 4 * i], byteorder="little") for i in range(6)]
-            tp2_a = [np.round((t & 0x1F) * 0.18, 1) for t in tp2]  # ns
-            tp2_b = [np.round((t >> 7) * 5, 1) for t in tp2]        # ns
-            tp2_r = [a + b for a, b in zip(tp2_a, tp2_b)]
-
-            # Формируем результат
-            result = {
-                "package_id": package_id,
-                "flag": flag,
-                "flag_valid": flag_valid,
-                "flag_neg": flag_neg,
-                "flag_pos": flag_pos,
-                "cnt_photon_1": cnt_photon_1,
-                "cnt_photon_2": cnt_photon_2,
-                "tp1_r": np.array(list(set(tp1_r))),
-                "tp2_r": np.array(list(set(tp2_r))),
-            }
-
-            # Передаём результат, если пакет валиден
-            if flag_valid == 1:
-                print("signal emitted")
-                self.packet_signal.emit(result)
-
-        except Exception as e:
-            self.logger.log(f"Неудачный парсинг пакета: {e}", "Error", "packet_callback")
-
-    def stop(self):
-        """Останавливает цикл cap.loop()"""
-        self.running = False
-        try:
-            if self.cap:
-                self.cap.breakloop()  # прерывает cap.loop()
-                self.logger.log("Sniffer stopped", "Info", "SniffThread")
-        except Exception as e:
-            self.logger.log(f"Error stopping sniffer: {e}", "Error", "SniffThread")
-        self.quit()
+            self.logger.log(f"Ошибка анализа записи: {str(e)}", "Error", "OfflineWorker")
+            correlator = None
+        self.finished_analysis.emit(correlator)
 
 
 class CorrelationTab(QWidget):
     def __init__(self, logger):
         super().__init__()
-        self.plot_thread = None
         self.logger = logger
-        self.photon_data = deque(maxlen=10000)
+        self.photon_data = PhotonRing(CONSUMER_RING_CAPACITY)
         self.hist_data = None
         self.bins = None
         self.tau_max_ns = 100
         self.bin_width_ns = 0.1
         self.num_bins = None
+        self.correlator = None
+        # Коррелятор, восстановленный из архива, продолжается при следующем старте
+        self.resume_correlator = None
+        self.archive_path = None
+        # Продолжать ли выбранный архив (загруженный) или начать его заново (выбранный для записи)
+        self.archive_resume = False
+        self.archive = None
         self.init = False
+        self.hist_worker = HistWorker(self.logger)
+        self.hist_worker.result_ready.connect(self.update_plot)
+        self.hist_worker.resolved_ready.connect(self.update_heatmap)
+        self.hist_worker.coincidences_ready.connect(self.update_coincidences)
+        self.hist_worker.start()
+        # Вкладка не получает closeEvent при закрытии главного окна
+        QApplication.instance().aboutToQuit.connect(self.hist_worker.stop)
 
         layout = QVBoxLayout()
 
         main_layout = QHBoxLayout()
 
-        self.canvas = MplCanvas(self, width=5, height=4, dpi=90)
+        self.counter_view = CounterView()
 
         self.plot_widget = pg.PlotWidget()
         self.plot_widget.setTitle("g2", size="13pt")
         self.plot_widget.setLabel("left", "Счёты", size="13pt")
         self.plot_widget.setLabel("bottom", "Время [нс]", size="13pt")
         self.plot_widget.showGrid(x=True, y=True)
+        # Постоянные элементы графика g2 обновляются через setData, а не создаются заново
+        self.hist_curve = self.plot_widget.plot(stepMode="center", fillLevel=0)
+        self.error_bars = pg.ErrorBarItem(x=np.empty(0), y=np.empty(0), height=np.empty(0))
+        self.plot_widget.addItem(self.error_bars)
 
-        counter_layout = QVBoxLayout()
-        toolbar = NavigationToolbar2QT(self.canvas, self)
-        counter_layout.addWidget(toolbar)
-        counter_layout.addWidget(self.canvas)
-
-        main_layout.addLayout(counter_layout, stretch=1)
+        main_layout.addWidget(self.counter_view, stretch=1)
         main_layout.addWidget(self.plot_widget, stretch=1)
 
+        # g2(tau, t): карта по срезам времени, показывается в режиме с разрешением по времени
+        self.heatmap_widget = pg.PlotWidget()
+        self.heatmap_widget.setTitle("g2(τ, t)", size="13pt")
+        self.heatmap_widget.setLabel("left", "τ [нс]", size="13pt")
+        self.heatmap_widget.setLabel("bottom", "Время [с]", size="13pt")
+        self.heatmap_image = pg.ImageItem()
+        self.heatmap_image.setColorMap(pg.colormap.get("viridis"))
+        self.heatmap_widget.addItem(self.heatmap_image)
+        self.heatmap_widget.hide()
+        main_layout.addWidget(self.heatmap_widget, stretch=1)
+
         control_layout = QHBoxLayout()
         self.control_button = QPushButton("Старт")
         self.control_button.clicked.connect(self.control_button_clicked)
@@ -231,84 +329,462 @@ class CorrelationTab(QWidget):
         self.load_button = QPushButton("Загрузить гистограмму")
         self.load_button.clicked.connect(self.load_histogram)
 
+        self.record_button = QPushButton("Записать поток")
+        self.record_button.clicked.connect(self.record_button_clicked)
+        self.replay_button = QPushButton("Воспроизвести запись")
+        self.replay_button.clicked.connect(self.replay_button_clicked)
+        self.analyze_button = QPushButton("Анализ записи")
+        self.analyze_button.clicked.connect(self.analyze_button_clicked)
+        self.offline_worker = None
+        self.archive_button = QPushButton("Архив запуска")
+        self.archive_button.clicked.connect(self.archive_button_clicked)
+        self.archive_events_box = QCheckBox("с событиями")
+        self.calibrate_button = QPushButton("Калибровка TDC")
+        self.calibrate_button.clicked.connect(self.calibrate_button_clicked)
+        self.replay_speed = QComboBox()
+        self.replay_speed.addItems(["x1", "x10", "x100", "макс"])
+
+        # Представление g2: шаг и диапазон меняются без перезапуска накопления
+        self.bin_width_spin = QDoubleSpinBox()
+        self.bin_width_spin.setPrefix("Бин: ")
+        self.bin_width_spin.setSuffix(" нс")
+        self.bin_width_spin.setDecimals(1)
+        self.bin_width_spin.setRange(NATIVE_BIN_NS, 50)
+        self.bin_width_spin.setSingleStep(NATIVE_BIN_NS)
+        self.bin_width_spin.setValue(self.bin_width_ns)
+        self.bin_width_spin.valueChanged.connect(self.view_changed)
+        self.tau_spin = QDoubleSpinBox()
+        self.tau_spin.setPrefix("±τ: ")
+        self.tau_spin.setSuffix(" нс")
+        self.tau_spin.setDecimals(1)
+        self.tau_spin.setRange(1, NATIVE_TAU_MAX_NS)
+        self.tau_spin.setValue(self.tau_max_ns)
+        self.tau_spin.valueChanged.connect(self.view_changed)
+        self.normalize_box = QCheckBox("Нормировать g2")
+        self.normalize_box.toggled.connect(self.view_changed)
+        # Отрисовка g2 не чаще заданной частоты кадров, независимо от частоты результатов
+        self.fps_spin = QSpinBox()
+        self.fps_spin.setPrefix("Кадров/с: ")
+        self.fps_spin.setRange(1, 60)
+        self.fps_spin.setValue(20)
+        self.fps_spin.valueChanged.connect(lambda fps: self.render_timer.setInterval(1000 // fps))
+        self.resolved_box = QCheckBox("g2(τ, t)")
+        self.resolved_box.toggled.connect(self.resolved_toggled)
+        self.resolved = None
+        # Частоты совпадений каналов в окне (без гистограмм, их даёт g2)
+        self.coincidence_box = QCheckBox("Совпадения")
+        self.coincidence_box.toggled.connect(self.coincidences_toggled)
+        self.coincidence_window_spin = QDoubleSpinBox()
+        self.coincidence_window_spin.setPrefix("Окно: ")
+        self.coincidence_window_spin.setSuffix(" нс")
+        self.coincidence_window_spin.setDecimals(1)
+        self.coincidence_window_spin.setRange(NATIVE_BIN_NS, 50)
+        self.coincidence_window_spin.setSingleStep(NATIVE_BIN_NS)
+        self.coincidence_window_spin.setValue(1)
+        self.coincidence_window_spin.valueChanged.connect(self.coincidences_toggled)
+        self.coincidences = None
+
         control_layout.addWidget(self.control_button)
         control_layout.addWidget(self.save_button)
         control_layout.addWidget(self.load_button)
+        control_layout.addWidget(self.record_button)
+        control_layout.addWidget(self.replay_button)
+        control_layout.addWidget(self.replay_speed)
+        control_layout.addWidget(self.analyze_button)
+        control_layout.addWidget(self.archive_button)
+        control_layout.addWidget(self.archive_events_box)
+        control_layout.addWidget(self.calibrate_button)
+        control_layout.addWidget(self.bin_width_spin)
+        control_layout.addWidget(self.tau_spin)
+        control_layout.addWidget(self.normalize_box)
+        control_layout.addWidget(self.fps_spin)
+        control_layout.addWidget(self.resolved_box)
+        control_layout.addWidget(self.coincidence_box)
+        control_layout.addWidget(self.coincidence_window_spin)
 
         layout.addLayout(main_layout)
         layout.addLayout(control_layout)
 
+        # Состояние непрерывности потока пакетов
+        self.sequence_label = QLabel()
+        layout.addWidget(self.sequence_label)
+        # Скорости счёта и оценка g2(0)
+        self.g2_label = QLabel()
+        layout.addWidget(self.g2_label)
+        self.coincidence_label = QLabel()
+        layout.addWidget(self.coincidence_label)
+        # Измеренная частота кадров g2 и число результатов, не получивших отдельного кадра
+        self.render_label = QLabel()
+        layout.addWidget(self.render_label)
+        self.pending_updates = 0
+        self.heatmap_pending = False
+        self.coincidences_pending = False
+        self.dropped_frames = 0
+        self.frame_times = deque()
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(1000 // self.fps_spin.value())
+        self.render_timer.timeout.connect(self.render_frame)
+        self.render_timer.start()
+
         self.setLayout(layout)
 
-        self.sniff_thread = SniffThread(self.logger)
-        self.sniff_thread.packet_signal.connect(self.packet_received)
+        self.bus = get_bus(self.logger)
+        self.subscriber = Subscriber("CorrelationTab")
+        self.subscriber.batch_ready.connect(self.batches_received)
+        self.acquiring = False
+
+    def batches_received(self):
+        batch = self.subscriber.take_batch()
+        if batch is not None:
+            self.packets_received(batch)
+        self.update_status()
+
+    def update_status(self):
+        """Потери на приёме, в очереди подписчика и пакеты, не дошедшие до коррелятора"""
+        skipped = self.correlator.skipped_packets if self.correlator is not None else 0
+        self.sequence_label.setText(f"{self.bus.status_text()} | отброшено очередью: "
+                                    f"{self.subscriber.dropped_packets} | пропущено коррелятором: {skipped}")
+
+    def packets_received(self, batch):
+        start = 0
+        if not self.init:
+            flagged = np.flatnonzero(batch['flag'])
+            if not len(flagged):
+                return
+            start = flagged[0]
 
-    def packet_received(self, packet):
-        if not self.init and packet['flag']:
             # Инициализация при первом флаговом пакете
-            self.plot_thread = CounterWorker(self.canvas, self.photon_data)
-            self.plot_thread.start()
-            
-            self.num_bins = int(np.round(self.tau_max_ns / self.bin_width_ns))
-            self.bins = np.linspace(-self.tau_max_ns, self.tau_max_ns, self.num_bins + 1)
-            self.hist_data = np.zeros(self.num_bins)
+            self.counter_view.start()
+
+            # Накопление в исходном разрешении, шаг и диапазон графика задаются view
+            self.correlator = self.resume_correlator or TimelineCorrelator()
+            self.resume_correlator = None
             self.init = True
+            if self.archive_path:
+                self.open_archive()
+            self.refresh_view()
             self.logger.log("Инициализация гистограммы", "Info", "CorrelationTab")
 
-        if self.init:
-            self.photon_data.append(packet)
-            if packet['flag']:
-                self.process_data()
+        self.counter_view.add(select(batch, slice(start, None)))
+        # Блок дописывается частями не больше ёмкости кольца, и каждая сразу забирается коррелятором,
+        # поэтому строки не вытесняются из кольца до обработки
+        capacity = self.photon_data.capacity
+        for first in range(start, len(batch['package_id']), capacity):
+            self.photon_data.append(select(batch, slice(first, first + capacity)))
+            self.process_data()
 
     def process_data(self):
-        all_t1 = [d["tp1_r"] for d in self.photon_data]
-        all_t2 = [d["tp2_r"] for d in self.photon_data]
-
-        # Запуск расчета гистограммы
-        self.hist_worker = HistWorker(
-            self.logger,
-            list(zip(all_t1, all_t2)),
-            self.bins,
-            self.tau_max_ns
-        )
-        self.hist_worker.result_ready.connect(self.update_plot)
-        self.hist_worker.start()
+        # Только пакеты, пришедшие после предыдущего расчёта
+        data = self.correlator.take(self.photon_data)
+        if not data["packets"]:
+            return
 
-    def update_plot(self, new_hist):
+        # Передача блока постоянному потоку расчёта гистограмм
+        self.hist_worker.submit(self.correlator, data)
+
+    def update_plot(self, correlator, new_hist, job):
         try:
-            if self.hist_data is None:
+            # Результаты для коррелятора предыдущего запуска отбрасываются
+            if self.hist_data is None or correlator is not self.correlator:
                 return
 
-            # Накопление данных
-            self.hist_data += new_hist
-
-            # Обновление графика
-            self.plot_widget.clear()
-            self.plot_widget.plot(
-                self.bins,
-                self.hist_data,
-                stepMode=True,
-                fillLevel=0)
+            # Накопление данных; события архива пишутся вместе с их гистограммой
+            self.correlator.accumulate(new_hist, job_counters(job))
+            if self.archive is not None:
+                self.archive.write_events(job)
+                if self.archive.due():
+                    self.archive.checkpoint(self.correlator)
+            # График перерисовывается в ближайшем кадре render_frame
+            self.pending_updates += 1
 
         except Exception as e:
             self.logger.log(f"Ошибка обновления графика: {str(e)}", "Error", "update_plot")
 
+    def resolved_toggled(self, checked):
+        """Включает накопление g2 по срезам времени с текущего момента"""
+        self.resolved = TimeResolvedG2() if checked else None
+        self.hist_worker.resolved = self.resolved
+        self.heatmap_widget.setVisible(checked)
+        self.heatmap_image.clear()
+        self.heatmap_pending = False
+
+    def update_heatmap(self, correlator, first, partial):
+        if self.resolved is None or correlator is not self.correlator:
+            return
+        self.resolved.accumulate(first, partial)
+        # Карта перерисовывается в ближайшем кадре render_frame
+        self.heatmap_pending = True
+
+    def coincidences_toggled(self):
+        """Начинает счёт совпадений заново с текущего момента (или выключает его)"""
+        self.coincidences = None
+        if self.coincidence_box.isChecked():
+            self.coincidences = CoincidenceCounter(pairs=[], window_ns=self.coincidence_window_spin.value())
+        self.hist_worker.coincidences = self.coincidences
+        self.coincidence_label.setText("")
+        self.coincidences_pending = False
+
+    def update_coincidences(self, correlator, counter, partial):
+        # Результаты прежнего счётчика (до смены окна или перезапуска) отбрасываются
+        if counter is not self.coincidences or correlator is not self.correlator:
+            return
+        counter.accumulate(partial)
+        self.coincidences_pending = True
+
+    def update_coincidence_label(self):
+        counter = self.coincidences
+        rates = counter.rates()
+        if not rates:
+            return
+        folds = " | ".join(f"≥{k} каналов: {counter.coincidences[k - 1]} ({rate:.1f} 1/с)"
+                           for k, rate in rates.items())
+        self.coincidence_label.setText(f"Совпадения в окне {counter.window_ns:.1f} нс: {folds}")
+
+    def draw_heatmap(self):
+        image = self.resolved.image()
+        if not len(image):
+            return
+        self.heatmap_image.setImage(image, autoLevels=True)
+        self.heatmap_image.setRect(QRectF(0, -self.resolved.tau_max_ns, len(image) * self.resolved.slice_s,
+                                          2 * self.resolved.tau_max_ns))
+
+    def view_changed(self):
+        self.bin_width_ns = self.bin_width_spin.value()
+        self.tau_max_ns = self.tau_spin.value()
+        if self.correlator is not None:
+            self.refresh_view()
+
+    def render_frame(self):
+        """Кадр таймера отрисовки: график обновляется при новых результатах, если вкладка видна"""
+        now = time.monotonic()
+        while self.frame_times and now - self.frame_times[0] > 1:
+            self.frame_times.popleft()
+        if self.pending_updates and self.correlator is not None and self.isVisible():
+            self.refresh_view()
+            self.frame_times.append(now)
+            self.dropped_frames += self.pending_updates - 1
+            self.pending_updates = 0
+        if self.heatmap_pending and self.resolved is not None and self.heatmap_widget.isVisible():
+            self.draw_heatmap()
+            self.heatmap_pending = False
+        if self.coincidences_pending and self.coincidences is not None:
+            self.update_coincidence_label()
+            self.coincidences_pending = False
+        text = f"Отрисовка g2: {len(self.frame_times)} кадр/с | пропущено кадров: {self.dropped_frames}"
+        if self.render_label.text() != text:
+            self.render_label.setText(text)
+
+    def refresh_view(self):
+        """Пересчитывает отображаемую гистограмму из накопленной в исходном разрешении"""
+        self.bins, self.hist_data = self.correlator.view(self.bin_width_ns, self.tau_max_ns)
+        self.num_bins = len(self.hist_data)
+        g2, g2_error = self.correlator.normalized(self.bins, self.hist_data)
+        self.update_g2_label()
+
+        if self.normalize_box.isChecked() and g2 is not None:
+            self.plot_widget.setLabel("left", "g2", size="13pt")
+            self.draw_histogram(self.bins, g2, g2_error)
+        else:
+            self.plot_widget.setLabel("left", "Счёты", size="13pt")
+            self.draw_histogram(self.bins, self.hist_data)
+
+    def draw_histogram(self, bins, values, errors=None):
+        """Обновляет постоянные элементы графика g2 (ошибки показываются, если заданы)"""
+        self.hist_curve.setData(bins, values)
+        self.hist_curve.setFillLevel(0 if errors is None else None)
+        if errors is not None:
+            self.error_bars.setData(x=(bins[:-1] + bins[1:]) / 2, y=values, height=2 * errors)
+        self.error_bars.setVisible(errors is not None)
+
+    def update_g2_label(self):
+        correlator = self.correlator
+        if not correlator.duration_ns:
+            self.g2_label.setText("")
+            return
+        rate1 = correlator.singles1 / correlator.duration_ns * 1e9
+        rate2 = correlator.singles2 / correlator.duration_ns * 1e9
+        text = (f"Время накопления: {correlator.duration_ns / 1e9:.1f} с | "
+                f"одиночные: {rate1:.0f} / {rate2:.0f} 1/с")
+        # Окно не уже периода неравномерности точной шкалы, иначе оценка зависит от положения бинов
+        half_width_ns = max(self.bin_width_ns / 2, G2_ZERO_MIN_HALF_WIDTH_NS)
+        g2_zero, g2_zero_error = correlator.g2_zero(half_width_ns)
+        if g2_zero is not None:
+            text += f" | g2(0) = {g2_zero:.3f} ± {g2_zero_error:.3f} (±{half_width_ns:.2f} нс)"
+        self.g2_label.setText(text)
+
     def control_button_clicked(self):
-        if not self.sniff_thread.isRunning():
-            self.photon_data = deque(maxlen=10000)
+        if not self.acquiring:
+            self.photon_data.clear()
             self.hist_data = None
-
-            self.plot_widget.clear()
-            self.sniff_thread.start()
+            if self.resolved is not None:
+                self.resolved.reset()
+                self.heatmap_image.clear()
+            self.heatmap_pending = False
+            if self.coincidences is not None:
+                self.coincidences_toggled()
+
+            self.hist_curve.clear()
+            self.error_bars.setVisible(False)
+            self.pending_updates = 0
+            self.dropped_frames = 0
+            self.bus.subscribe(self.subscriber)
+            self.acquiring = True
             self.control_button.setText("Стоп")
         else:
-            self.sniff_thread.requestInterruption()
-            self.sniff_thread.terminate()
-            self.plot_thread.is_killed = True
+            self.bus.unsubscribe(self.subscriber)
+            self.subscriber.take()
+            self.bus = get_bus(self.logger)
+            self.acquiring = False
+            self.counter_view.stop()
             self.init = False
+            self.close_archive()
 
             self.control_button.setText("Старт")
 
+    def archive_button_clicked(self):
+        """Включает/выключает периодическое сохранение запуска в архив"""
+        if self.archive_path:
+            self.close_archive()
+            return
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self,
+            "Архив запуска",
+            "",
+            "Run Archive Files (*.snvrun);;All Files (*)"
+        )
+        if not filename:
+            return
+        # Замена существующего файла подтверждена в диалоге: запуск начинается заново
+        self.archive_path = filename
+        self.archive_resume = False
+        self.archive_button.setText("Закрыть архив")
+        if self.acquiring and self.correlator is not None:
+            self.open_archive()
+
+    def open_archive(self):
+        try:
+            self.archive = RunArchive(self.archive_path, self.correlator, events=self.archive_events_box.isChecked(),
+                                      resume=self.archive_resume)
+            self.logger.log(f"Архив запуска: {self.archive.path}", "Info", "CorrelationTab")
+        except Exception as e:
+            self.logger.log(f"Ошибка открытия архива: {str(e)}", "Error", "open_archive")
+            self.archive = None
+            self.archive_path = None
+            self.archive_resume = False
+            self.archive_button.setText("Архив запуска")
+
+    def close_archive(self):
+        """Сохраняет последнюю контрольную точку и закрывает архив"""
+        if self.archive is not None:
+            try:
+                self.archive.close(self.correlator)
+            except Exception as e:
+                self.logger.log(f"Ошибка сохранения архива: {str(e)}", "Error", "close_archive")
+        self.archive = None
+        self.archive_path = None
+        self.archive_resume = False
+        self.archive_button.setText("Архив запуска")
+
+    def calibrate_button_clicked(self):
+        """Строит таблицу TDC живого источника по записи некоррелированного света"""
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Калибровка TDC по записи",
+            "",
+            "Raw Capture Files (*.snvidx);;All Files (*)"
+        )
+        if not filename:
+            return
+
+        try:
+            calibration = calibrate_recording(filename, DEFAULT_SOURCE)
+            path = calibration.save()
+            dnl = np.abs(calibration.dnl()).max(axis=1)
+            self.logger.log(f"Калибровка TDC сохранена в {path}: событий {calibration.events}, "
+                            f"max |DNL| {dnl[0]:.2f} / {dnl[1]:.2f} LSB; применяется со следующего старта",
+                            "Info", "calibrate_button_clicked")
+        except Exception as e:
+            self.logger.log(f"Ошибка калибровки: {str(e)}", "Error", "calibrate_button_clicked")
+
+    def record_button_clicked(self):
+        """Включает/выключает запись сырого потока живой шины"""
+        bus = get_bus(self.logger)
+        if bus.recorder:
+            bus.stop_recording()
+            self.record_button.setText("Записать поток")
+            return
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self,
+            "Записать поток",
+            "",
+            "Raw Capture Files (*.snvidx);;All Files (*)"
+        )
+        if not filename:
+            return
+
+        try:
+            bus.start_recording(filename)
+            self.record_button.setText("Остановить запись")
+        except Exception as e:
+            self.logger.log(f"Ошибка записи: {str(e)}", "Error", "record_button_clicked")
+
+    def replay_button_clicked(self):
+        """Повторяет обработку записанного потока вместо живого захвата"""
+        if self.acquiring:
+            self.control_button_clicked()
+
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Воспроизвести запись",
+            "",
+            "Raw Capture Files (*.snvidx);;All Files (*)"
+        )
+        if not filename:
+            return
+
+        speed = {"x1": 1, "x10": 10, "x100": 100, "макс": 0}[self.replay_speed.currentText()]
+        try:
+            self.bus = open_replay(self.logger, filename, speed)
+        except Exception as e:
+            self.logger.log(f"Ошибка открытия записи: {str(e)}", "Error", "replay_button_clicked")
+            return
+        self.control_button_clicked()
+
+    def analyze_button_clicked(self):
+        """Пересчитывает g2 по всей записи, используя все ядра"""
+        if self.offline_worker is not None and self.offline_worker.isRunning():
+            return
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Анализ записи",
+            "",
+            "Raw Capture Files (*.snvidx);;All Files (*)"
+        )
+        if not filename:
+            return
+        if self.acquiring:
+            self.control_button_clicked()
+
+        self.analyze_button.setEnabled(False)
+        self.offline_worker = OfflineWorker(self.logger, filename)
+        self.offline_worker.progress.connect(self.analysis_progress)
+        self.offline_worker.finished_analysis.connect(self.analysis_finished)
+        self.offline_worker.start()
+
+    def analysis_progress(self, done, total, events_per_s):
+        self.sequence_label.setText(f"Анализ записи: {done}/{total} пакетов "
+                                    f"({100 * done / max(total, 1):.0f}%) | {events_per_s / 1e6:.2f} млн событий/с")
+
+    def analysis_finished(self, correlator):
+        self.analyze_button.setEnabled(True)
+        if correlator is None:
+            return
+        self.correlator = correlator
+        self.refresh_view()
+        self.logger.log(f"Анализ записи завершён: {correlator.packets} пакетов", "Info", "CorrelationTab")
+
     def save_histogram(self):
         """Сохраняет гистограмму в файл"""
         if self.hist_data is None or len(self.hist_data) == 0:
@@ -363,13 +839,29 @@ class CorrelationTab(QWidget):
             self,
             "Загрузить гистограмму",
             "",
-            "CSV Files (*.csv);;NPZ Files (*.npz);;Text Files (*.txt);;All Files (*)"
+            "Run Archive Files (*.snvrun);;CSV Files (*.csv);;NPZ Files (*.npz);;Text Files (*.txt);;All Files (*)"
         )
 
         if not filename:
             return
 
         try:
+            if filename.endswith('.snvrun'):
+                # Архив отображается в память, накопление продолжается по кнопке "Старт"
+                if self.acquiring:
+                    self.control_button_clicked()
+                archive = load_archive(filename)
+                self.correlator = restore_correlator(archive)
+                self.resume_correlator = self.correlator
+                self.archive_path = filename
+                self.archive_resume = True
+                self.archive_button.setText("Закрыть архив")
+                self.refresh_view()
+                self.logger.log(f"Архив загружен из {filename}: {len(archive['meta']['checkpoints'])} контрольных точек, "
+                                f"{self.correlator.packets} пакетов", "Info", "load_histogram")
+                return
+            self.resume_correlator = None
+
             if filename.endswith('.npz'):
                 # Загрузка из бинарного формата NumPy
                 data = np.load(filename)
@@ -408,14 +900,8 @@ class CorrelationTab(QWidget):
                 self.bin_width_ns = times[1] - times[0]
 
             # Обновляем график
-            self.plot_widget.clear()
-            self.plot_widget.plot(
-                self.bins,
-                self.hist_data,
-                stepMode=True,
-                fillLevel=0,
-                pen='r'
-            )
+            self.plot_widget.setLabel("left", "Счёты", size="13pt")
+            self.draw_histogram(self.bins, self.hist_data)
 
             self.logger.log(f"Гистограмма загружена из {filename}", "Info", "load_histogram")
 
@@ -423,5 +909,7 @@ class CorrelationTab(QWidget):
             self.logger.log(f"Ошибка при загрузке: {str(e)}", "Error", "load_histogram")
 
     def closeEvent(self, event):
-        self.sniff_thread.terminate()
+        self.bus.unsubscribe(self.subscriber)
+        self.counter_view.stop()
+        self.hist_worker.stop()
         super().closeEvent(event)
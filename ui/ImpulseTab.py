@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QLineEdit, \
@@ -11,11 +12,49 @@ from hardware.spincore import impulse_builder
 from ui.CorrelationTab import MplCanvas
 
 
+# Номера импульсов подписываются, когда в видимом диапазоне канала их не больше LABEL_LIMIT
+LABEL_LIMIT = 50
+
+
+def pulse_steps(starts: np.ndarray, stops: np.ndarray):
+    """
+    Ступенчатая линия импульсов канала
+
+    Returns:
+        tuple: (x, y) - по 4 точки на импульс в порядке стартов
+    """
+    order = np.argsort(starts, kind='stable')
+    x = np.column_stack((starts[order], starts[order], stops[order], stops[order])).ravel()
+    y = np.tile([0, 1, 1, 0], len(order))
+    return x, y
+
+
 class PulseCanvas(FigureCanvasQTAgg):
+    """
+    Временная диаграмма импульсов: одна линия на канал
+
+    Оси и раскладка пересоздаются только при изменении набора каналов. Линии и подписи
+    импульсов рисуются поверх фона осей, сохраняемого при каждой полной отрисовке. При правке
+    импульсов фон изменившихся каналов восстанавливается и на нём рисуются только их линии
+    и подписи (общая шкала времени при этом не должна меняться, иначе перерисовывается всё).
+    """
+
     def __init__(self, parent=None, width=10, height=4, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
         super().__init__(self.fig)
-        self.axes = self.fig.add_subplot(111)
+        self.axes = [self.fig.add_subplot(111)]
+        self.channels = []
+        self.channel_axes = {}
+        self.lines = {}
+        self.labels = {}
+        # Канал -> (старты, стопы) в порядке строк таблицы
+        self.pulses = {}
+        self.max_time = None
+        # Обработчики изменения пределов осей: (ось, номер обработчика)
+        self._xlim_callbacks = []
+        # Канал -> фон его осей без линии и подписей с последней полной отрисовки
+        self._backgrounds = {}
+        self.mpl_connect('draw_event', self._on_draw)
 
     def plot_pulses(self, data):
         """Отрисовка импульсов по данным с соединением разрывов"""
@@ -24,68 +63,114 @@ class PulseCanvas(FigureCanvasQTAgg):
 
         num_channels, channels, counts, starts, stops = data
 
-        # Очищаем предыдущий график
-        self.fig.clear()
-
-        # Если нет данных - выходим
+        # Если нет данных - очищаем график
         if num_channels == 0:
-            self.draw()
+            self._clear_figure()
+            self.max_time = None
+            self.draw_idle()
             return
 
-        # Создаем subplot для каждого канала
-        self.axes = self.fig.subplots(num_channels, 1, sharex=True)
-
-        # Если только один канал, преобразуем в массив для единообразия
-        if num_channels == 1:
-            self.axes = [self.axes]
-
-        # Определяем общие пределы по времени
-        all_times = starts + stops
-        max_time = max(all_times) if all_times else 100
-        time_margin = max_time * 0.1  # 10% отмашка
-
-        current_idx = 0
-        for i, channel in enumerate(channels):
-            ax = self.axes[i]
-            ax.clear()
+        bounds = np.cumsum(counts)[:-1]
+        pulses = dict(zip(channels, zip(np.split(np.asarray(starts, dtype=np.float64), bounds),
+                                        np.split(np.asarray(stops, dtype=np.float64), bounds))))
+        rebuilt = list(channels) != self.channels
+        if rebuilt:
+            self.pulses = pulses
+            self._build_layout(channels)
+            changed = list(channels)
+        else:
+            changed = [channel for channel in channels
+                       if not all(np.array_equal(new, old) for new, old in zip(pulses[channel], self.pulses[channel]))]
+            self.pulses = pulses
+        for channel in changed:
+            self.lines[channel].set_data(*pulse_steps(*pulses[channel]))
+
+        # Общие пределы по времени с 10% отмашкой
+        max_time = max(max(starts), max(stops)) if starts else 100
+        if rebuilt or max_time != self.max_time or not self.isVisible():
+            self.max_time = max_time
+            time_margin = max_time * 0.1
+            # Подписи всех каналов обновляются обработчиком изменения пределов
+            self.axes[-1].set_xlim(-time_margin, max_time + time_margin)
+            self._full_redraw()
+            return
 
-            # Настройки графика
+        for channel in changed:
+            self._update_labels(channel)
+        if any(channel not in self._backgrounds for channel in changed):
+            # Полной отрисовки с текущей раскладкой ещё не было
+            self._full_redraw()
+            return
+        for channel in changed:
+            ax = self.channel_axes[channel]
+            self.restore_region(self._backgrounds[channel])
+            for artist in self._channel_artists(channel):
+                ax.draw_artist(artist)
+            self.blit(ax.bbox)
+
+    def _full_redraw(self):
+        # Сохранённые фоны устаревают до следующей полной отрисовки
+        self._backgrounds = {}
+        self.draw_idle()
+
+    def _channel_artists(self, channel):
+        return [self.lines[channel], *self.labels[channel]]
+
+    def _on_draw(self, event):
+        # Линии и подписи исключены из обычной отрисовки (animated): фон осей сохраняется без них,
+        # затем они рисуются поверх, в том числе при сохранении рисунка в файл
+        if event.canvas is self:
+            self._backgrounds = {channel: self.copy_from_bbox(ax.bbox) for channel, ax in self.channel_axes.items()}
+        for channel in self.channels:
+            for artist in self._channel_artists(channel):
+                artist.draw(event.renderer)
+
+    def _clear_figure(self):
+        # Обработчики отключаются до очистки: она меняет пределы удаляемых осей
+        for ax, callback in self._xlim_callbacks:
+            ax.callbacks.disconnect(callback)
+        self._xlim_callbacks = []
+        self.fig.clear()
+        self.axes = []
+        self.channels = []
+        self.channel_axes = {}
+        self.lines = {}
+        self.labels = {}
+        self._backgrounds = {}
+
+    def _build_layout(self, channels):
+        self._clear_figure()
+        self.axes = list(self.fig.subplots(len(channels), 1, sharex=True, squeeze=False)[:, 0])
+        self.channels = list(channels)
+        self.channel_axes = dict(zip(channels, self.axes))
+        for channel, ax in self.channel_axes.items():
             ax.set_title(f'Канал {channel}')
             ax.set_ylim(-0.01, 1.2)
             ax.set_yticks([])
             ax.grid(True, linestyle='--', alpha=0.5)
-
-            # Собираем все точки для соединения
-            all_points = []
-            for j in range(counts[i]):
-                start = starts[current_idx + j]
-                stop = stops[current_idx + j]
-                all_points.extend([(start, 0), (start, 1), (stop, 1), (stop, 0)])
-
-            # Сортируем точки по времени
-            all_points.sort(key=lambda x: x[0])
-
-            # Рисуем соединенные линии
-            if all_points:
-                x_vals, y_vals = zip(*all_points)
-                ax.plot(x_vals, y_vals, 'b-', linewidth=2)
-
-                # Подписываем импульсы
-                for j in range(counts[i]):
-                    start = starts[current_idx + j]
-                    stop = stops[current_idx + j]
-                    ax.text((start + stop)/2, 1.1, f'{j+1}',
-                           ha='center', va='center', fontsize=8)
-
-            current_idx += counts[i]
-
-            # Настройки для последнего subplot
-            if i == num_channels - 1:
-                ax.set_xlim(-time_margin, max_time + time_margin)
-                ax.set_xlabel('Время')
-
+            self.lines[channel], = ax.plot([], [], 'b-', linewidth=2, animated=True)
+            self.labels[channel] = []
+        # При изменении масштаба (в том числе панелью инструментов) подписи пересчитываются
+        self._xlim_callbacks = [(ax, ax.callbacks.connect('xlim_changed', self._xlim_changed)) for ax in self.axes]
+        self.axes[-1].set_xlabel('Время')
         self.fig.tight_layout()
-        self.draw()
+
+    def _xlim_changed(self, ax):
+        for channel in self.channels:
+            self._update_labels(channel)
+
+    def _update_labels(self, channel):
+        """Подписывает видимые импульсы канала, если их не больше LABEL_LIMIT"""
+        for text in self.labels[channel]:
+            text.remove()
+        ax = self.channel_axes[channel]
+        starts, stops = self.pulses[channel]
+        left, right = ax.get_xlim()
+        visible = np.flatnonzero((stops >= left) & (starts <= right))
+        if len(visible) > LABEL_LIMIT:
+            visible = visible[:0]
+        self.labels[channel] = [ax.text((starts[j] + stops[j]) / 2, 1.1, f'{j + 1}', ha='center', va='center',
+                                        fontsize=8, animated=True) for j in visible]
 
 class ImpulseTab(QWidget):
     def __init__(self, logger):
@@ -100,7 +185,11 @@ class ImpulseTab(QWidget):
         self.rep_scale = 0
 
         layout = QHBoxLayout()
-        layout.addWidget(self.canvas)
+        # Панель масштабирования: номера импульсов подписываются при увеличении
+        plot_layout = QVBoxLayout()
+        plot_layout.addWidget(NavigationToolbar2QT(self.canvas, self))
+        plot_layout.addWidget(self.canvas)
+        layout.addLayout(plot_layout)
         input_layout = QVBoxLayout()
         self.table = QTableWidget()
         self.table.setColumnCount(3)
@@ -1,166 +1,18 @@
-import struct
-
 import numpy as np
-from PyQt6.QtCore import pyqtSignal, QThread, QMutex
+import pyqtgraph as pg
+from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QIntValidator, QDoubleValidator
 from PyQt6.QtWidgets import QVBoxLayout, QWidget, QProgressBar, QHBoxLayout, QPushButton, QGridLayout, QLabel, \
     QLineEdit, QFileDialog, QMessageBox, QSpinBox, QCheckBox
-from matplotlib.backends.backend_qt import NavigationToolbar2QT
 from numpy import arange
 from pyvisa import ResourceManager
-import pcapy
+from acquisition.bus import Subscriber, get_bus, open_replay
+from analysis.odmr import SweepAccumulator
 from hardware.rigol_rw import setup
 from hardware.spincore import impulse_builder
-from ui.CorrelationTab import MplCanvas
-
-
-class SniffThread(QThread):
-    packet_signal = pyqtSignal(dict)
-
-    def __init__(self, logger):
-        super().__init__()
-        self.logger = logger
-        self.running = True
-        self.cap = None
-    def run(self):
-        try:
-            '''self.cap = pcapy.open_live("Device\\NPF_Loopback", 96, 0, 0) #106
-            self.cap.setfilter("udp and src host localhost")
-            self.logger.log("Sniffer started on 'Ethernet'", "Info", "SniffThread")
-            self.cap.loop(-1, self.packet_callback)  # 0 = бесконечно'''
-            interfaces = pcapy.findalldevs()
-
-            if not interfaces:
-                print("Не найдены интерфейсы!")
-                return
-
-            # В Windows loopback интерфейс часто называется "Adapter for loopback traffic capture"
-            # или содержит "loopback". Если не нашли, используем первый интерфейс.
-            selected_iface = None
-            for iface in interfaces:
-                if 'loopback' in iface.lower() or '127.0.0.1' in iface:
-                    selected_iface = iface
-                    break
-
-            if not selected_iface:
-                selected_iface = interfaces[0]
-                print(f"Loopback интерфейс не найден, используем: {selected_iface}")
-            else:
-                print(f"Используем интерфейс: {selected_iface}")
-                self.cap = pcapy.open_live(selected_iface, 65536, True, 1000)
-                self.cap.setfilter("udp")
-                self.cap.loop(0,self.packet_callback)
-        except Exception as e:
-            self.logger.log(f"Sniffer error: {e}", "Error", "SniffThread")
-
-    def packet_callback(self, header, packet):
-        """Обработка каждого пакета"""
-        self.logger.log(f"Enter", "Error", "PacketCallback")
-        if not self.running:
-            return
-
-        try:
-            # Берем полезную нагрузку после 42 байт заголовков Ethernet/IP/UDP
-            print("got packet")
-
-            payload = packet[32:] #42
-            if len(payload) != 64:
-                self.logger.log(f"Wrong packet len", "Error", "PacketCallback")
-
-            # Разбор байт пакета
-            package_id = struct.unpack('<H', payload[1:3])[0]
-            byte6 = struct.unpack('<B', payload[5:6])[0]
-
-            flag_valid = byte6 & 0x1
-            flag_pos = (byte6 & 0x10) >> 4
-            flag_neg = (byte6 & 0x8) >> 3
-
-            count_pos = int.from_bytes(payload[58:61], byteorder="little")
-            count_neg = int.from_bytes(payload[61:63], byteorder="little")
-
-            result = {
-                "package_id": package_id,
-                "flag_valid": flag_valid,
-                "flag_neg": flag_neg,
-                "flag_pos": flag_pos,
-                "count_neg": count_neg,
-                "count_pos": count_pos
-            }
-
-            # Отправляем только валидные пакеты
-            if flag_valid == 1 and (flag_pos == 1 or flag_neg == 1):
-                self.packet_signal.emit(result)
-
-        except Exception as e:
-            self.logger.log(f"Packet processing error: {e}", "Error", "SniffThread")
-
-    def stop(self):
-        """Остановка захвата"""
-        self.running = False
-        try:
-            if self.cap:
-                # Прерываем cap.loop()
-                self.cap.breakloop()
-                self.logger.log("Sniffer stopped", "Info", "SniffThread")
-        except Exception as e:
-            self.logger.log(f"Error stopping sniffer: {e}", "Error", "SniffThread")
-        self.quit()
-
-
-class DataProcessingThread(QThread):
-    data_updated = pyqtSignal(np.ndarray)
-
-    def __init__(self, num_points, logger):
-        super().__init__()
-        self.num_points = num_points
-        self.logger = logger
-        self.data = []
-        self.running = True
-        self.reset_data()
-
-    def reset_data(self):
-        self.data = np.zeros(self.num_points)
-
-    def add_data_point(self, index, count_pos):
-        try:
-            if index < self.num_points:
-                self.data[index] += count_pos
-                self.data_updated.emit(self.data)
-
-        except Exception as e:
-            self.logger.log(f"Data processing error: {str(e)}", "Error", "DataProcessingThread")
-
-    def stop(self):
-        self.running = False
-        self.quit()
-
-class PlotUpdater(QThread):
-    def __init__(self, canvas, plot_line, frequencies):
-        super(PlotUpdater, self).__init__()
-        self.canvas = canvas
-        self.plot_line = plot_line
-        self.frequencies = frequencies
-        self.ratio = None
-        self.increment_sweep = 0
-        self.needs_update = False
-    
-    def update_data(self, ratio, increment_sweep):
-        self.ratio = ratio
-        self.increment_sweep = increment_sweep
-        self.needs_update = True
-    
-    def run(self):
-        while 1:
-            if self.ratio is not None and self.needs_update:
-                x_data = self.frequencies / 1e6
-                y_data = self.ratio / (self.increment_sweep + 1)
-                self.plot_line.set_data(x_data, y_data)
-                self.canvas.axes.set_title(f"Итерация: {self.increment_sweep + 1}")
-                self.canvas.axes.relim()
-                self.canvas.axes.autoscale_view()
-                self.canvas.draw()
-            self.msleep(30)
 
+# Период таймера отрисовки ODMR, мс; кадр рисуется только при изменении данных
+RENDER_INTERVAL_MS = 100
 
 
 class ODMRTab(QWidget):
@@ -169,12 +21,15 @@ class ODMRTab(QWidget):
         self.logger = logger
         self.frequencies = np.array([])
         self.measurement_running = False
-        self.sniff_thread = None
-        self.data_thread = None
-        self.current_point = 0
+        self.bus = get_bus(self.logger, "loopback")
+        self.subscriber = Subscriber("ODMRTab")
+        self.subscriber.batch_ready.connect(self.batches_received)
+        # Накопление развёртки текущего измерения; отсчёты добавляются в потоке GUI одним
+        # векторным вызовом на блок, отрисовка - по таймеру
+        self.sweep = None
         self.num_points = 0
         self.impulse_config = None
-        self.increment_sweep = 0
+        self.dev = None
 
         self.init_ui()
 
@@ -193,8 +48,12 @@ class ODMRTab(QWidget):
         self.load_impulse_button = QPushButton('Загрузить конфигурацию импульсов')
         self.load_impulse_button.clicked.connect(self.load_impulse_config)
 
+        self.replay_button = QPushButton('Воспроизвести запись')
+        self.replay_button.clicked.connect(self.start_replay)
+
         control_layout.addWidget(self.measurement_button)
         control_layout.addWidget(self.load_impulse_button)
+        control_layout.addWidget(self.replay_button)
 
         # Frequency parameters
         params_layout = QGridLayout()
@@ -226,26 +85,30 @@ class ODMRTab(QWidget):
         params_layout.addWidget(self.output_power_edit, 2, 1)
         params_layout.addWidget(self.frequency_stop_edit, 3, 1)
 
-        # Plot
-        self.canvas = MplCanvas(self, width=5, height=4, dpi=90)
-        self.toolbar = NavigationToolbar2QT(self.canvas, self)
+        # Plot: до 65535 точек развёртки прореживаются до разрешения экрана по min/max в пикселе
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setLabel("bottom", "Частота (MHz)")
+        self.plot_widget.setLabel("left", "Сигнал")
+        self.plot_widget.showGrid(x=True, y=True)
+        self.plot_line = self.plot_widget.plot(pen="b")
+        self.plot_line.setDownsampling(auto=True, method="peak")
+        self.plot_line.setClipToView(True)
 
         # Assemble main layout
-        main_layout.addWidget(self.toolbar)
-        main_layout.addWidget(self.canvas)
+        main_layout.addWidget(self.plot_widget)
         main_layout.addWidget(self.progress_bar)
+        self.sequence_label = QLabel()
+        main_layout.addWidget(self.sequence_label)
         main_layout.addLayout(control_layout)
         main_layout.addLayout(params_layout)
 
         self.setLayout(main_layout)
 
-        # Initialize plot
-        self.canvas.axes.set_xlabel('Частота (MHz)')
-        self.canvas.axes.set_ylabel('Количество фотонов')
-        self.plot_line, = self.canvas.axes.plot([], [], 'b-')
-        self.canvas.draw()
-
-        self.plot_thread = None
+        # Отрисовка в потоке GUI по таймеру
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(RENDER_INTERVAL_MS)
+        self.render_timer.timeout.connect(self.update_plot)
+        self.rendered_updates = None
         RES = "USB0::0x1AB1::0x099C::DSG3G264300050::INSTR"
         #self.rm = ResourceManager()
 
@@ -420,9 +283,7 @@ class ODMRTab(QWidget):
         RES = "USB0::0x1AB1::0x099C::DSG3G264300050::INSTR"
         self.dev = self.rm.open_resource(RES)
         
-        self.sniff_thread = SniffThread(self.logger)
-        self.sniff_thread.packet_signal.connect(self.process_packet)
-        self.sniff_thread.start()
+        self.bus.subscribe(self.subscriber)
 
         reply = QMessageBox.question(
             self, ' ', "Переведите тумблер на SpinCore ↑.\nПосле этого нажмите OK",
@@ -454,80 +315,109 @@ class ODMRTab(QWidget):
             self.logger.log(f"Error starting impulse sequence: {str(e)}", "Error", "ODMRTab")
             return False
 
-        # Start data processing thread
-        self.data_thread = DataProcessingThread(
-            self.num_points,
-            self.logger
+        self.begin_acquisition()
+
+    def start_replay(self):
+        """Повторная обработка записанного потока без управления приборами"""
+        if self.measurement_running or not self.generate_frequencies():
+            return
+
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Воспроизвести запись",
+            "",
+            "Raw Capture Files (*.snvidx);;All Files (*)"
         )
-        self.data_thread.data_updated.connect(self.update_plot)
-        self.data_thread.start()
+        if not filename:
+            return
+
+        try:
+            self.bus = open_replay(self.logger, filename, speed=0)
+        except Exception as e:
+            self.logger.log(f"Ошибка открытия записи: {str(e)}", "Error", "start_replay")
+            return
+
+        self.dev = None
+        self.begin_acquisition()
+        self.bus.subscribe(self.subscriber)
+
+    def begin_acquisition(self):
+        self.sweep = SweepAccumulator(self.num_points)
 
         self.measurement_running = True
-        self.current_point = 0
 
         self.measurement_button.setText("Стоп")
         self.progress_bar.setValue(0)
         self.progress_bar.setFormat(f"0% | 0/{self.num_points}")
 
         # Clear plot
-        self.canvas.axes.clear()
-        self.plot_line, = self.canvas.axes.plot([], [], 'b-')
-        self.canvas.axes.set_xlabel('Частота (MHz)')
-        self.canvas.axes.set_ylabel('Сигнал')
+        self.plot_line.clear()
+        self.plot_widget.setTitle("")
+        self.rendered_updates = None
+        self.render_timer.start()
+
 
-        
     def stop_measurement(self):
         self.measurement_running = False
         self.measurement_button.setText("Старт")
 
-        if self.sniff_thread:
-            self.sniff_thread.stop()
-            self.sniff_thread.wait()
-            self.sniff_thread = None
+        self.bus.unsubscribe(self.subscriber)
+        self.subscriber.take()
+        self.bus = get_bus(self.logger, "loopback")
+
+        self.render_timer.stop()
+        if self.sweep is not None:
+            # Последний кадр с данными, пришедшими после предыдущего срабатывания таймера
+            self.update_plot()
+            self.sweep = None
 
-        if self.data_thread:
-            self.data_thread.stop()
-            self.data_thread.wait()
-            self.data_thread = None
+    def batches_received(self):
+        # Блоки разбираются целиком, без промежуточного кольца, которое обрезало бы большие блоки
+        for batch in self.subscriber.take():
+            self.process_packets(batch)
+        self.sequence_label.setText(self.bus.status_text())
 
-    def process_packet(self, packet):
+    def process_packets(self, window):
         if not self.measurement_running:
             return
 
-        if packet['flag_pos'] == 1:
+        lost = int(window['lost_before'].sum())
+        if lost:
+            self.logger.log(f"Потеряно пакетов: {lost}, индекс точки развёртки может быть смещён",
+                            "Warning", "ODMRTab")
 
-            if self.current_point == 0 or self.current_point+1 == self.num_points:
-                print(self.increment_sweep,self.dev.query(":FREQ?"))
-            
-            count_pos = packet['count_pos']
-            self.data_thread.add_data_point(self.current_point, count_pos)
+        # Точки развёртки отмечаются пакетами с флагом flag_pos
+        counts = window['count_pos'][window['flag_pos'] == 1]
+        if not len(counts):
+            return
+        sweep = self.sweep
+        increment_sweep = sweep.increment_sweep
+        try:
+            points = sweep.add(counts)
+        except Exception as e:
+            self.logger.log(f"Data processing error: {str(e)}", "Error", "ODMRTab")
+            return
 
+        if self.dev is not None and np.any((points == 0) | (points + 1 == self.num_points)):
+            print(increment_sweep, self.dev.query(":FREQ?"))
+
+        #self.progress_bar.setValue(sweep.current_point)
+        """self.progress_bar.setFormat(
+            f"{int(100 * sweep.current_point / self.num_points)}% | "
+            f"{sweep.current_point}/{self.num_points} |"
+            f"Проход: {sweep.increment_sweep + 1}"
+        )"""
            
-            #self.progress_bar.setValue(self.current_point)
-            """self.progress_bar.setFormat(
-                f"{int(100 * self.current_point / self.num_points)}% | "
-                f"{self.current_point}/{self.num_points} |"
-                f"Проход: {self.increment_sweep + 1}"
-            )"""
-
-            #print((time.process_time_ns()-t)*1E-6, self.current_point)
-
-            if self.current_point == self.num_points:
-                self.increment_sweep += 1
-                self.current_point = 0
-            else:
-                self.current_point += 1
-           
-    def update_plot(self, ratio):
-        if self.plot_thread is None:
-            self.plot_thread = PlotUpdater(
-            self.canvas,
-            self.plot_line,
-            self.frequencies
-        )
-            self.plot_thread.start()
-        else:
-            self.plot_thread.update_data(ratio, self.increment_sweep)
+    def update_plot(self):
+        """Кадр таймера отрисовки: график обновляется, только если данные изменились"""
+        sweep = self.sweep
+        if sweep is None:
+            return
+        if sweep.updates == self.rendered_updates:
+            return
+        self.rendered_updates = sweep.updates
+        self.plot_line.setData(self.frequencies / 1e6, sweep.data / (sweep.increment_sweep + 1))
+        self.plot_widget.setTitle(f"Итерация: {sweep.increment_sweep + 1}")
 
 
     def closeEvent(self, event):
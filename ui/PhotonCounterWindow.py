@@ -1,37 +1,45 @@
-from collections import deque
-
+import numpy as np
 from PyQt6.QtWidgets import QWidget, QVBoxLayout
 
-from ui.CorrelationTab import MplCanvas, SniffThread, CounterWorker
+from acquisition.bus import Subscriber, get_bus
+from hardware.counter_packet import select
+from ui.CorrelationTab import CounterView
 
 
 class PhotonCounterWindow(QWidget):
     def __init__(self, logger):
         super().__init__()
-        self.plot_thread = None
         self.init = False
         self.logger = logger
-        self.photon_data = deque(maxlen=10000)
         layout = QVBoxLayout()
 
-        self.canvas = MplCanvas(self, width=5, height=4, dpi=90)
-        layout.addWidget(self.canvas)
+        self.counter_view = CounterView()
+        layout.addWidget(self.counter_view)
 
         self.setLayout(layout)
 
-        self.sniff_thread = SniffThread(self.logger)
-        self.sniff_thread.packet_signal.connect(self.packet_received)
-        self.sniff_thread.start()
-
-    def packet_received(self, packet):
-        if not self.init and packet['flag']:
-            self.plot_thread = CounterWorker(self.canvas, self.photon_data)
-            self.plot_thread.start()
+        self.bus = get_bus(self.logger)
+        self.subscriber = Subscriber("PhotonCounterWindow")
+        self.subscriber.batch_ready.connect(self.batches_received)
+        self.bus.subscribe(self.subscriber)
+
+    def batches_received(self):
+        batch = self.subscriber.take_batch()
+        if batch is not None:
+            self.packets_received(batch)
+
+    def packets_received(self, batch):
+        start = 0
+        if not self.init:
+            flagged = np.flatnonzero(batch['flag'])
+            if not len(flagged):
+                return
+            start = flagged[0]
+            self.counter_view.start()
             self.init = True
-        if self.init:
-            self.photon_data.append(packet)
+        self.counter_view.add(select(batch, slice(start, None)))
 
     def closeEvent(self, event):
-        self.sniff_thread.terminate()
+        self.bus.unsubscribe(self.subscriber)
+        self.counter_view.stop()
         super().closeEvent(event)
-